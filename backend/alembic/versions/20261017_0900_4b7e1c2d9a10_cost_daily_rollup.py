@@ -0,0 +1,47 @@
+"""cost daily rollup
+
+Revision ID: 4b7e1c2d9a10
+Revises: c15c13621eed
+Create Date: 2026-10-17 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e1c2d9a10'
+down_revision: Union[str, None] = 'c15c13621eed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('cost_daily_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service', sa.String(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'date', 'service', name='uq_cost_daily_rollup_team_date_service')
+    )
+    op.create_index(op.f('ix_cost_daily_rollup_id'), 'cost_daily_rollup', ['id'], unique=False)
+
+    # Backfill from existing raw rows
+    op.execute(
+        "INSERT INTO cost_daily_rollup (date, team_id, service, amount, record_count) "
+        "SELECT date(date), team_id, service, SUM(amount), COUNT(id) FROM cost_records "
+        "WHERE team_id IS NOT NULL AND service IS NOT NULL "
+        "GROUP BY date(date), team_id, service"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cost_daily_rollup_id'), table_name='cost_daily_rollup')
+    op.drop_table('cost_daily_rollup')
@@ -0,0 +1,40 @@
+"""cost records natural key
+
+Revision ID: 9d3f5a6b7c21
+Revises: 4b7e1c2d9a10
+Create Date: 2026-10-17 09:15:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3f5a6b7c21'
+down_revision: Union[str, None] = '4b7e1c2d9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Reruns of the old ingest duplicated rows; keep the latest copy of each
+    # (day, team_id, service), whatever time of day it was stamped with, and
+    # rebuild the rollup from what remains.
+    op.execute(
+        "DELETE FROM cost_records WHERE id NOT IN ("
+        "SELECT MAX(id) FROM cost_records GROUP BY date(date), team_id, service)"
+    )
+    op.execute("DELETE FROM cost_daily_rollup")
+    op.execute(
+        "INSERT INTO cost_daily_rollup (date, team_id, service, amount, record_count) "
+        "SELECT date(date), team_id, service, SUM(amount), COUNT(id) FROM cost_records "
+        "WHERE team_id IS NOT NULL AND service IS NOT NULL "
+        "GROUP BY date(date), team_id, service"
+    )
+    op.create_index('uq_cost_records_date_team_service', 'cost_records', ['date', 'team_id', 'service'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_cost_records_date_team_service', table_name='cost_records')
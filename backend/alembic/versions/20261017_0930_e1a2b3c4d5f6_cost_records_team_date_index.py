@@ -0,0 +1,26 @@
+"""cost records team date index
+
+Revision ID: e1a2b3c4d5f6
+Revises: 9d3f5a6b7c21
+Create Date: 2026-10-17 09:30:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a2b3c4d5f6'
+down_revision: Union[str, None] = '9d3f5a6b7c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_cost_records_team_date', 'cost_records', ['team_id', 'date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cost_records_team_date', table_name='cost_records')
@@ -0,0 +1,28 @@
+"""user token version
+
+Revision ID: 7c8d9e0f1a2b
+Revises: e1a2b3c4d5f6
+Create Date: 2026-10-17 09:45:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c8d9e0f1a2b'
+down_revision: Union[str, None] = 'e1a2b3c4d5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
@@ -0,0 +1,43 @@
+"""cost records archive
+
+Revision ID: 5a6b7c8d9e0f
+Revises: 3f4a5b6c7d8e
+Create Date: 2026-10-17 10:15:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a6b7c8d9e0f'
+down_revision: Union[str, None] = '3f4a5b6c7d8e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('cost_records_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(), nullable=False),
+    sa.Column('period_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('period_end', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service', sa.String(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'period_start', 'service', 'granularity', name='uq_cost_records_archive_team_period_service')
+    )
+    op.create_index('ix_cost_records_archive_team_period', 'cost_records_archive', ['team_id', 'period_start', 'id'], unique=False)
+    op.create_index(op.f('ix_cost_records_archive_id'), 'cost_records_archive', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cost_records_archive_id'), table_name='cost_records_archive')
+    op.drop_index('ix_cost_records_archive_team_period', table_name='cost_records_archive')
+    op.drop_table('cost_records_archive')
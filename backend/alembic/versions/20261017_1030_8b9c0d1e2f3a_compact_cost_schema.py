@@ -0,0 +1,216 @@
+"""compact cost schema
+
+Revision ID: 8b9c0d1e2f3a
+Revises: 5a6b7c8d9e0f
+Create Date: 2026-10-17 10:30:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b9c0d1e2f3a'
+down_revision: Union[str, None] = '5a6b7c8d9e0f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COST_TABLES = ['cost_records', 'cost_daily_rollup', 'cost_records_archive']
+
+
+def _to_date(column: str) -> str:
+    if op.get_bind().dialect.name == 'sqlite':
+        return f'date({column})'
+    return f'CAST({column} AS DATE)'
+
+
+def _create_compact_tables() -> None:
+    op.create_table('cost_records_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=True),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('cost_daily_rollup_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'date', 'service_id', name='uq_cost_daily_rollup_team_date_service')
+    )
+    op.create_table('cost_records_archive_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('period_end', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'period_start', 'service_id', name='uq_cost_records_archive_team_period_service')
+    )
+
+
+def _create_wide_tables() -> None:
+    op.create_table('cost_records_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('team_id', sa.Integer(), nullable=True),
+    sa.Column('service', sa.String(), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('cost_daily_rollup_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service', sa.String(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'date', 'service', name='uq_cost_daily_rollup_team_date_service')
+    )
+    op.create_table('cost_records_archive_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(), nullable=False),
+    sa.Column('period_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('period_end', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service', sa.String(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'period_start', 'service', 'granularity', name='uq_cost_records_archive_team_period_service')
+    )
+
+
+def _swap_tables() -> None:
+    # Old tables go away with their indexes. PostgreSQL keeps the "_new"
+    # names on the sequences and primary keys, so those are renamed and the
+    # sequences moved past the copied ids.
+    for table in COST_TABLES:
+        op.drop_table(table)
+        op.rename_table(f'{table}_new', table)
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in COST_TABLES:
+            op.execute(f"ALTER SEQUENCE {table}_new_id_seq RENAME TO {table}_id_seq")
+            op.execute(f"ALTER INDEX {table}_new_pkey RENAME TO {table}_pkey")
+            op.execute(f"SELECT setval('{table}_id_seq', COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)")
+
+
+def upgrade() -> None:
+    op.create_table('services',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_services_id'), 'services', ['id'], unique=False)
+    op.execute(
+        "INSERT INTO services (name) "
+        "SELECT service FROM cost_records WHERE service IS NOT NULL "
+        "UNION SELECT service FROM cost_daily_rollup "
+        "UNION SELECT service FROM cost_records_archive"
+    )
+    # The unique constraints have the same names as the ones on the old
+    # tables, which PostgreSQL would reject while both exist
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('uq_cost_daily_rollup_team_date_service', 'cost_daily_rollup', type_='unique')
+        op.drop_constraint('uq_cost_records_archive_team_period_service', 'cost_records_archive', type_='unique')
+    _create_compact_tables()
+
+    micros = 'CAST(ROUND({} * 1000000) AS BIGINT)'
+    # Rows without a date or service could never be returned by the API.
+    # Old rows carried a time of day, so several can fall on the same day;
+    # they are summed into one cell, as the daily rollup already counts them
+    op.execute(
+        "INSERT INTO cost_records_new (id, date, team_id, service_id, amount_micros, created_at) "
+        f"SELECT MAX(c.id), {_to_date('c.date')}, c.team_id, s.id, "
+        f"SUM({micros.format('COALESCE(c.amount, 0)')}), MIN(c.created_at) "
+        "FROM cost_records c JOIN services s ON s.name = c.service WHERE c.date IS NOT NULL "
+        f"GROUP BY {_to_date('c.date')}, c.team_id, s.id"
+    )
+    op.execute(
+        "INSERT INTO cost_daily_rollup_new (id, date, team_id, service_id, amount_micros, record_count, updated_at) "
+        f"SELECT r.id, r.date, r.team_id, s.id, {micros.format('r.amount')}, r.record_count, r.updated_at "
+        "FROM cost_daily_rollup r JOIN services s ON s.name = r.service"
+    )
+    # Archive rows only ever had one granularity per period in practice;
+    # summing keeps the new (team, period, service) key unique regardless
+    op.execute(
+        "INSERT INTO cost_records_archive_new "
+        "(granularity, period_start, period_end, team_id, service_id, amount_micros, record_count, created_at) "
+        f"SELECT MIN(a.granularity), {_to_date('a.period_start')}, MAX({_to_date('a.period_end')}), a.team_id, s.id, "
+        f"SUM({micros.format('a.amount')}), SUM(a.record_count), MIN(a.created_at) "
+        "FROM cost_records_archive a JOIN services s ON s.name = a.service "
+        f"GROUP BY {_to_date('a.period_start')}, a.team_id, s.id"
+    )
+    _swap_tables()
+
+    op.create_index(op.f('ix_cost_records_id'), 'cost_records', ['id'], unique=False)
+    op.create_index(op.f('ix_cost_records_date'), 'cost_records', ['date'], unique=False)
+    op.create_index('uq_cost_records_team_date_service', 'cost_records', ['team_id', 'date', 'service_id'], unique=True)
+    op.create_index(op.f('ix_cost_daily_rollup_id'), 'cost_daily_rollup', ['id'], unique=False)
+    op.create_index(op.f('ix_cost_records_archive_id'), 'cost_records_archive', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('uq_cost_daily_rollup_team_date_service', 'cost_daily_rollup', type_='unique')
+        op.drop_constraint('uq_cost_records_archive_team_period_service', 'cost_records_archive', type_='unique')
+    _create_wide_tables()
+
+    op.execute(
+        "INSERT INTO cost_records_new (id, date, team_id, service, amount, created_at) "
+        "SELECT c.id, c.date, c.team_id, s.name, c.amount_micros / 1000000.0, c.created_at "
+        "FROM cost_records c JOIN services s ON s.id = c.service_id"
+    )
+    op.execute(
+        "INSERT INTO cost_daily_rollup_new (id, date, team_id, service, amount, record_count, updated_at) "
+        "SELECT r.id, r.date, r.team_id, s.name, r.amount_micros / 1000000.0, r.record_count, r.updated_at "
+        "FROM cost_daily_rollup r JOIN services s ON s.id = r.service_id"
+    )
+    op.execute(
+        "INSERT INTO cost_records_archive_new "
+        "(id, granularity, period_start, period_end, team_id, service, amount, record_count, created_at) "
+        "SELECT a.id, a.granularity, a.period_start, a.period_end, a.team_id, s.name, "
+        "a.amount_micros / 1000000.0, a.record_count, a.created_at "
+        "FROM cost_records_archive a JOIN services s ON s.id = a.service_id"
+    )
+    _swap_tables()
+
+    op.create_index(op.f('ix_cost_records_id'), 'cost_records', ['id'], unique=False)
+    op.create_index(op.f('ix_cost_records_date'), 'cost_records', ['date'], unique=False)
+    op.create_index(op.f('ix_cost_records_service'), 'cost_records', ['service'], unique=False)
+    op.create_index('uq_cost_records_date_team_service', 'cost_records', ['date', 'team_id', 'service'], unique=True)
+    op.create_index('ix_cost_records_team_date', 'cost_records', ['team_id', 'date', 'id'], unique=False)
+    op.create_index(op.f('ix_cost_daily_rollup_id'), 'cost_daily_rollup', ['id'], unique=False)
+    op.create_index('ix_cost_records_archive_team_period', 'cost_records_archive', ['team_id', 'period_start', 'id'], unique=False)
+    op.create_index(op.f('ix_cost_records_archive_id'), 'cost_records_archive', ['id'], unique=False)
+
+    op.drop_index(op.f('ix_services_id'), table_name='services')
+    op.drop_table('services')
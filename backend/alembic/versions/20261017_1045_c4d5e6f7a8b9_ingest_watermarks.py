@@ -0,0 +1,43 @@
+"""ingest watermarks
+
+Revision ID: c4d5e6f7a8b9
+Revises: 8b9c0d1e2f3a
+Create Date: 2026-10-17 10:45:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d5e6f7a8b9'
+down_revision: Union[str, None] = '8b9c0d1e2f3a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ingest_watermarks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account', sa.String(), nullable=False),
+    sa.Column('watermark', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account')
+    )
+    op.create_index(op.f('ix_ingest_watermarks_id'), 'ingest_watermarks', ['id'], unique=False)
+    with op.batch_alter_table('data_changes') as batch_op:
+        batch_op.add_column(sa.Column('team_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('first_day', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('last_day', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('data_changes') as batch_op:
+        batch_op.drop_column('last_day')
+        batch_op.drop_column('first_day')
+        batch_op.drop_column('team_id')
+    op.drop_index(op.f('ix_ingest_watermarks_id'), table_name='ingest_watermarks')
+    op.drop_table('ingest_watermarks')
@@ -0,0 +1,59 @@
+"""cost anomalies
+
+Revision ID: f3a4b5c6d7e8
+Revises: e2f3a4b5c6d7
+Create Date: 2026-10-17 11:30:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a4b5c6d7e8'
+down_revision: Union[str, None] = 'e2f3a4b5c6d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('cost_series_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('last_day', sa.Date(), nullable=False),
+    sa.Column('observations', sa.Integer(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('variance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'service_id', name='uq_cost_series_stats_team_service')
+    )
+    op.create_index(op.f('ix_cost_series_stats_id'), 'cost_series_stats', ['id'], unique=False)
+    op.create_table('cost_anomalies',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('expected_micros', sa.BigInteger(), nullable=False),
+    sa.Column('lower_micros', sa.BigInteger(), nullable=False),
+    sa.Column('upper_micros', sa.BigInteger(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('detected_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'date', 'service_id', name='uq_cost_anomalies_team_date_service')
+    )
+    op.create_index(op.f('ix_cost_anomalies_id'), 'cost_anomalies', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cost_anomalies_id'), table_name='cost_anomalies')
+    op.drop_table('cost_anomalies')
+    op.drop_index(op.f('ix_cost_series_stats_id'), table_name='cost_series_stats')
+    op.drop_table('cost_series_stats')
@@ -0,0 +1,91 @@
+"""budgets
+
+Revision ID: a4b5c6d7e8f9
+Revises: f3a4b5c6d7e8
+Create Date: 2026-10-17 11:45:00.000000+00:00
+
+"""
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4b5c6d7e8f9'
+down_revision: Union[str, None] = 'f3a4b5c6d7e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _backfill_monthly_rollup(monthly):
+    # Month totals of the daily rollup, summed here rather than in SQL so
+    # the migration does not depend on dialect-specific date functions
+    daily = sa.table(
+        'cost_daily_rollup',
+        sa.column('date', sa.Date()), sa.column('team_id', sa.Integer()),
+        sa.column('service_id', sa.Integer()), sa.column('amount_micros', sa.BigInteger()),
+    )
+    totals = defaultdict(int)
+    for day, team_id, service_id, micros in op.get_bind().execute(sa.select(daily)):
+        totals[(day.replace(day=1), team_id, service_id)] += micros or 0
+    rows = [
+        {"month": month, "team_id": team_id, "service_id": service_id, "amount_micros": micros}
+        for (month, team_id, service_id), micros in totals.items()
+    ]
+    for start in range(0, len(rows), 50000):
+        op.bulk_insert(monthly, rows[start:start + 50000])
+
+
+def upgrade() -> None:
+    monthly = op.create_table('cost_monthly_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('team_id', 'month', 'service_id', name='uq_cost_monthly_rollup_team_month_service')
+    )
+    op.create_index(op.f('ix_cost_monthly_rollup_id'), 'cost_monthly_rollup', ['id'], unique=False)
+    _backfill_monthly_rollup(monthly)
+    op.create_table('budgets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=True),
+    sa.Column('amount_micros', sa.BigInteger(), nullable=False),
+    sa.Column('thresholds', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_budgets_id'), 'budgets', ['id'], unique=False)
+    op.create_index('ix_budgets_team_id', 'budgets', ['team_id'], unique=False)
+    op.create_table('budget_alerts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('budget_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('threshold', sa.Integer(), nullable=False),
+    sa.Column('spent_micros', sa.BigInteger(), nullable=False),
+    sa.Column('crossed_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('budget_id', 'month', 'threshold', name='uq_budget_alerts_budget_month_threshold')
+    )
+    op.create_index(op.f('ix_budget_alerts_id'), 'budget_alerts', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_budget_alerts_id'), table_name='budget_alerts')
+    op.drop_table('budget_alerts')
+    op.drop_index('ix_budgets_team_id', table_name='budgets')
+    op.drop_index(op.f('ix_budgets_id'), table_name='budgets')
+    op.drop_table('budgets')
+    op.drop_index(op.f('ix_cost_monthly_rollup_id'), table_name='cost_monthly_rollup')
+    op.drop_table('cost_monthly_rollup')
@@ -0,0 +1,215 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.orm import Session
+from . import crud, forecast, models, schemas
+from .database import SessionLocal
+import numpy as np
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A day's weight in a series' running mean and variance halves every this
+# many observations
+ANOMALY_HALF_LIFE_DAYS = float(os.getenv("ANOMALY_HALF_LIFE_DAYS", "14"))
+# Standard deviations above the running mean that count as a spike
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "3"))
+# Observations a series needs before it can be flagged
+ANOMALY_MIN_DAYS = int(os.getenv("ANOMALY_MIN_DAYS", "14"))
+# The expected range is never narrower than this many dollars either side,
+# so flat or tiny series are not flagged for cents
+ANOMALY_MIN_AMOUNT = float(os.getenv("ANOMALY_MIN_AMOUNT", "1.0"))
+# History folded in when the statistics are rebuilt from scratch
+ANOMALY_HISTORY_DAYS = int(os.getenv("ANOMALY_HISTORY_DAYS", "90"))
+
+ALPHA = 1 - 0.5 ** (1 / ANOMALY_HALF_LIFE_DAYS)
+CHUNK_SIZE = 500
+
+
+class SeriesState:
+    # Running statistics for a set of series as parallel arrays; last_day is
+    # a date ordinal, 0 for a series with no observations yet
+    def __init__(self, size: int):
+        self.mean = np.zeros(size)
+        self.variance = np.zeros(size)
+        self.observations = np.zeros(size, dtype=np.int64)
+        self.last_day = np.zeros(size, dtype=np.int64)
+
+    def score(self, idx: np.ndarray, amounts: np.ndarray):
+        # (flagged, score, expected, lower, upper) for one observation of each
+        # series in idx, against the statistics before it is folded in
+        mean = self.mean[idx]
+        std = np.maximum(np.sqrt(self.variance[idx]), ANOMALY_MIN_AMOUNT / ANOMALY_THRESHOLD)
+        scores = (amounts - mean) / std
+        upper = mean + ANOMALY_THRESHOLD * std
+        lower = np.clip(mean - ANOMALY_THRESHOLD * std, 0, None)
+        flagged = (scores > ANOMALY_THRESHOLD) & (self.observations[idx] >= ANOMALY_MIN_DAYS)
+        return flagged, scores, mean, lower, upper
+
+    def fold(self, idx: np.ndarray, amounts: np.ndarray, day: int):
+        # Exponentially weighted mean and variance (Welford-style, O(1) per
+        # observation); a series' first observation seeds its mean
+        first = self.observations[idx] == 0
+        mean = self.mean[idx]
+        diff = amounts - mean
+        increment = ALPHA * diff
+        self.mean[idx] = np.where(first, amounts, mean + increment)
+        self.variance[idx] = np.where(first, 0.0, (1 - ALPHA) * (self.variance[idx] + diff * increment))
+        self.observations[idx] += 1
+        self.last_day[idx] = day
+
+
+def _anomaly_rows(keys, idx, day: date, amounts, scored) -> List[dict]:
+    flagged, scores, expected, lower, upper = scored
+    return [
+        {
+            "date": day, "team_id": keys[i][0], "service_id": keys[i][1],
+            "amount_micros": models.to_micros(amount), "expected_micros": models.to_micros(mean),
+            "lower_micros": models.to_micros(low), "upper_micros": models.to_micros(high), "score": score,
+        }
+        for i, amount, score, mean, low, high in zip(
+            idx[flagged].tolist(), amounts[flagged].tolist(), scores[flagged].tolist(),
+            expected[flagged].tolist(), lower[flagged].tolist(), upper[flagged].tolist()
+        )
+    ]
+
+
+def _write_stats(db: Session, keys: Sequence[Tuple[int, int]], state: SeriesState, idx: np.ndarray):
+    stats = models.CostSeriesStats
+    rows = [
+        {
+            "team_id": keys[i][0], "service_id": keys[i][1], "last_day": date.fromordinal(day),
+            "observations": count, "mean": mean, "variance": variance,
+        }
+        for i, day, count, mean, variance in zip(
+            idx.tolist(), state.last_day[idx].tolist(), state.observations[idx].tolist(),
+            state.mean[idx].tolist(), state.variance[idx].tolist()
+        )
+    ]
+    for start in range(0, len(rows), forecast.INSERT_BATCH_SIZE):
+        stmt = crud._upsert(db, stats)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[stats.team_id, stats.service_id],
+            set_={
+                "last_day": stmt.excluded.last_day,
+                "observations": stmt.excluded.observations,
+                "mean": stmt.excluded.mean,
+                "variance": stmt.excluded.variance,
+            },
+        )
+        db.execute(stmt, rows[start:start + forecast.INSERT_BATCH_SIZE])
+
+
+def _write_anomalies(db: Session, cells: Sequence[Tuple[int, date, int]], rows: List[dict]):
+    # Scored cells lose any earlier flag, then the flagged ones are written
+    anomaly = models.CostAnomaly
+    cells = list(cells)
+    for start in range(0, len(cells), CHUNK_SIZE):
+        db.execute(
+            delete(anomaly)
+            .where(tuple_(anomaly.team_id, anomaly.date, anomaly.service_id).in_(cells[start:start + CHUNK_SIZE]))
+        )
+    for start in range(0, len(rows), forecast.INSERT_BATCH_SIZE):
+        db.execute(insert(anomaly), rows[start:start + forecast.INSERT_BATCH_SIZE])
+
+
+def rebuild_series_stats(db: Session) -> int:
+    # Recomputes every series' statistics from the last ANOMALY_HISTORY_DAYS
+    # of daily costs, scoring each day as it is folded in. Used to seed the
+    # state and after bulk rewrites such as a replay.
+    started = time.perf_counter()
+    rollup = models.CostDailyRollup
+    as_of = db.scalar(select(func.max(rollup.date)).where(rollup.date <= date.today()))
+    db.execute(delete(models.CostSeriesStats))
+    if as_of is None:
+        db.commit()
+        return 0
+    team_ids, service_ids, first_day, history, present = forecast.load_history(db, as_of, ANOMALY_HISTORY_DAYS)
+    keys = list(zip(team_ids.tolist(), service_ids.tolist()))
+    state = SeriesState(len(keys))
+    rows = []
+    for d in range(history.shape[1]):
+        day = first_day + timedelta(days=d)
+        idx = np.flatnonzero(present[:, d])
+        amounts = history[idx, d]
+        rows.extend(_anomaly_rows(keys, idx, day, amounts, state.score(idx, amounts)))
+        state.fold(idx, amounts, day.toordinal())
+
+    db.execute(delete(models.CostAnomaly).where(models.CostAnomaly.date >= first_day))
+    _write_stats(db, keys, state, np.flatnonzero(state.observations))
+    _write_anomalies(db, [], rows)
+    db.commit()
+    logger.info(
+        f"Rebuilt statistics for {len(keys)} cost series over {first_day}..{as_of}: "
+        f"{len(rows)} anomalies in {time.perf_counter() - started:.2f}s"
+    )
+    return len(rows)
+
+
+def update_series_stats(db: Session, changes) -> int:
+    # Folds the cells an ingest wrote into their series' statistics, one day
+    # at a time across all series at once, and scores each before folding
+    # it in. A day at or before a series' last_day is a restatement: it is
+    # rescored against the current statistics but not folded in again, so
+    # every day counts once.
+    if not changes:
+        return 0
+    if db.scalar(select(func.count()).select_from(models.CostSeriesStats)) == 0:
+        return rebuild_series_stats(db)
+
+    started = time.perf_counter()
+    service_ids = crud.get_service_ids(db, {service for _, _, service, _, _ in changes})
+    by_day: Dict[date, Dict[Tuple[int, int], float]] = defaultdict(dict)
+    for day, team_id, service, _, amount in changes:
+        by_day[day][(team_id, service_ids[service])] = amount
+    keys = sorted({key for cells in by_day.values() for key in cells})
+    index = {key: i for i, key in enumerate(keys)}
+
+    state = SeriesState(len(keys))
+    stats = models.CostSeriesStats
+    teams = sorted({team_id for team_id, _ in keys})
+    for start in range(0, len(teams), CHUNK_SIZE):
+        for row in db.execute(
+            select(stats.team_id, stats.service_id, stats.last_day, stats.observations, stats.mean, stats.variance)
+            .where(stats.team_id.in_(teams[start:start + CHUNK_SIZE]))
+        ):
+            i = index.get((row.team_id, row.service_id))
+            if i is not None:
+                state.mean[i], state.variance[i] = row.mean, row.variance
+                state.observations[i], state.last_day[i] = row.observations, row.last_day.toordinal()
+
+    rows, cells = [], []
+    for day in sorted(by_day):
+        idx = np.array([index[key] for key in by_day[day]], dtype=np.int64)
+        amounts = np.array(list(by_day[day].values()))
+        rows.extend(_anomaly_rows(keys, idx, day, amounts, state.score(idx, amounts)))
+        cells.extend((team_id, day, service_id) for team_id, service_id in by_day[day])
+        fresh = state.last_day[idx] < day.toordinal()
+        state.fold(idx[fresh], amounts[fresh], day.toordinal())
+
+    _write_stats(db, keys, state, np.flatnonzero(state.observations))
+    _write_anomalies(db, cells, rows)
+    db.commit()
+    logger.info(
+        f"Scored {len(cells)} cost cells across {len(keys)} series: "
+        f"{len(rows)} anomalies in {time.perf_counter() - started:.2f}s"
+    )
+    return len(rows)
+
+
+def run_anomaly_detection(result: Optional[schemas.IngestResult] = None) -> int:
+    # Scheduled entry point, run after each ingest with its result; without
+    # one the statistics are rebuilt from history
+    db = SessionLocal()
+    try:
+        if result is None:
+            return rebuild_series_stats(db)
+        return update_series_stats(db, result.changes)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
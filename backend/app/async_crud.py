@@ -0,0 +1,32 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas
+from .crud import (
+    TEAM_COSTS_PAGE_KEY, TEAMS_PAGE_KEY, build_cost_summary, cost_summary_stmts, team_costs_page_stmt
+)
+from .pagination import DEFAULT_PAGE_SIZE, page_result, paginate_async
+from datetime import date
+from typing import List, Optional, Tuple
+
+# Async variants of the read-heavy crud functions. They build the same
+# statements as crud and only differ in how they are executed.
+
+async def get_teams(db: AsyncSession, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return await paginate_async(db, select(models.Team), TEAMS_PAGE_KEY, limit, cursor)
+
+async def get_team_costs(
+    db: AsyncSession,
+    team_id: int,
+    start_date: date,
+    end_date: date,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Tuple[List, Optional[str]]:
+    rows = (await db.execute(team_costs_page_stmt(team_id, start_date, end_date, limit, cursor))).all()
+    return page_result(rows, TEAM_COSTS_PAGE_KEY, limit)
+
+async def get_team_cost_summary(db: AsyncSession, team_id: int, start_date: date, end_date: date) -> schemas.CostSummary:
+    by_service_stmt, daily_stmt = cost_summary_stmts(team_id, start_date, end_date)
+    by_service = (await db.execute(by_service_stmt)).all()
+    daily = (await db.execute(daily_stmt)).all()
+    return build_cost_summary(team_id, start_date, end_date, by_service, daily)
@@ -1,16 +1,26 @@
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from . import models, crud
-from .database import get_db
+from .database import SessionLocal, get_db
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
+import hmac
+import os
+import threading
+import time
 
 # JWT settings
 SECRET_KEY = "your-secret-key"  # In production, use a secure secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# How stale the in-process token version map may get before it is refreshed
+TOKEN_VERSION_REFRESH_SECONDS = float(os.getenv("TOKEN_VERSION_REFRESH_SECONDS", "5"))
+# Static bearer token a Prometheus scraper can use for /metrics (admins'
+# access tokens work too); unset means admins only
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 security = HTTPBearer()
 
@@ -24,22 +34,97 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user_from_token(token: str, db: Session) -> models.User:
+def create_user_access_token(user: models.User, expires_delta: Optional[timedelta] = None):
+    # Role, team and token version travel in the token so most requests can
+    # be authorized without loading the user.
+    return create_access_token(
+        data={
+            "sub": str(user.id),
+            "role": user.role.value if user.role else None,
+            "team_id": user.team_id,
+            "ver": user.token_version or 0,
+        },
+        expires_delta=expires_delta
+    )
+
+class TokenPrincipal:
+    # The caller as described by verified token claims. Exposes the same
+    # attributes the permission helpers read from models.User.
+    __slots__ = ("id", "role", "team_id", "token_version")
+
+    def __init__(self, id: int, role: Optional[models.UserRole], team_id: Optional[int], token_version: int):
+        self.id = id
+        self.role = role
+        self.team_id = team_id
+        self.token_version = token_version
+
+class TokenVersionCache:
+    # user_id -> (token_version, is_active), kept in process. Refreshes only
+    # pull users updated since the last refresh; unknown ids are loaded one
+    # row at a time. Changes made in this process are applied immediately,
+    # other workers see them within TOKEN_VERSION_REFRESH_SECONDS.
+    def __init__(self, refresh_seconds: float = TOKEN_VERSION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._versions: Dict[int, Tuple[int, bool]] = {}
+        self._updated_since: Optional[datetime] = None
+        self._loaded = False
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session):
+        rows = crud.get_user_token_states(db, updated_since=self._updated_since)
+        for user_id, version, is_active, updated_at in rows:
+            self._versions[user_id] = (version or 0, bool(is_active))
+            if updated_at is not None and (self._updated_since is None or updated_at > self._updated_since):
+                self._updated_since = updated_at
+        self._loaded = True
+        self._next_refresh = time.monotonic() + self.refresh_seconds
+
+    def peek(self, user_id: int) -> Optional[Tuple[int, bool]]:
+        # Lock-free lookup that never touches the database; None means the
+        # caller has to go through get() with a session.
+        if not self._loaded or time.monotonic() >= self._next_refresh:
+            return None
+        return self._versions.get(user_id)
+
+    def get(self, db: Session, user_id: int) -> Optional[Tuple[int, bool]]:
+        if not self._loaded or time.monotonic() >= self._next_refresh:
+            with self._lock:
+                if not self._loaded or time.monotonic() >= self._next_refresh:
+                    self._refresh(db)
+
+        state = self._versions.get(user_id)
+        if state is None:
+            row = crud.get_user_token_state(db, user_id)
+            if row is None:
+                return None
+            state = (row.token_version or 0, bool(row.is_active))
+            self._versions[user_id] = state
+        return state
+
+    def update(self, user: models.User):
+        self._versions[user.id] = (user.token_version or 0, bool(user.is_active))
+
+token_versions = TokenVersionCache()
+
+def _decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token"
-            )
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication token"
         )
+    if payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token"
+        )
+    return payload
 
-    user = crud.get_user(db, user_id=int(user_id))
+def get_current_user_from_token(token: str, db: Session) -> models.User:
+    payload = _decode_token(token)
+    user = crud.get_user(db, user_id=int(payload["sub"]))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -47,9 +132,58 @@ def get_current_user_from_token(token: str, db: Session) -> models.User:
         )
     return user
 
+def _principal_from_claims(payload: dict, state: Optional[Tuple[int, bool]]) -> TokenPrincipal:
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found"
+        )
+    version, is_active = state
+    if not is_active or payload["ver"] != version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
+        )
+
+    role = payload.get("role")
+    return TokenPrincipal(
+        int(payload["sub"]),
+        models.UserRole(role) if role else None,
+        payload.get("team_id"),
+        version
+    )
+
+def get_current_principal_from_token(token: str, db: Session) -> TokenPrincipal:
+    payload = _decode_token(token)
+
+    if "ver" not in payload:
+        # Token issued before claims were added: fall back to a full lookup
+        user = get_current_user_from_token(token, db)
+        return TokenPrincipal(user.id, user.role, user.team_id, user.token_version or 0)
+
+    return _principal_from_claims(payload, token_versions.get(db, int(payload["sub"])))
+
+def _load_principal(token: str) -> TokenPrincipal:
+    db = SessionLocal()
+    try:
+        return get_current_principal_from_token(token, db)
+    finally:
+        db.close()
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> models.User:
     return get_current_user_from_token(credentials.credentials, db)
 
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenPrincipal:
+    # Runs on the event loop. Only when the version map is stale or the user
+    # is unknown does it hop to the threadpool for a database read.
+    token = credentials.credentials
+    payload = _decode_token(token)
+    if "ver" in payload:
+        state = token_versions.peek(int(payload["sub"]))
+        if state is not None:
+            return _principal_from_claims(payload, state)
+    return await run_in_threadpool(_load_principal, token)
+
 def get_current_active_user(user: models.User) -> models.User:
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -63,10 +197,23 @@ def admin_required(user: models.User):
         )
     return user
 
+async def metrics_access_required(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return
+    admin_required(await get_current_principal(credentials))
+
 def team_lead_required(user: models.User):
     if user.role not in [models.UserRole.ADMIN, models.UserRole.TEAM_LEAD]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
-    return user
\ No newline at end of file
+    return user
+
+def team_access_required(user: models.User, team_id: int):
+    if user.role != models.UserRole.ADMIN and user.team_id != team_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this team's costs"
+        )
+    return user
@@ -1,67 +1,258 @@
 import boto3
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from botocore.config import Config
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import os
 from dotenv import load_dotenv
+from . import metrics, schemas
+from .ce_cache import CE_REPLAY, CacheMiss, ResponseStore, response_store
+import json
 import logging
+import random
+import threading
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+TEAM_TAG_KEY = 'Team'
+COST_METRIC = 'UnblendedCost'
+# Cost Explorer only serves resource-level data for this many recent days
+RESOURCE_HISTORY_DAYS = 14
+
+# JSON list of accounts to ingest; without it the environment credentials
+# are used for a single account
+AWS_ACCOUNTS_FILE = os.getenv('AWS_ACCOUNTS_FILE')
+ROLE_SESSION_NAME = 'costlens-ingest'
+
+# Cost Explorer's API limit is shared by every caller, so all ingest threads
+# draw from one process-wide bucket
+CE_REQUESTS_PER_SECOND = float(os.getenv('CE_REQUESTS_PER_SECOND', '5'))
+CE_BURST = int(os.getenv('CE_BURST', '5'))
+CE_MAX_RETRIES = int(os.getenv('CE_MAX_RETRIES', '6'))
+CE_BACKOFF_BASE_SECONDS = float(os.getenv('CE_BACKOFF_BASE_SECONDS', '0.5'))
+CE_BACKOFF_MAX_SECONDS = float(os.getenv('CE_BACKOFF_MAX_SECONDS', '30'))
+
+# botocore's own retries would bypass the shared bucket; throttling is
+# retried in _call instead
+CE_CLIENT_CONFIG = Config(retries={'max_attempts': 1, 'mode': 'standard'})
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is free; a rate of 0 disables limiting
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+ce_rate_limiter = TokenBucket(CE_REQUESTS_PER_SECOND, CE_BURST)
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter: uniform over [0, base * 2^attempt], capped
+    return random.uniform(0, min(CE_BACKOFF_MAX_SECONDS, CE_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def load_accounts() -> List[schemas.AWSAccount]:
+    if not AWS_ACCOUNTS_FILE:
+        return [schemas.AWSAccount(name='default')]
+    with open(AWS_ACCOUNTS_FILE) as f:
+        accounts = [schemas.AWSAccount(**entry) for entry in json.load(f)]
+    names = [account.name for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate account names in {AWS_ACCOUNTS_FILE}")
+    return accounts
+
+
+def create_client(account: schemas.AWSAccount):
+    # Accounts with a role are reached through STS using the environment
+    # credentials; the temporary credentials last for one ingest run.
+    region = account.region or os.getenv('AWS_REGION', 'us-west-2')
+    credentials = {
+        'aws_access_key_id': os.getenv('AWS_ACCESS_KEY_ID'),
+        'aws_secret_access_key': os.getenv('AWS_SECRET_ACCESS_KEY'),
+    }
+    if account.role_arn:
+        params = {'RoleArn': account.role_arn, 'RoleSessionName': ROLE_SESSION_NAME}
+        if account.external_id:
+            params['ExternalId'] = account.external_id
+        assumed = boto3.client('sts', region_name=region, **credentials).assume_role(**params)['Credentials']
+        credentials = {
+            'aws_access_key_id': assumed['AccessKeyId'],
+            'aws_secret_access_key': assumed['SecretAccessKey'],
+            'aws_session_token': assumed['SessionToken'],
+        }
+        logger.info(f"Assumed {account.role_arn} for account {account.name}")
+    return boto3.client('ce', region_name=region, config=CE_CLIENT_CONFIG, **credentials)
+
+
 class AWSCostExplorer:
-    def __init__(self):
-        self.client = boto3.client(
-            'ce',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION', 'us-west-2')
-        )
+    def __init__(
+        self,
+        client=None,
+        account: Optional[schemas.AWSAccount] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        store: Optional[ResponseStore] = response_store,
+        replay: bool = CE_REPLAY
+    ):
+        # Any object exposing get_cost_and_usage works here, which lets tests
+        # pass a botocore Stubber-wrapped client or a local fake. Without one
+        # the client is created on first use, so role assumption happens on
+        # the thread that fetches the account and replay never needs one.
+        self.account = account or schemas.AWSAccount(name='default')
+        self.rate_limiter = rate_limiter or ce_rate_limiter
+        self.store = store
+        self.replay = replay
+        self._client = client
+        if replay and store is None:
+            raise ValueError("Cost Explorer replay needs CE_CACHE_DIR")
 
-    def get_daily_costs(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
-        logger.info(f"Fetching AWS costs from {start_date} to {end_date}")
-
-        try:
-            response = self.client.get_cost_and_usage(
-                TimePeriod={
-                    'Start': start_date.strftime('%Y-%m-%d'),
-                    'End': end_date.strftime('%Y-%m-%d')
-                },
-                Granularity='DAILY',
-                Metrics=['UnblendedCost'],
-                GroupBy=[
-                    {'Type': 'TAG', 'Key': 'Team'},
-                    {'Type': 'DIMENSION', 'Key': 'SERVICE'}
-                ]
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_client(self.account)
+        return self._client
+
+    def iter_cost_pages(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        granularity: str = 'DAILY'
+    ) -> Iterator[List[Dict[str, Any]]]:
+        # Cost Explorer treats End as exclusive. Only one page of parsed
+        # records is held at a time; NextPageToken is followed until exhausted.
+        request = cost_request(start_date, end_date, granularity)
+        logger.info(f"Fetching AWS costs from {request['TimePeriod']['Start']} to {request['TimePeriod']['End']}")
+        yield from self._paginate('get_cost_and_usage', request, parse_cost_and_usage)
+
+    def iter_resource_cost_pages(
+        self,
+        start_date: datetime,
+        end_date: datetime
+    ) -> Iterator[List[Tuple[datetime, str, str, float]]]:
+        # Resource-level costs for usage without a Team tag, so they can be
+        # attributed through aws_resources without double counting tagged
+        # spend. Cost Explorer only keeps the last RESOURCE_HISTORY_DAYS at
+        # this level and rejects requests reaching further back, so longer
+        # (catch-up) windows are clamped here; service-level costs still
+        # cover the whole window.
+        earliest = datetime.combine(resource_history_start(), datetime.min.time())
+        if start_date < earliest:
+            start_date = earliest
+        if start_date >= end_date:
+            return
+        request = resource_cost_request(start_date, end_date)
+        logger.info(f"Fetching AWS resource costs from {request['TimePeriod']['Start']} to {request['TimePeriod']['End']}")
+        yield from self._paginate('get_cost_and_usage_with_resources', request, parse_resource_costs)
+
+    def _paginate(self, operation_name: str, request: Dict[str, Any], parse) -> Iterator[list]:
+        # Completed queries for closed periods (and every completed query in
+        # replay mode) come from the response store; anything else is fetched
+        # from AWS from the first page and stored.
+        cached = self.store.query(self.account.name, operation_name, request) if self.store else None
+        use_cache = cached is not None and (self.replay or cached.closed) and cached.completed()
+        if cached is not None and (self.replay or cached.closed) and not use_cache:
+            metrics.CE_CACHE_LOOKUPS.inc(operation_name, 'miss')
+        if self.replay and not use_cache:
+            raise CacheMiss(
+                f"No complete stored {operation_name} response for account {self.account.name} "
+                f"{request['TimePeriod']['Start']}..{request['TimePeriod']['End']}"
             )
-            logger.info(f"Received response from AWS Cost Explorer: {response}")
-        except Exception as e:
-            logger.error(f"Error fetching costs from AWS: {str(e)}")
-            raise
+        if cached is not None and not use_cache:
+            cached.reset()
+        fetched = False
+        page = 0
+        total = 0
+        next_token: Optional[str] = None
+        while True:
+            if next_token:
+                request['NextPageToken'] = next_token
+            response = cached.load(page) if use_cache else None
+            if use_cache:
+                metrics.CE_CACHE_LOOKUPS.inc(operation_name, 'hit' if response is not None else 'miss')
+            if response is None:
+                if self.replay:
+                    raise CacheMiss(
+                        f"No stored {operation_name} response for account {self.account.name} "
+                        f"{request['TimePeriod']['Start']}..{request['TimePeriod']['End']} page {page + 1}"
+                    )
+                response = self._call(operation_name, request, page)
+                if cached is not None:
+                    cached.store(page, response)
+                fetched = True
 
-        costs = []
-        for result in response.get('ResultsByTime', []):
-            date = datetime.strptime(result['TimePeriod']['Start'], '%Y-%m-%d')
-            logger.debug(f"Processing costs for date: {date}")
+            records = parse(response)
+            page += 1
+            total += len(records)
+            logger.debug(f"Cost Explorer page {page}: {len(records)} records")
+            yield records
 
-            for group in result.get('Groups', []):
-                team_tag = next((tag['Value'] for tag in group['Keys'] if tag.startswith('Team$')), 'Unassigned')
-                service = next((tag['Value'] for tag in group['Keys'] if not tag.startswith('Team$')), 'Unknown')
+            next_token = response.get('NextPageToken')
+            if not next_token:
+                break
 
-                amount = float(group['Metrics']['UnblendedCost']['Amount'])
-                logger.debug(f"Found cost: Team={team_tag}, Service={service}, Amount={amount}")
+        if fetched and cached is not None:
+            cached.complete(page)
+        logger.info(f"Processed {total} cost records from {page} page(s) for account {self.account.name}")
 
-                costs.append({
-                    'date': date,
-                    'team': team_tag,
-                    'service': service,
-                    'amount': amount
-                })
+    def _call(self, operation_name: str, request: Dict[str, Any], page: int) -> Dict[str, Any]:
+        operation = getattr(self.client, operation_name)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = operation(**request)
+            except Exception as e:
+                metrics.CE_REQUEST_SECONDS.observe(time.perf_counter() - started, operation_name)
+                throttled = metrics.is_throttling_error(e)
+                if throttled:
+                    metrics.CE_THROTTLES.inc(operation_name)
+                    if attempt < CE_MAX_RETRIES:
+                        delay = backoff_delay(attempt)
+                        attempt += 1
+                        metrics.CE_REQUESTS.inc(operation_name, 'throttled')
+                        logger.warning(
+                            f"Cost Explorer throttled account {self.account.name} (page {page + 1}), "
+                            f"retry {attempt} in {delay:.2f}s"
+                        )
+                        time.sleep(delay)
+                        continue
+                metrics.CE_REQUESTS.inc(operation_name, 'error')
+                logger.error(f"Error fetching costs from AWS for account {self.account.name} (page {page + 1}): {str(e)}")
+                raise
+            metrics.CE_REQUEST_SECONDS.observe(time.perf_counter() - started, operation_name)
+            metrics.CE_REQUESTS.inc(operation_name, 'success')
+            return response
 
-        logger.info(f"Processed {len(costs)} cost records")
-        return costs
+    def iter_resource_costs(self, start_date: datetime, end_date: datetime) -> Iterator[Tuple[datetime, str, str, float]]:
+        for records in self.iter_resource_cost_pages(start_date, end_date):
+            yield from records
+
+    def iter_daily_costs(self, start_date: datetime, end_date: datetime) -> Iterator[Dict[str, Any]]:
+        for records in self.iter_cost_pages(start_date, end_date):
+            yield from records
+
+    def get_daily_costs(self, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
+        return list(self.iter_daily_costs(start_date, end_date))
 
     def get_month_to_date_costs(self) -> List[Dict[str, Any]]:
         today = datetime.now()
@@ -71,4 +262,71 @@ class AWSCostExplorer:
     def get_last_30_days_costs(self) -> List[Dict[str, Any]]:
         today = datetime.now()
         thirty_days_ago = today - timedelta(days=30)
-        return self.get_daily_costs(thirty_days_ago, today)
\ No newline at end of file
+        return self.get_daily_costs(thirty_days_ago, today)
+
+def resource_history_start() -> date:
+    # First day Cost Explorer still serves resource-level costs for
+    return date.today() - timedelta(days=RESOURCE_HISTORY_DAYS)
+
+def cost_request(start_date: datetime, end_date: datetime, granularity: str = 'DAILY') -> Dict[str, Any]:
+    return {
+        'TimePeriod': _time_period(start_date, end_date),
+        'Granularity': granularity,
+        'Metrics': [COST_METRIC],
+        'GroupBy': [
+            {'Type': 'TAG', 'Key': TEAM_TAG_KEY},
+            {'Type': 'DIMENSION', 'Key': 'SERVICE'}
+        ]
+    }
+
+def resource_cost_request(start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    return {
+        'TimePeriod': _time_period(start_date, end_date),
+        'Granularity': 'DAILY',
+        'Metrics': [COST_METRIC],
+        'Filter': {'Tags': {'Key': TEAM_TAG_KEY, 'MatchOptions': ['ABSENT']}},
+        'GroupBy': [
+            {'Type': 'DIMENSION', 'Key': 'RESOURCE_ID'},
+            {'Type': 'DIMENSION', 'Key': 'SERVICE'}
+        ]
+    }
+
+def _time_period(start_date: datetime, end_date: datetime) -> Dict[str, str]:
+    return {
+        'Start': start_date.strftime('%Y-%m-%d'),
+        'End': end_date.strftime('%Y-%m-%d')
+    }
+
+def parse_cost_and_usage(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    costs = []
+    for result in response.get('ResultsByTime', []):
+        date = datetime.strptime(result['TimePeriod']['Start'], '%Y-%m-%d')
+
+        for group in result.get('Groups', []):
+            team = 'Unassigned'
+            service = 'Unknown'
+            for key in group['Keys']:
+                if key.startswith(TEAM_TAG_KEY + '$'):
+                    # Untagged usage comes back as a bare "Team$"
+                    team = key[len(TEAM_TAG_KEY) + 1:] or 'Unassigned'
+                else:
+                    service = key
+
+            costs.append({
+                'date': date,
+                'team': team,
+                'service': service,
+                'amount': float(group['Metrics'][COST_METRIC]['Amount'])
+            })
+    return costs
+
+def parse_resource_costs(response: Dict[str, Any]) -> List[Tuple[datetime, str, str, float]]:
+    # Kept as plain tuples: resource-level pages are large and every
+    # line item goes straight into the attribution aggregator.
+    items = []
+    for result in response.get('ResultsByTime', []):
+        date = datetime.strptime(result['TimePeriod']['Start'], '%Y-%m-%d')
+        for group in result.get('Groups', []):
+            resource_id, service = group['Keys']
+            items.append((date, resource_id, service, float(group['Metrics'][COST_METRIC]['Amount'])))
+    return items
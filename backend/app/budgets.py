@@ -0,0 +1,133 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import crud, models, schemas
+from .database import SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+def month_start(day: Optional[date] = None) -> date:
+    return (day or date.today()).replace(day=1)
+
+
+def budget_status(row, month: date) -> schemas.BudgetStatus:
+    # row is one result of crud.get_budget_statuses
+    amount = models.from_micros(row.amount_micros)
+    spent = models.from_micros(row.spent_micros)
+    percent = spent / amount * 100 if amount else 0.0
+    thresholds = models.parse_thresholds(row.thresholds)
+    return schemas.BudgetStatus(
+        id=row.id,
+        team_id=row.team_id,
+        team=row.team,
+        service=row.service,
+        month=month,
+        amount=amount,
+        spent=spent,
+        remaining=amount - spent,
+        percent_used=percent,
+        thresholds=thresholds,
+        crossed=[threshold for threshold in thresholds if percent >= threshold],
+    )
+
+
+def evaluate_budgets(db: Session, cells: Iterable[Tuple[int, int, date]]) -> int:
+    # Checks only the budgets a set of changed (team_id, service_id, month)
+    # cells can move: their team's budget and the budget on that service.
+    # Each threshold reached is recorded once per budget and month; the
+    # caller owns the transaction. Returns the number of new alerts.
+    cells = {tuple(cell) for cell in cells}
+    if not cells:
+        return 0
+    months_by_team: Dict[int, Set[date]] = defaultdict(set)
+    for team_id, _, month in cells:
+        months_by_team[team_id].add(month)
+    teams = sorted(months_by_team)
+
+    budget = models.Budget
+    candidates = []
+    for start in range(0, len(teams), CHUNK_SIZE):
+        for row in db.execute(
+            select(budget.id, budget.team_id, budget.service_id, budget.amount_micros, budget.thresholds)
+            .where(budget.team_id.in_(teams[start:start + CHUNK_SIZE]))
+        ):
+            for month in months_by_team[row.team_id]:
+                if row.service_id is None or (row.team_id, row.service_id, month) in cells:
+                    candidates.append((row, month))
+    if not candidates:
+        return 0
+
+    # Month-to-date spend per (team, service, month) for the candidates' teams
+    monthly = models.CostMonthlyRollup
+    budget_teams = sorted({row.team_id for row, _ in candidates})
+    months = sorted({month for _, month in candidates})
+    spent: Dict[Tuple[int, Optional[int], date], int] = defaultdict(int)
+    for start in range(0, len(budget_teams), CHUNK_SIZE):
+        for team_id, service_id, month, micros in db.execute(
+            select(monthly.team_id, monthly.service_id, monthly.month, monthly.amount_micros)
+            .where(monthly.team_id.in_(budget_teams[start:start + CHUNK_SIZE]), monthly.month.in_(months))
+        ):
+            spent[(team_id, service_id, month)] += micros
+            spent[(team_id, None, month)] += micros
+
+    alerts = []
+    for row, month in candidates:
+        micros = spent[(row.team_id, row.service_id, month)]
+        for threshold in models.parse_thresholds(row.thresholds):
+            if micros * 100 >= row.amount_micros * threshold:
+                alerts.append({"budget_id": row.id, "month": month, "threshold": threshold, "spent_micros": micros})
+    if not alerts:
+        return 0
+    alert = models.BudgetAlert
+    recorded = set(db.execute(
+        select(alert.budget_id, alert.month, alert.threshold)
+        .where(alert.budget_id.in_({row["budget_id"] for row in alerts}), alert.month.in_(months))
+    ).all())
+    alerts = [row for row in alerts if (row["budget_id"], row["month"], row["threshold"]) not in recorded]
+    if alerts:
+        stmt = crud._upsert(db, alert).on_conflict_do_nothing(
+            index_elements=[alert.budget_id, alert.month, alert.threshold]
+        )
+        db.execute(stmt, alerts)
+    return len(alerts)
+
+
+def month_cells(db: Session, month: date, team_id: Optional[int] = None):
+    # Every (team_id, service_id, month) cell with spend in the month, to
+    # check budgets that no ingest has touched yet
+    monthly = models.CostMonthlyRollup
+    stmt = select(monthly.team_id, monthly.service_id, monthly.month).where(monthly.month == month)
+    if team_id is not None:
+        stmt = stmt.where(monthly.team_id == team_id)
+    return db.execute(stmt).all()
+
+
+def run_budget_alerts(result: Optional[schemas.IngestResult] = None) -> int:
+    # Scheduled entry point, run after each ingest with its result; without
+    # one every budget is checked against the current month
+    db = SessionLocal()
+    try:
+        if result is None:
+            cells = month_cells(db, month_start())
+        else:
+            service_ids = crud.get_service_ids(db, {service for _, _, service, _, _ in result.changes})
+            cells = {
+                (team_id, service_ids[service], day.replace(day=1))
+                for day, team_id, service, _, _ in result.changes
+            }
+        alerts = evaluate_budgets(db, cells)
+        db.commit()
+        if alerts:
+            logger.info(f"Recorded {alerts} new budget alert(s)")
+        return alerts
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,278 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Hashable, List, NamedTuple, Optional, Tuple, Union
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from . import crud, formats
+from .compression import COMPRESSION_MIN_BYTES, choose_encoding, compress, is_compressible
+from .database import SessionLocal
+import hashlib
+import os
+import re
+import threading
+import time
+
+# How long a worker trusts its copy of the data version before re-reading it
+DATA_VERSION_REFRESH_SECONDS = float(os.getenv("DATA_VERSION_REFRESH_SECONDS", "1"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Recent data_changes rows kept in memory to decide what a change affects
+CHANGE_LOG_MAX_ENTRIES = int(os.getenv("CHANGE_LOG_MAX_ENTRIES", "10000"))
+
+
+class Scope(NamedTuple):
+    # The team (or frozenset of teams) and days a cached response was
+    # computed from
+    team_id: Union[int, FrozenSet[int]]
+    first_day: date
+    last_day: date
+
+
+class ChangeLog:
+    # Tail of data_changes as (id, team_id, first_day, last_day). Only
+    # changes after `floor` are known; anything older counts as affecting
+    # every scope.
+    def __init__(self, max_entries: int = CHANGE_LOG_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.floor: Optional[int] = None
+        self._changes: List[Tuple[int, Optional[int], Optional[date], Optional[date]]] = []
+        self._lock = threading.Lock()
+
+    def extend(self, db, version: int):
+        with self._lock:
+            if self.floor is None or version < self.floor:
+                self.floor, self._changes = version, []
+                return
+            last = self._changes[-1][0] if self._changes else self.floor
+            if version <= last:
+                return
+            changes = self._changes + crud.get_data_changes(db, last, version)
+            if len(changes) > self.max_entries:
+                dropped = changes[:-self.max_entries]
+                changes = changes[-self.max_entries:]
+                self.floor = dropped[-1][0]
+            self._changes = changes
+
+    def affects(self, scope: Optional[Scope], since: int, until: int) -> bool:
+        # Whether any change in (since, until] touches `scope`; no scope
+        # means the response depends on everything.
+        if since >= until:
+            return False
+        if scope is None or self.floor is None or since < self.floor:
+            return True
+        changes = self._changes
+        if not changes or changes[-1][0] < until:
+            return True
+        teams = scope.team_id if isinstance(scope.team_id, frozenset) else (scope.team_id,)
+        for change_id, team_id, first_day, last_day in reversed(changes):
+            if change_id <= since:
+                break
+            if change_id > until:
+                continue
+            if team_id is not None and team_id not in teams:
+                continue
+            if first_day is not None and first_day > scope.last_day:
+                continue
+            if last_day is not None and last_day < scope.first_day:
+                continue
+            return True
+        return False
+
+
+class DataVersion:
+    # Process-local view of max(data_changes.id). Reads are lock-free while
+    # fresh; a stale read costs one indexed MAX() query, plus reading the
+    # new data_changes rows into the change log when the version moved.
+    def __init__(self, refresh_seconds: float = DATA_VERSION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._version: Optional[int] = None
+        self._expires = 0.0
+        self.changes = ChangeLog()
+
+    def peek(self) -> Optional[int]:
+        if self._version is None or time.monotonic() >= self._expires:
+            return None
+        return self._version
+
+    def refresh(self) -> int:
+        db = SessionLocal()
+        try:
+            version = crud.get_data_version(db)
+            self.changes.extend(db, version)
+            self._version = version
+        finally:
+            db.close()
+        self._expires = time.monotonic() + self.refresh_seconds
+        return self._version
+
+    async def current(self) -> int:
+        version = self.peek()
+        if version is None:
+            version = await run_in_threadpool(self.refresh)
+        return version
+
+    def invalidate(self):
+        self._expires = 0.0
+
+
+class CachedResponse:
+    __slots__ = ("etag", "body", "media_type", "version", "checked", "encoded")
+
+    def __init__(self, etag: str, body: bytes, media_type: str, version: int):
+        self.etag = etag
+        self.body = body
+        self.media_type = media_type
+        # Data version the body was built from, and the latest version it
+        # is known to still be valid for
+        self.version = version
+        self.checked = version
+        # Compressed copies of body by content encoding, made on first use
+        self.encoded: Dict[str, bytes] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+
+class ResponseCache:
+    # LRU of serialized response bodies bounded by entry count and bytes.
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def add_encoding(self, key: Hashable, entry: CachedResponse, encoding: str, body: bytes):
+        # Keeps a compressed copy next to the cached body, counted against
+        # max_bytes while the entry is still cached
+        with self._lock:
+            if encoding in entry.encoded:
+                return
+            entry.encoded[encoding] = body
+            if self._entries.get(key) is entry:
+                self._bytes += len(body)
+                self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+data_version = DataVersion()
+response_cache = ResponseCache()
+
+
+_ETAG = re.compile(r'^(?:W/)?"(\d+)-([0-9a-f]+)"$')
+
+
+def _key_digest(key: Hashable) -> str:
+    return hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+
+
+def make_etag(key: Hashable, version: int) -> str:
+    return f'W/"{version}-{_key_digest(key)}"'
+
+
+def client_etag_version(request: Request, key: Hashable) -> Optional[int]:
+    # Newest data version among the client's validators for this key; "*"
+    # matches whatever is current.
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    digest = _key_digest(key)
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return -1
+        match = _ETAG.match(tag)
+        if match and match.group(2) == digest:
+            versions.append(int(match.group(1)))
+    return max(versions) if versions else None
+
+
+async def cached_json(
+    request: Request,
+    produce: Callable[[], Awaitable[Union[BaseModel, bytes, Any]]],
+    scope: Optional[Scope] = None,
+    encoders: Optional[formats.Encoders] = None
+) -> Response:
+    # Response for a GET whose body depends only on its path, its query
+    # string, its Accept header and the data in `scope`. Cached bodies and
+    # client validators stay valid across data versions whose changes miss
+    # the scope; without one any change invalidates. Authorization must
+    # already have passed. `produce` returns a model, or a body it has
+    # already serialized; with `encoders` (format -> encoder) its result is
+    # encoded in the format negotiated from Accept instead. Large bodies are
+    # compressed once per content encoding and cached that way.
+    fmt = formats.negotiate(request.headers.get("accept"), list(encoders)) if encoders else "json"
+    version = await data_version.current()
+    changes = data_version.changes
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())), fmt)
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept, Accept-Encoding"}
+
+    client_version = client_etag_version(request, key)
+    if client_version == -1 or (
+        client_version is not None and client_version <= version
+        and not changes.affects(scope, client_version, version)
+    ):
+        headers["ETag"] = make_etag(key, version if client_version == -1 else client_version)
+        return Response(status_code=304, headers=headers)
+
+    entry = response_cache.get(key)
+    if entry is not None and entry.checked < version:
+        if changes.affects(scope, entry.checked, version):
+            entry = None
+        else:
+            entry.checked = version
+    if entry is None:
+        result = await produce()
+        if encoders:
+            body = encoders[fmt](result)
+        else:
+            body = result if isinstance(result, bytes) else result.model_dump_json().encode()
+        entry = CachedResponse(make_etag(key, version), body, formats.MEDIA_TYPES[fmt], version)
+        response_cache.put(key, entry)
+    headers["ETag"] = entry.etag
+
+    body = entry.body
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= COMPRESSION_MIN_BYTES and is_compressible(entry.media_type):
+        compressed = entry.encoded.get(encoding)
+        if compressed is None:
+            compressed = await run_in_threadpool(compress, body, encoding)
+            response_cache.add_encoding(key, entry, encoding, compressed)
+        body = compressed
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=entry.media_type, headers=headers)
@@ -0,0 +1,170 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Raw Cost Explorer responses are kept here. Off by default: they are raw
+# billing data, so the directory is an explicit choice
+CE_CACHE_DIR = os.getenv("CE_CACHE_DIR", "")
+# A period is served from the store once it ended this many days ago;
+# Cost Explorer keeps revising recent days until then
+CE_CACHE_SETTLE_DAYS = int(os.getenv("CE_CACHE_SETTLE_DAYS", "3"))
+# Serve every request from the store and never call AWS
+CE_REPLAY = os.getenv("CE_REPLAY", "false").lower() in ("1", "true", "yes")
+
+MANIFEST = "manifest.json"
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+def _shape(request: Dict[str, Any]) -> str:
+    # Everything except the time period and page token: metrics,
+    # granularity, group-by and filter
+    shape = {k: v for k, v in request.items() if k not in ("TimePeriod", "NextPageToken")}
+    return hashlib.sha256(json.dumps(shape, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers never see a partial file, and an interrupted write leaves
+    # nothing behind but a temp file
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# One paginated query: a gzip file per page, plus a manifest written once
+# the last page is stored. Only queries with a manifest are replayed.
+class CachedQuery:
+    def __init__(self, path: str, request: Dict[str, Any]):
+        self.path = path
+        self.request = request
+        end = date.fromisoformat(request["TimePeriod"]["End"])
+        self.closed = end <= date.today() - timedelta(days=CE_CACHE_SETTLE_DAYS)
+
+    def _page_path(self, page: int) -> str:
+        return os.path.join(self.path, f"page-{page:05d}.json.gz")
+
+    def completed(self) -> bool:
+        # A manifest and every page it lists; pages left by an interrupted
+        # fetch are never served on their own
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                pages = json.load(f)["pages"]
+        except FileNotFoundError:
+            return False
+        return all(os.path.exists(self._page_path(page)) for page in range(pages))
+
+    def reset(self):
+        # Before a refetch overwrites the pages, so a manifest never
+        # describes a mix of old and new ones
+        try:
+            os.unlink(os.path.join(self.path, MANIFEST))
+        except FileNotFoundError:
+            pass
+
+    def load(self, page: int) -> Optional[Dict[str, Any]]:
+        try:
+            with gzip.open(self._page_path(page), "rt") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def store(self, page: int, response: Dict[str, Any]):
+        response = {k: v for k, v in response.items() if k != "ResponseMetadata"}
+        _write_atomic(self._page_path(page), gzip.compress(json.dumps(response, default=str).encode()))
+
+    def complete(self, pages: int):
+        manifest = {
+            "request": self.request,
+            "pages": pages,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+        }
+        _write_atomic(os.path.join(self.path, MANIFEST), json.dumps(manifest).encode())
+
+
+class ResponseStore:
+    # Layout: <root>/<account>/<operation>/<request shape>/<start>_<end>/
+    def __init__(self, root: str):
+        self.root = root
+
+    def query(self, account: str, operation: str, request: Dict[str, Any]) -> CachedQuery:
+        request = {k: v for k, v in request.items() if k != "NextPageToken"}
+        period = request["TimePeriod"]
+        path = os.path.join(
+            self.root, _safe_name(account), operation, _shape(request), f"{period['Start']}_{period['End']}"
+        )
+        return CachedQuery(path, request)
+
+    def accounts(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _manifests(self, account: str, operation: str, template: Dict[str, Any]) -> List[Dict[str, Any]]:
+        directory = os.path.join(self.root, _safe_name(account), operation, _shape(template))
+        if not os.path.isdir(directory):
+            return []
+        manifests = []
+        for name in sorted(os.listdir(directory)):
+            try:
+                with open(os.path.join(directory, name, MANIFEST)) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                continue
+            manifest["path"] = os.path.join(directory, name)
+            manifests.append(manifest)
+        return manifests
+
+    def iter_responses(self, account: str, operation: str, template: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        # Complete queries with the same shape as `template`. Periods fetched
+        # more than once overlap, so each ResultsByTime entry is taken only
+        # from the most recently fetched query covering its start.
+        manifests = self._manifests(account, operation, template)
+        owner: Dict[str, int] = {}
+        fetched = defaultdict(str)
+        for i, manifest in enumerate(manifests):
+            period = manifest["request"]["TimePeriod"]
+            day = date.fromisoformat(period["Start"])
+            end = date.fromisoformat(period["End"])
+            while day < end:
+                key = day.isoformat()
+                if manifest["fetched_at"] >= fetched[key]:
+                    owner[key] = i
+                    fetched[key] = manifest["fetched_at"]
+                day += timedelta(days=1)
+
+        for i, manifest in enumerate(manifests):
+            query = CachedQuery(manifest["path"], manifest["request"])
+            for page in range(manifest["pages"]):
+                response = query.load(page)
+                if response is None:
+                    raise CacheMiss(f"Missing page {page} in {manifest['path']}")
+                response["ResultsByTime"] = [
+                    result for result in response.get("ResultsByTime", [])
+                    if owner.get(result["TimePeriod"]["Start"]) == i
+                ]
+                yield response
+
+
+response_store = ResponseStore(CE_CACHE_DIR) if CE_CACHE_DIR else None
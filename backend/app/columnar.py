@@ -0,0 +1,146 @@
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, formats, models
+from .retention import period_start
+import numpy as np
+import orjson
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def periods(start_date: date, end_date: date, granularity: str) -> Tuple[List[date], np.ndarray]:
+    # Labels and day offsets of the periods covering [start_date, end_date];
+    # a period cut off by start_date is labelled with start_date
+    labels, offsets = [], []
+    day = start_date
+    while day <= end_date:
+        labels.append(day)
+        offsets.append((day - start_date).days)
+        if granularity == "day":
+            day += timedelta(days=1)
+        elif granularity == "week":
+            day = period_start(day, "week") + timedelta(days=7)
+        else:
+            day = (period_start(day, "month") + timedelta(days=32)).replace(day=1)
+    return labels, np.array(offsets, dtype=np.int64)
+
+
+async def load_daily(
+    db: AsyncSession,
+    team_ids: List[int],
+    start_date: date,
+    end_date: date
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Same shape as CostCube.daily, read from the rollup and archive
+    costs = crud.daily_costs_stmt(start_date=start_date, end_date=end_date, team_ids=team_ids).subquery()
+    result = await db.execute(select(costs.c.team_id, costs.c.service, costs.c.date, costs.c.amount_micros))
+    days = (end_date - start_date).days + 1
+    series: Dict[Tuple[int, str], int] = {}
+    series_idx, day_idx, amounts = array("q"), array("q"), array("q")
+    for team_id, service, day, amount in result:
+        idx = series.get((team_id, service))
+        if idx is None:
+            idx = series[(team_id, service)] = len(series)
+        series_idx.append(idx)
+        day_idx.append((day - start_date).days)
+        amounts.append(amount or 0)
+    daily = np.bincount(
+        np.frombuffer(series_idx, dtype=np.int64) * days + np.frombuffer(day_idx, dtype=np.int64),
+        weights=np.frombuffer(amounts, dtype=np.int64) / models.MICROS_PER_DOLLAR,
+        minlength=len(series) * days
+    ).reshape(len(series), days)
+    teams = np.array([team_id for team_id, _ in series], dtype=np.int64)
+    services = np.array([service for _, service in series], dtype=object)
+    return teams, services, daily
+
+
+def build(
+    team_ids: List[int],
+    start_date: date,
+    end_date: date,
+    granularity: str,
+    teams: np.ndarray,
+    services: np.ndarray,
+    daily: np.ndarray
+) -> dict:
+    # One shared date axis and service dictionary; each team lists the
+    # dictionary index of its services and one amount array per service.
+    # Series with no spend in the range are left out.
+    labels, offsets = periods(start_date, end_date, granularity)
+    amounts = np.add.reduceat(daily, offsets, axis=1) if daily.shape[0] else np.zeros((0, len(labels)))
+    amounts = np.round(amounts, 6)
+    keep = np.flatnonzero(np.any(amounts != 0, axis=1))
+
+    names = sorted(set(services[keep].tolist()))
+    codes = {name: i for i, name in enumerate(names)}
+    kept_codes = np.array([codes[name] for name in services[keep].tolist()], dtype=np.int64)
+    order = np.lexsort((kept_codes, teams[keep]))
+    kept_teams, kept_codes, kept_amounts = teams[keep][order], kept_codes[order], amounts[keep][order]
+
+    entries = []
+    for team_id in team_ids:
+        lo, hi = np.searchsorted(kept_teams, team_id, "left"), np.searchsorted(kept_teams, team_id, "right")
+        team_amounts = kept_amounts[lo:hi]
+        entries.append({
+            "team_id": team_id,
+            "services": kept_codes[lo:hi],
+            "amounts": team_amounts,
+            "total": np.round(team_amounts.sum(axis=0), 6),
+        })
+    payload = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "granularity": granularity,
+        "dates": labels,
+        "services": names,
+        "teams": entries,
+    }
+    return payload
+
+
+def to_json(payload: dict) -> bytes:
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def to_msgpack(payload: dict) -> bytes:
+    # Same document as the JSON one
+    return formats.packb(payload)
+
+
+def to_arrow(payload: dict) -> bytes:
+    # Long table, one row per team, service and period of the series the
+    # JSON document lists; services are dictionary-encoded against the
+    # shared service list. Per-team totals are left to the client.
+    periods = len(payload["dates"])
+    team_ids = [entry["team_id"] for entry in payload["teams"]]
+    codes = [entry["services"] for entry in payload["teams"]]
+    counts = np.array([len(team_codes) for team_codes in codes], dtype=np.int64)
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    amounts = [entry["amounts"].reshape(-1, periods) for entry in payload["teams"]]
+    amounts = np.concatenate(amounts) if amounts else np.zeros((0, periods))
+    dates = np.array(payload["dates"], dtype="datetime64[D]")
+
+    pa = formats.pa
+    table = pa.table({
+        "team_id": pa.array(np.repeat(np.repeat(np.array(team_ids, dtype=np.int64), counts), periods)),
+        "service": pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(codes, periods).astype(np.int32)), pa.array(payload["services"], pa.string())
+        ),
+        "date": pa.array(np.tile(dates, len(codes)), pa.date32()),
+        "amount": pa.array(amounts.ravel(), pa.float64()),
+    }).replace_schema_metadata({
+        "start_date": payload["start_date"].isoformat(),
+        "end_date": payload["end_date"].isoformat(),
+        "granularity": payload["granularity"],
+    })
+    return formats.arrow_stream(table)
+
+
+ENCODERS: formats.Encoders = {
+    "json": to_json,
+    "msgpack": to_msgpack,
+    "arrow": to_arrow,
+}
@@ -0,0 +1,167 @@
+from typing import List, Optional, Tuple
+import gzip
+import os
+import zlib
+
+# brotli is optional; without it responses are only ever gzipped
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out uncompressed; streamed bodies always are
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "application/vnd.apache.arrow",
+    "text/",
+)
+
+
+def quality_values(header: str) -> List[Tuple[str, float]]:
+    # (lowercased value, q) for each entry of an Accept-style header
+    values = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        values.append((name, quality))
+    return values
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    # "br" or "gzip" from an Accept-Encoding header, preferring brotli on a
+    # tie when it is installed; None means send the body as is
+    if not accept_encoding:
+        return None
+    qualities = dict(quality_values(accept_encoding))
+    wildcard = qualities.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    return bool(media_type) and media_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flushed per chunk so a streamed body reaches the client as it is
+        # produced rather than when the compressor's buffer fills
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    # Pure ASGI. Compresses JSON, NDJSON, MessagePack and Arrow bodies with
+    # the best encoding the client accepts once they reach
+    # COMPRESSION_MIN_BYTES; streamed bodies are compressed chunk by chunk.
+    # Responses that already carry a Content-Encoding (cached bodies the
+    # response cache compressed once) pass through untouched.
+    def __init__(self, app, min_bytes: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                media_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not is_compressible(media_type):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                if not more_body and len(body) < self.min_bytes:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                headers = [
+                    (name, value) for name, value in start.get("headers", [])
+                    if name.lower() not in (b"content-length", b"vary")
+                ]
+                vary = [value for name, value in start.get("headers", []) if name.lower() == b"vary"]
+                headers.append((b"content-encoding", encoding.encode()))
+                if b"accept-encoding" not in b",".join(vary).lower():
+                    vary.append(b"Accept-Encoding")
+                headers.append((b"vary", b", ".join(vary)))
+                if more_body:
+                    compressor = _StreamCompressor(encoding)
+                else:
+                    body = compress(body, encoding)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                await send({**start, "headers": headers})
+                start = None
+                if compressor is None:
+                    await send({"type": "http.response.body", "body": body})
+                    return
+            if more_body:
+                await send({"type": "http.response.body", "body": compressor.chunk(body), "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body)})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,7 +1,11 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import Date, Float, and_, case, cast, delete, func, insert, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
 from . import models, schemas
-from datetime import datetime, timedelta
-from typing import List, Optional
+from .pagination import DEFAULT_PAGE_SIZE, decode_cursor, page_result, paginate
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,8 +16,24 @@ def get_user(db: Session, user_id: int):
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_user_token_state(db: Session, user_id: int):
+    user = models.User
+    return db.execute(
+        select(user.id, user.token_version, user.is_active).where(user.id == user_id)
+    ).first()
+
+def get_user_token_states(db: Session, updated_since: Optional[datetime] = None):
+    user = models.User
+    stmt = select(user.id, user.token_version, user.is_active, user.updated_at)
+    if updated_since is not None:
+        stmt = stmt.where(user.updated_at >= updated_since)
+    return db.execute(stmt).all()
+
+def get_users(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return paginate(db, select(models.User), [models.User.id], limit, cursor)
+
+def has_users(db: Session) -> bool:
+    return db.query(models.User.id).first() is not None
 
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(
@@ -31,12 +51,21 @@ def create_user(db: Session, user: schemas.UserCreate):
 def get_team(db: Session, team_id: int):
     return db.query(models.Team).filter(models.Team.id == team_id).first()
 
-def get_teams(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Team).offset(skip).limit(limit).all()
+def get_team_by_name(db: Session, name: str):
+    return db.query(models.Team).filter(models.Team.name == name).first()
+
+def get_team_ids_by_name(db: Session) -> Dict[str, int]:
+    return {name: team_id for team_id, name in db.execute(select(models.Team.id, models.Team.name))}
+
+TEAMS_PAGE_KEY = [models.Team.id]
+
+def get_teams(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return paginate(db, select(models.Team), TEAMS_PAGE_KEY, limit, cursor)
 
 def create_team(db: Session, team: schemas.TeamCreate):
     db_team = models.Team(**team.dict())
     db.add(db_team)
+    record_data_change(db, source="team")
     db.commit()
     db.refresh(db_team)
     return db_team
@@ -44,8 +73,8 @@ def create_team(db: Session, team: schemas.TeamCreate):
 def get_aws_resource(db: Session, resource_id: int):
     return db.query(models.AWSResource).filter(models.AWSResource.id == resource_id).first()
 
-def get_aws_resources(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.AWSResource).offset(skip).limit(limit).all()
+def get_aws_resources(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return paginate(db, select(models.AWSResource), [models.AWSResource.id], limit, cursor)
 
 def create_aws_resource(db: Session, resource: schemas.AWSResourceCreate):
     db_resource = models.AWSResource(**resource.dict())
@@ -66,38 +95,605 @@ def update_user_team(db: Session, user_id: int, team_id: Optional[int]):
     db_user = get_user(db, user_id)
     if db_user:
         db_user.team_id = team_id
+        db_user.token_version = (db_user.token_version or 0) + 1
         db.commit()
         db.refresh(db_user)
     return db_user
 
+def get_service_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    # Resolves service names to ids, adding any that are new
+    service = models.Service
+    names = set(names)
+
+    def lookup(wanted):
+        rows = db.execute(select(service.id, service.name).where(service.name.in_(wanted)))
+        return {name: service_id for service_id, name in rows}
+
+    if not names:
+        return {}
+    ids = lookup(names)
+    missing = names - ids.keys()
+    if missing:
+        stmt = _upsert(db, service).on_conflict_do_nothing(index_elements=[service.name])
+        db.execute(stmt, [{"name": name} for name in missing])
+        ids.update(lookup(missing))
+    return ids
+
+def _dollars(micros):
+    return cast(micros, Float) / models.MICROS_PER_DOLLAR
+
+def _cost_tiers():
+    cost = models.CostRecord
+    archive = models.CostRecordArchive
+    return union_all(
+        select(cost.id, cost.date, cost.team_id, cost.service_id, cost.amount_micros, cost.created_at),
+        select(
+            (-archive.id).label("id"), archive.period_start.label("date"), archive.team_id,
+            archive.service_id, archive.amount_micros, archive.created_at
+        ),
+    ).subquery("cost_tiers")
+
+# Raw and archived cost records read as one CostRecord source. Archived rows
+# carry negated ids and are dated at the start of their period. Filters on
+# the alias apply to the union as a whole and are not written into either
+# branch, so this is for full scans (exports); paged reads use
+# team_costs_page_stmt.
+CostTier = aliased(models.CostRecord, _cost_tiers(), name="cost_tier")
+
+# Unique per team across both tiers and served by
+# uq_cost_records_team_date_service / uq_cost_records_archive_team_period_service
+TEAM_COSTS_PAGE_KEY = [models.CostRecord.date, models.CostRecord.service_id]
+
+def team_costs_page_stmt(
+    team_id: int,
+    start_date: date,
+    end_date: date,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    # One keyset page of the team's raw and archived rows, shaped like
+    # schemas.CostRecord. The seek, order and limit go into each tier so
+    # both are index range scans that stop after limit + 1 rows, and only
+    # those (at most twice the page) are merged and sorted.
+    after = tuple(decode_cursor(cursor, TEAM_COSTS_PAGE_KEY)) if cursor else None
+    cost = models.CostRecord
+    archive = models.CostRecordArchive
+    tiers = []
+    for table, row_id, day in ((cost, cost.id, cost.date), (archive, -archive.id, archive.period_start)):
+        tier = (
+            select(row_id.label("id"), day.label("date"), table.team_id, table.service_id, table.amount_micros)
+            .where(table.team_id == team_id, day >= start_date, day <= end_date)
+        )
+        if after is not None:
+            tier = tier.where(tuple_(day, table.service_id) > after)
+        # Wrapped so the per-tier ORDER BY / LIMIT is valid inside a UNION on SQLite
+        tiers.append(select(tier.order_by(day, table.service_id).limit(limit + 1).subquery()))
+    page = union_all(*tiers).subquery("team_cost_page")
+    return (
+        select(
+            page.c.id, page.c.date, page.c.team_id, page.c.service_id,
+            models.Service.name.label("service"), _dollars(page.c.amount_micros).label("amount"),
+        )
+        .join(models.Service, models.Service.id == page.c.service_id)
+        .order_by(page.c.date, page.c.service_id)
+        .limit(limit + 1)
+    )
+
 def get_team_costs(
     db: Session,
     team_id: int,
-    start_date: str,
-    end_date: str
-) -> List[models.CostRecord]:
-    logger.info(f"Executing database query for team {team_id}")
-    logger.info(f"Date range: {start_date} to {end_date}")
+    start_date: date,
+    end_date: date,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Tuple[List, Optional[str]]:
+    rows = db.execute(team_costs_page_stmt(team_id, start_date, end_date, limit, cursor)).all()
+    return page_result(rows, TEAM_COSTS_PAGE_KEY, limit)
+
+def iter_cost_rows(
+    db: Session,
+    team_id: Optional[int] = None,
+    service: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    batch_size: int = 5000
+):
+    # Plain column tuples fetched through a server-side cursor in batches of
+    # batch_size; no ORM instances are built and memory stays flat.
+    cost = CostTier
+    stmt = (
+        select(cost.date, cost.team_id, models.Service.name, _dollars(cost.amount_micros))
+        .join(models.Service, models.Service.id == cost.service_id)
+    )
+    if team_id is not None:
+        stmt = stmt.where(cost.team_id == team_id)
+    if service is not None:
+        stmt = stmt.where(models.Service.name == service)
+    if start_date is not None:
+        stmt = stmt.where(cost.date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(cost.date <= end_date)
+    stmt = stmt.order_by(cost.date, cost.id).execution_options(yield_per=batch_size)
+    yield from db.execute(stmt)
 
-    query = db.query(models.CostRecord).filter(
-        models.CostRecord.team_id == team_id,
-        models.CostRecord.date >= start_date,
-        models.CostRecord.date <= end_date
+def create_cost_record(db: Session, cost: schemas.CostRecordCreate) -> Optional[models.CostRecord]:
+    # A single cell through the ingest upsert: an existing (date, team,
+    # service) cell takes the new amount instead of violating the natural
+    # key, and days before the archive horizon are refused (None)
+    upsert_cost_records(db, [cost], source="cost_record")
+    record = models.CostRecord
+    return db.scalar(
+        select(record).join(record.service_entry)
+        .where(record.date == _day(cost.date), record.team_id == cost.team_id, models.Service.name == cost.service)
     )
 
-    # Log the SQL query
-    logger.info(f"SQL Query: {query}")
+def _day(value) -> date:
+    return date(value.year, value.month, value.day)
 
-    results = query.all()
-    logger.info(f"Query returned {len(results)} records")
-    return results
+def upsert_cost_records(
+    db: Session,
+    costs: Iterable[schemas.CostRecordCreate],
+    chunk_size: int = 5000,
+    commit: bool = True,
+    insert_only: bool = False,
+    insert_only_before: Optional[date] = None,
+    source: str = "ingest"
+) -> schemas.IngestResult:
+    # Idempotent bulk ingest keyed on (date, team_id, service). Records that
+    # share a key within one call are summed; a rerun of the same result set
+    # reports everything as unchanged and writes nothing. Archived periods
+    # are read-only: their raw rows are gone, so an upsert there would be
+    # added on top of the archived total.
+    # With insert_only, cells that already exist are never updated (counted
+    # as held): the caller knows its amounts are incomplete sums, which must
+    # not replace complete ones. insert_only_before does the same for the
+    # days before a date only.
+    horizon = get_archive_horizon(db)
+    cells: Dict[Tuple[date, int, str], float] = defaultdict(float)
+    skipped = 0
+    for cost in costs:
+        day = _day(cost.date)
+        if horizon is not None and day < horizon:
+            skipped += 1
+            continue
+        cells[(day, cost.team_id, cost.service)] += cost.amount
+    if skipped:
+        logger.warning(f"Skipped {skipped} cost records dated before the archive horizon {horizon}")
+
+    result = schemas.IngestResult()
+    service_ids = get_service_ids(db, {service for _, _, service in cells})
+    keys = sorted(cells)
+    for i in range(0, len(keys), chunk_size):
+        _upsert_cost_chunk(db, keys[i:i + chunk_size], cells, service_ids, result, insert_only, insert_only_before)
+    if result.changes:
+        record_cost_changes(db, source, result.changes)
 
-def create_cost_record(db: Session, cost: schemas.CostRecordCreate):
-    db_cost = models.CostRecord(**cost.dict())
-    db.add(db_cost)
+    if commit:
+        db.commit()
+    logger.info(
+        f"Ingested {len(keys)} cost cells: {result.inserted} inserted, "
+        f"{result.updated} updated, {result.unchanged} unchanged"
+        + (f", {result.held} held" if result.held else "")
+    )
+    return result
+
+def _upsert_cost_chunk(
+    db: Session,
+    keys,
+    cells,
+    service_ids: Dict[str, int],
+    result: schemas.IngestResult,
+    insert_only: bool = False,
+    insert_only_before: Optional[date] = None
+):
+    # Amounts are compared as micro-dollars, so "unchanged" is exact
+    cost = models.CostRecord
+    existing = {
+        (row.date, row.team_id, row.service_id): (row.id, row.amount_micros)
+        for row in db.execute(
+            select(cost.id, cost.date, cost.team_id, cost.service_id, cost.amount_micros)
+            .where(cost.date >= keys[0][0], cost.date <= keys[-1][0])
+        )
+    }
+
+    inserts, updates = [], []
+    deltas: Dict[Tuple[date, int, int], Tuple[int, int]] = {}
+    for key in keys:
+        day, team_id, service = key
+        service_id = service_ids[service]
+        micros = models.to_micros(cells[key])
+        cell = (day, team_id, service_id)
+        current = existing.get(cell)
+        if current is None:
+            inserts.append({"date": day, "team_id": team_id, "service_id": service_id, "amount_micros": micros})
+            deltas[cell] = (micros, 1)
+            result.changes.append((day, team_id, service, None, models.from_micros(micros)))
+        elif current[1] != micros and (insert_only or (insert_only_before is not None and day < insert_only_before)):
+            result.held += 1
+        elif current[1] != micros:
+            updates.append({"id": current[0], "amount_micros": micros})
+            deltas[cell] = (micros - current[1], 0)
+            result.changes.append((day, team_id, service, models.from_micros(current[1]), models.from_micros(micros)))
+        else:
+            result.unchanged += 1
+
+    if inserts:
+        stmt = _upsert(db, cost)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cost.team_id, cost.date, cost.service_id],
+            set_={"amount_micros": stmt.excluded.amount_micros},
+        )
+        db.execute(stmt, inserts)
+    if updates:
+        db.execute(update(cost), updates)
+    apply_cost_rollup_deltas(db, deltas)
+
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+
+def delete_cost_records_on(db: Session, days: Iterable[date], chunk_size: int = 500) -> int:
+    # Raw rows only; the caller rebuilds or adjusts the rollup
+    cost = models.CostRecord
+    days = sorted(days)
+    deleted = 0
+    for i in range(0, len(days), chunk_size):
+        deleted += db.execute(delete(cost).where(cost.date.in_(days[i:i + chunk_size]))).rowcount
+    return deleted
+
+def get_archive_horizon(db: Session) -> Optional[date]:
+    # Everything before this has been downsampled into cost_records_archive
+    return db.scalar(select(func.max(models.CostRecordArchive.period_end)))
+
+def get_data_version(db: Session) -> int:
+    return db.execute(select(func.max(models.DataChange.id))).scalar() or 0
+
+def record_data_change(
+    db: Session,
+    source: str,
+    team_id: Optional[int] = None,
+    first_day: Optional[date] = None,
+    last_day: Optional[date] = None
+):
+    # Part of the caller's transaction, so the version only moves once the
+    # change it describes is committed. Leaving the team or days unset marks
+    # the change as touching everything.
+    db.add(models.DataChange(source=source, team_id=team_id, first_day=first_day, last_day=last_day))
+
+def record_cost_changes(db: Session, source: str, changes):
+    # One data_changes row per team, spanning the days of its changed cells
+    spans: Dict[int, Tuple[date, date]] = {}
+    for day, team_id, *_ in changes:
+        first, last = spans.get(team_id, (day, day))
+        spans[team_id] = (min(first, day), max(last, day))
+    db.add_all([
+        models.DataChange(source=source, team_id=team_id, first_day=first, last_day=last)
+        for team_id, (first, last) in spans.items()
+    ])
+
+def get_data_changes(db: Session, after: int, until: int) -> List[Tuple[int, Optional[int], Optional[date], Optional[date]]]:
+    change = models.DataChange
+    return [tuple(row) for row in db.execute(
+        select(change.id, change.team_id, change.first_day, change.last_day)
+        .where(change.id > after, change.id <= until)
+        .order_by(change.id)
+    )]
+
+def get_ingest_watermarks(db: Session) -> Dict[str, date]:
+    mark = models.IngestWatermark
+    return dict(db.execute(select(mark.account, mark.watermark)).all())
+
+def set_ingest_watermarks(db: Session, accounts: Iterable[str], watermark: date):
+    # Watermarks only move forward: a catch-up window can end before an
+    # up-to-date account's watermark
+    mark = models.IngestWatermark
+    rows = [{"account": account, "watermark": watermark} for account in accounts]
+    if rows:
+        stmt = _upsert(db, mark)
+        newer = case((stmt.excluded.watermark > mark.watermark, stmt.excluded.watermark), else_=mark.watermark)
+        db.execute(stmt.on_conflict_do_update(index_elements=[mark.account], set_={"watermark": newer}), rows)
+
+def acquire_job_lease(db: Session, job: str, holder: str, lease_seconds: float, min_interval_seconds: float) -> bool:
+    # A single conditional UPDATE in the common case, so workers that lose
+    # the race skip cheaply. The row is created on a job's first run.
+    lock = models.JobLock
+    now = datetime.now(timezone.utc)
+    values = {"holder": holder, "lease_until": now + timedelta(seconds=lease_seconds), "last_started_at": now}
+    acquired = db.execute(
+        update(lock)
+        .where(
+            lock.job == job,
+            or_(lock.lease_until.is_(None), lock.lease_until < now),
+            or_(lock.last_started_at.is_(None), lock.last_started_at <= now - timedelta(seconds=min_interval_seconds)),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    if not acquired:
+        acquired = db.execute(
+            _upsert(db, lock).values(job=job, **values).on_conflict_do_nothing(index_elements=[lock.job])
+        ).rowcount == 1
+    db.commit()
+    return acquired
+
+def renew_job_lease(db: Session, job: str, holder: str, lease_seconds: float) -> bool:
+    lock = models.JobLock
+    renewed = db.execute(
+        update(lock)
+        .where(lock.job == job, lock.holder == holder)
+        .values(lease_until=datetime.now(timezone.utc) + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
     db.commit()
-    db.refresh(db_cost)
-    return db_cost
+    return renewed
+
+def release_job_lease(db: Session, job: str, holder: str):
+    lock = models.JobLock
+    db.execute(update(lock).where(lock.job == job, lock.holder == holder).values(holder=None, lease_until=None))
+    db.commit()
+
+def start_job_run(db: Session, job: str, worker: str) -> models.JobRun:
+    run = models.JobRun(job=job, worker=worker, status="running", started_at=datetime.now(timezone.utc))
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+def finish_job_run(db: Session, run_id: int, status: str, rows: Optional[int] = None, error: Optional[str] = None):
+    run = models.JobRun
+    db.execute(
+        update(run).where(run.id == run_id)
+        .values(status=status, finished_at=datetime.now(timezone.utc), rows=rows, error=error)
+    )
+    db.commit()
+
+def get_job_runs(db: Session, job: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    # Newest first
+    run = models.JobRun
+    stmt = select(run)
+    if job:
+        stmt = stmt.where(run.job == job)
+    return paginate(db, stmt, [run.id], limit, cursor, descending=True)
+
+def _upsert(db: Session, model):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def apply_cost_rollup_deltas(db: Session, deltas: Dict[Tuple[date, int, int], Tuple[int, int]]):
+    # Adds (amount_micros, record_count) to each (date, team_id, service_id)
+    # cell; the caller owns the transaction.
+    if not deltas:
+        return
+    rollup = models.CostDailyRollup
+    stmt = _upsert(db, rollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[rollup.team_id, rollup.date, rollup.service_id],
+        set_={
+            "amount_micros": rollup.amount_micros + stmt.excluded.amount_micros,
+            "record_count": rollup.record_count + stmt.excluded.record_count,
+            "updated_at": func.now(),
+        },
+    )
+    db.execute(stmt, [
+        {"date": day, "team_id": team_id, "service_id": service_id, "amount_micros": micros, "record_count": count}
+        for (day, team_id, service_id), (micros, count) in deltas.items()
+    ])
+
+    months: Dict[Tuple[date, int, int], int] = defaultdict(int)
+    for (day, team_id, service_id), (micros, _) in deltas.items():
+        months[(day.replace(day=1), team_id, service_id)] += micros
+    monthly = models.CostMonthlyRollup
+    stmt = _upsert(db, monthly)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[monthly.team_id, monthly.month, monthly.service_id],
+        set_={"amount_micros": monthly.amount_micros + stmt.excluded.amount_micros, "updated_at": func.now()},
+    )
+    db.execute(stmt, [
+        {"month": month, "team_id": team_id, "service_id": service_id, "amount_micros": micros}
+        for (month, team_id, service_id), micros in months.items()
+    ])
+
+def _month_start(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.date_trunc("month", column), Date)
+    return func.date(column, "start of month")
+
+def rebuild_cost_rollup(db: Session):
+    rollup = models.CostDailyRollup
+    monthly = models.CostMonthlyRollup
+    cost = models.CostRecord
+    db.execute(delete(rollup))
+    db.execute(insert(rollup).from_select(
+        ["date", "team_id", "service_id", "amount_micros", "record_count"],
+        select(cost.date, cost.team_id, cost.service_id, func.sum(cost.amount_micros), func.count(cost.id))
+        .where(cost.team_id.isnot(None))
+        .group_by(cost.date, cost.team_id, cost.service_id),
+    ))
+    # Only months that still have raw rows; budgets read the current one
+    month = _month_start(db, rollup.date)
+    db.execute(delete(monthly))
+    db.execute(insert(monthly).from_select(
+        ["month", "team_id", "service_id", "amount_micros"],
+        select(month, rollup.team_id, rollup.service_id, func.sum(rollup.amount_micros))
+        .group_by(month, rollup.team_id, rollup.service_id),
+    ))
+    record_data_change(db, source="rollup")
+    db.commit()
+
+def daily_costs_stmt(
+    team_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    team_ids: Optional[Sequence[int]] = None
+):
+    # (date, team_id, service, amount_micros) across the daily rollup and
+    # the archive, whose rows count on their period's first day. Filters are
+    # applied inside each branch so both stay index range scans.
+    rollup = models.CostDailyRollup
+    archive = models.CostRecordArchive
+    recent = select(rollup.date, rollup.team_id, rollup.service_id, rollup.amount_micros)
+    archived = select(
+        archive.period_start.label("date"), archive.team_id, archive.service_id, archive.amount_micros
+    )
+    if team_id is not None:
+        recent = recent.where(rollup.team_id == team_id)
+        archived = archived.where(archive.team_id == team_id)
+    if team_ids is not None:
+        recent = recent.where(rollup.team_id.in_(team_ids))
+        archived = archived.where(archive.team_id.in_(team_ids))
+    if start_date is not None:
+        recent = recent.where(rollup.date >= start_date)
+        archived = archived.where(archive.period_start >= start_date)
+    if end_date is not None:
+        recent = recent.where(rollup.date <= end_date)
+        archived = archived.where(archive.period_start <= end_date)
+    costs = union_all(recent, archived).subquery()
+    return (
+        select(costs.c.date, costs.c.team_id, models.Service.name.label("service"), costs.c.amount_micros)
+        .join(models.Service, models.Service.id == costs.c.service_id)
+    )
+
+def cost_summary_stmts(team_id: int, start_date: date, end_date: date):
+    costs = daily_costs_stmt(team_id, start_date, end_date).subquery()
+    total = func.sum(costs.c.amount_micros)
+    by_service = (
+        select(costs.c.service, _dollars(total))
+        .group_by(costs.c.service)
+        .order_by(total.desc())
+    )
+    daily = (
+        select(costs.c.date, _dollars(total))
+        .group_by(costs.c.date)
+        .order_by(costs.c.date)
+    )
+    return by_service, daily
+
+def build_cost_summary(team_id: int, start_date: date, end_date: date, by_service, daily) -> schemas.CostSummary:
+    return schemas.CostSummary(
+        team_id=team_id,
+        start_date=start_date,
+        end_date=end_date,
+        total=sum(amount for _, amount in by_service),
+        by_service=[schemas.ServiceCost(service=service, amount=amount) for service, amount in by_service],
+        daily=[schemas.DailyCost(date=day, amount=amount) for day, amount in daily],
+    )
+
+def get_team_cost_summary(db: Session, team_id: int, start_date: date, end_date: date) -> schemas.CostSummary:
+    by_service_stmt, daily_stmt = cost_summary_stmts(team_id, start_date, end_date)
+    return build_cost_summary(
+        team_id, start_date, end_date,
+        db.execute(by_service_stmt).all(),
+        db.execute(daily_stmt).all(),
+    )
+
+def get_team_forecasts(db: Session, team_id: int) -> List[Tuple[date, date, str, int, int, int]]:
+    # (as_of, date, service, amount, lower, upper) micros, by date
+    forecast = models.CostForecast
+    return db.execute(
+        select(
+            forecast.as_of, forecast.date, models.Service.name,
+            forecast.amount_micros, forecast.lower_micros, forecast.upper_micros
+        )
+        .join(models.Service, models.Service.id == forecast.service_id)
+        .where(forecast.team_id == team_id)
+        .order_by(forecast.date)
+    ).all()
+
+def get_team_anomalies(
+    db: Session,
+    team_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    # Newest first; rows shaped like schemas.CostAnomaly
+    anomaly = models.CostAnomaly
+    stmt = (
+        select(
+            anomaly.date, anomaly.service_id, models.Service.name.label("service"),
+            _dollars(anomaly.amount_micros).label("amount"), _dollars(anomaly.expected_micros).label("expected"),
+            _dollars(anomaly.lower_micros).label("lower"), _dollars(anomaly.upper_micros).label("upper"),
+            anomaly.score, anomaly.detected_at,
+        )
+        .join(models.Service, models.Service.id == anomaly.service_id)
+        .where(anomaly.team_id == team_id)
+    )
+    if start_date is not None:
+        stmt = stmt.where(anomaly.date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(anomaly.date <= end_date)
+    return paginate(db, stmt, [anomaly.date, anomaly.service_id], limit, cursor, descending=True)
+
+def create_budget(db: Session, team_id: int, budget: schemas.BudgetCreate) -> models.Budget:
+    service_id = get_service_ids(db, [budget.service])[budget.service] if budget.service else None
+    db_budget = models.Budget(
+        team_id=team_id,
+        service_id=service_id,
+        amount_micros=models.to_micros(budget.amount),
+        thresholds=",".join(str(threshold) for threshold in budget.thresholds),
+    )
+    db.add(db_budget)
+    db.commit()
+    db.refresh(db_budget)
+    return db_budget
+
+def get_budget(db: Session, budget_id: int) -> Optional[models.Budget]:
+    return db.get(models.Budget, budget_id)
+
+def get_team_budgets(db: Session, team_id: int) -> List[models.Budget]:
+    return db.scalars(select(models.Budget).where(models.Budget.team_id == team_id).order_by(models.Budget.id)).all()
+
+def delete_budget(db: Session, budget_id: int):
+    db.execute(delete(models.BudgetAlert).where(models.BudgetAlert.budget_id == budget_id))
+    db.execute(delete(models.Budget).where(models.Budget.id == budget_id))
+    db.commit()
+
+def get_budget_statuses(
+    db: Session,
+    month: date,
+    team_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    # Every budget with its month-to-date spend in one query over the
+    # monthly rollup: a team budget sums its team's services for the month,
+    # a service budget reads a single cell.
+    budget = models.Budget
+    monthly = models.CostMonthlyRollup
+    stmt = (
+        select(
+            budget.id, budget.team_id, models.Team.name.label("team"), models.Service.name.label("service"),
+            budget.amount_micros, budget.thresholds,
+            func.coalesce(func.sum(monthly.amount_micros), 0).label("spent_micros"),
+        )
+        .join(models.Team, models.Team.id == budget.team_id)
+        .outerjoin(models.Service, models.Service.id == budget.service_id)
+        .outerjoin(monthly, and_(
+            monthly.team_id == budget.team_id,
+            monthly.month == month,
+            or_(budget.service_id.is_(None), monthly.service_id == budget.service_id),
+        ))
+        .group_by(budget.id, budget.team_id, models.Team.name, models.Service.name, budget.amount_micros, budget.thresholds)
+    )
+    if team_id is not None:
+        stmt = stmt.where(budget.team_id == team_id)
+    return paginate(db, stmt, [budget.id], limit, cursor)
+
+def get_budget_alerts(
+    db: Session,
+    team_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+):
+    # Newest first
+    alert = models.BudgetAlert
+    stmt = (
+        select(alert)
+        .join(models.Budget, models.Budget.id == alert.budget_id)
+        .where(models.Budget.team_id == team_id)
+    )
+    return paginate(db, stmt, [alert.id], limit, cursor, descending=True)
 
 def get_daily_costs(
     db: Session,
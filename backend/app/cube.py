@@ -0,0 +1,315 @@
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from . import crud, models, schemas
+from .database import SessionLocal
+import numpy as np
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+COST_CUBE_ENABLED = os.getenv("COST_CUBE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class _CubeSnapshot:
+    # Immutable once built. cum[p, d] is the total of series p over the days
+    # before origin + d, so any range total is cum[p, end + 1] - cum[p, start].
+    # Only (team, service) pairs that have data get a row, which keeps the
+    # array far smaller than a dense team x service x day block.
+    def __init__(
+        self,
+        origin: date,
+        days: int,
+        team_rows: Dict[int, np.ndarray],
+        services: np.ndarray,
+        cum: np.ndarray
+    ):
+        self.origin = origin
+        self.days = days
+        self.team_rows = team_rows
+        self.services = services
+        self.cum = cum
+
+    def day_range(self, start_date: date, end_date: date) -> Optional[Tuple[int, int]]:
+        start = max((start_date - self.origin).days, 0)
+        end = min((end_date - self.origin).days, self.days - 1)
+        if start > end:
+            return None
+        return start, end
+
+
+class CostCube:
+    # In-memory team x service x day cube loaded from cost_daily_rollup and
+    # the archive tier.
+    # Queries read whichever snapshot is current; refresh() builds a new one
+    # off to the side and swaps the reference, so readers never block.
+    def __init__(self):
+        self._snapshot: Optional[_CubeSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+        # Data version the current snapshot was built from
+        self.version: Optional[int] = None
+
+    @property
+    def warm(self) -> bool:
+        return self.loaded_at is not None
+
+    def refresh(self, db: Optional[Session] = None, full: bool = False):
+        # Catches up with data_changes since the current snapshot by
+        # recomputing only the teams and days they name; a full load is used
+        # when the cube is cold or a change cannot be patched in.
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            with self._refresh_lock:
+                started = time.perf_counter()
+                # Read the version first: a change landing mid-load leaves the
+                # cube marked stale rather than silently missing it.
+                version = crud.get_data_version(db)
+                snapshot = None
+                if not full and self.warm and self.version is not None and version >= self.version:
+                    snapshot = self._patch(db, crud.get_data_changes(db, self.version, version))
+                action = "Patched"
+                if snapshot is None:
+                    snapshot = self._build(db)
+                    action = "Loaded"
+                self._snapshot = snapshot
+                self.version = version
+                self.loaded_at = time.time()
+                stats = self.stats()
+                logger.info(
+                    f"{action} cost cube: {stats['series']} series x {stats['days']} days, "
+                    f"{stats['nbytes'] / 1024 / 1024:.1f} MiB in {time.perf_counter() - started:.2f}s"
+                )
+        finally:
+            if own_session:
+                db.close()
+
+    def refresh_if_loaded(self, db: Optional[Session] = None):
+        # For writers (ingest, retention). Only a cube this process already
+        # serves from is patched; a scheduler worker that never loaded one
+        # must not build it, and API processes pick the change up from the
+        # data version on their next read (see summary).
+        if self.warm:
+            self.refresh(db)
+
+    def refresh_in_background(self):
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self._safe_refresh, name="cost-cube-refresh", daemon=True).start()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Cost cube refresh failed: {str(e)}", exc_info=True)
+
+    def _build(self, db: Session) -> Optional[_CubeSnapshot]:
+        costs = crud.daily_costs_stmt().subquery()
+        first_day, last_day = db.execute(select(func.min(costs.c.date), func.max(costs.c.date))).one()
+        if first_day is None:
+            return None
+        days = (last_day - first_day).days + 1
+
+        series: Dict[Tuple[int, str], int] = {}
+        series_idx, day_idx, amounts = array("q"), array("q"), array("q")
+        rows = db.execute(
+            select(costs.c.team_id, costs.c.service, costs.c.date, costs.c.amount_micros)
+            .execution_options(yield_per=50000)
+        )
+        for team_id, service, day, amount in rows:
+            idx = series.get((team_id, service))
+            if idx is None:
+                idx = series[(team_id, service)] = len(series)
+            series_idx.append(idx)
+            day_idx.append((day - first_day).days)
+            amounts.append(amount or 0)
+
+        # Scatter daily amounts into column day + 1, then prefix-sum along days
+        flat = np.frombuffer(series_idx, dtype=np.int64) * (days + 1) + np.frombuffer(day_idx, dtype=np.int64) + 1
+        cum = np.bincount(
+            flat,
+            weights=np.frombuffer(amounts, dtype=np.int64) / models.MICROS_PER_DOLLAR,
+            minlength=len(series) * (days + 1)
+        ).reshape(len(series), days + 1)
+        np.cumsum(cum, axis=1, out=cum)
+
+        team_lists: Dict[int, List[int]] = {}
+        services = np.empty(len(series), dtype=object)
+        for (team_id, service), idx in series.items():
+            team_lists.setdefault(team_id, []).append(idx)
+            services[idx] = service
+        team_rows = {team_id: np.array(idxs, dtype=np.int64) for team_id, idxs in team_lists.items()}
+        return _CubeSnapshot(first_day, days, team_rows, services, cum)
+
+    def _patch(self, db: Session, changes) -> Optional[_CubeSnapshot]:
+        # Re-reads the changed teams over the union of the changed days and
+        # folds the difference into a copy of the prefix sums, extending the
+        # day axis if needed. Returns None when only a full load will do: a
+        # change without a team or days, days before the origin, or a
+        # (team, service) series the cube does not have yet.
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        if not changes:
+            return snapshot
+        teams = set()
+        first_day = last_day = None
+        for _, team_id, first, last in changes:
+            if team_id is None or first is None or last is None:
+                return None
+            teams.add(team_id)
+            first_day = first if first_day is None else min(first_day, first)
+            last_day = last if last_day is None else max(last_day, last)
+        if first_day < snapshot.origin:
+            return None
+        start = (first_day - snapshot.origin).days
+        end = (last_day - snapshot.origin).days
+
+        index = {
+            (team_id, snapshot.services[idx]): idx
+            for team_id in teams for idx in snapshot.team_rows.get(team_id, ())
+        }
+        rows = sorted(set(index.values()))
+        position = {idx: pos for pos, idx in enumerate(rows)}
+        positions, day_idx, amounts = array("q"), array("q"), array("q")
+        costs = crud.daily_costs_stmt(start_date=first_day, end_date=last_day).subquery()
+        for team_id, service, day, amount in db.execute(
+            select(costs.c.team_id, costs.c.service, costs.c.date, costs.c.amount_micros)
+            .where(costs.c.team_id.in_(teams))
+        ):
+            idx = index.get((team_id, service))
+            if idx is None:
+                return None
+            positions.append(position[idx])
+            day_idx.append((day - snapshot.origin).days - start)
+            amounts.append(amount or 0)
+
+        span = end - start + 1
+        fresh = np.bincount(
+            np.frombuffer(positions, dtype=np.int64) * span + np.frombuffer(day_idx, dtype=np.int64),
+            weights=np.frombuffer(amounts, dtype=np.int64) / models.MICROS_PER_DOLLAR,
+            minlength=len(rows) * span
+        ).reshape(len(rows), span)
+
+        days = max(snapshot.days, end + 1)
+        cum = np.empty((snapshot.cum.shape[0], days + 1))
+        cum[:, :snapshot.days + 1] = snapshot.cum
+        cum[:, snapshot.days + 1:] = snapshot.cum[:, -1:]
+        if rows:
+            rows = np.array(rows, dtype=np.int64)
+            old = np.diff(cum[rows, start:end + 2], axis=1)
+            delta = np.cumsum(fresh - old, axis=1)
+            cum[rows, start + 1:end + 2] += delta
+            cum[rows, end + 2:] += delta[:, -1:]
+        return _CubeSnapshot(snapshot.origin, days, snapshot.team_rows, snapshot.services, cum)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {
+                "warm": self.warm, "series": 0, "teams": 0, "days": 0, "nbytes": 0,
+                "loaded_at": self.loaded_at, "version": self.version,
+            }
+        return {
+            "warm": True,
+            "series": int(snapshot.cum.shape[0]),
+            "teams": len(snapshot.team_rows),
+            "days": snapshot.days,
+            "origin": snapshot.origin.isoformat(),
+            "nbytes": int(snapshot.cum.nbytes + snapshot.services.nbytes
+                          + sum(rows.nbytes for rows in snapshot.team_rows.values())),
+            "loaded_at": self.loaded_at,
+            "version": self.version,
+        }
+
+    def daily(
+        self,
+        team_ids: List[int],
+        start_date: date,
+        end_date: date,
+        version: Optional[int] = None
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # (team id per series, service per series, series x day dollars) for
+        # the teams' series over [start_date, end_date], or None when the
+        # caller should use SQL (same rules as summary)
+        if not self.warm:
+            return None
+        if version is not None and version != self.version:
+            self.refresh_in_background()
+            return None
+        snapshot = self._snapshot
+        days = (end_date - start_date).days + 1
+        if snapshot is None:
+            return np.zeros(0, dtype=np.int64), np.empty(0, dtype=object), np.zeros((0, days))
+        present = [team_id for team_id in team_ids if team_id in snapshot.team_rows]
+        rows = (
+            np.concatenate([snapshot.team_rows[team_id] for team_id in present])
+            if present else np.zeros(0, dtype=np.int64)
+        )
+        teams = np.repeat(present, [len(snapshot.team_rows[team_id]) for team_id in present]).astype(np.int64)
+        daily = np.zeros((len(rows), days))
+        span = snapshot.day_range(start_date, end_date)
+        if span is not None and len(rows):
+            start, end = span
+            offset = (snapshot.origin - start_date).days + start
+            daily[:, offset:offset + end - start + 1] = np.diff(snapshot.cum[rows, start:end + 2], axis=1)
+        return teams, snapshot.services[rows], daily
+
+    def summary(
+        self,
+        team_id: int,
+        start_date: date,
+        end_date: date,
+        version: Optional[int] = None
+    ) -> Optional[schemas.CostSummary]:
+        # None means "not answerable here" and the caller should use SQL.
+        # Passing the current data version makes a stale cube decline and
+        # start rebuilding, which keeps workers coherent after another
+        # process ingests.
+        if not self.warm:
+            return None
+        if version is not None and version != self.version:
+            self.refresh_in_background()
+            return None
+        snapshot = self._snapshot
+        empty = schemas.CostSummary(
+            team_id=team_id, start_date=start_date, end_date=end_date, total=0.0, by_service=[], daily=[]
+        )
+        if snapshot is None:
+            return empty
+        rows = snapshot.team_rows.get(team_id)
+        span = snapshot.day_range(start_date, end_date)
+        if rows is None or span is None:
+            return empty
+        start, end = span
+
+        cum = snapshot.cum
+        per_service = cum[rows, end + 1] - cum[rows, start]
+        daily = np.diff(cum[rows, start:end + 2].sum(axis=0))
+
+        order = np.argsort(-per_service, kind="stable")
+        by_service = [
+            schemas.ServiceCost(service=snapshot.services[rows[i]], amount=float(per_service[i]))
+            for i in order if per_service[i] != 0
+        ]
+        daily_costs = [
+            schemas.DailyCost(date=snapshot.origin + timedelta(days=start + i), amount=float(amount))
+            for i, amount in enumerate(daily) if amount != 0
+        ]
+        return schemas.CostSummary(
+            team_id=team_id,
+            start_date=start_date,
+            end_date=end_date,
+            total=float(per_service.sum()),
+            by_service=by_service,
+            daily=daily_costs,
+        )
+
+
+cost_cube = CostCube()
@@ -0,0 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from . import crud, schemas
+from .attribution import ArnIndex, CostAggregator
+from .aws import TEAM_TAG_KEY
+import os
+import logging
+
+# pandas (and pyarrow for Parquet) are only needed by the CUR importer
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 250000
+
+# Canonical column -> names used by the legacy CSV export and by the
+# Parquet / Athena-compatible export
+CUR_COLUMNS = {
+    "usage_start": ("lineItem/UsageStartDate", "line_item_usage_start_date"),
+    "amount": ("lineItem/UnblendedCost", "line_item_unblended_cost"),
+    "resource_id": ("lineItem/ResourceId", "line_item_resource_id"),
+    "product_name": ("product/ProductName", "product_product_name"),
+    "product_code": ("lineItem/ProductCode", "line_item_product_code"),
+    "team_tag": (f"resourceTags/user:{TEAM_TAG_KEY}", f"resource_tags_user_{TEAM_TAG_KEY.lower()}"),
+}
+REQUIRED_COLUMNS = ("usage_start", "amount")
+
+Cells = Dict[Tuple[datetime, int, str], float]
+
+
+def _require_pandas():
+    if pd is None:
+        raise RuntimeError("Importing CUR files requires pandas (and pyarrow for Parquet): pip install pandas pyarrow")
+
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith(".parquet") or path.endswith(".snappy.parquet")
+
+
+def _resolve_columns(available: Sequence[str]) -> Dict[str, str]:
+    # Maps each canonical column to the name it has in this file
+    present = set(available)
+    columns = {}
+    for canonical, names in CUR_COLUMNS.items():
+        for name in names:
+            if name in present:
+                columns[canonical] = name
+                break
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ValueError(f"Not a CUR file, missing columns: {', '.join(missing)}")
+    return columns
+
+
+def iter_cur_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator["pd.DataFrame"]:
+    # Yields frames of at most chunk_rows rows with canonical column names,
+    # reading only the columns the importer uses.
+    _require_pandas()
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        columns = _resolve_columns(parquet.schema_arrow.names)
+        renames = {name: canonical for canonical, name in columns.items()}
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=list(columns.values())):
+            yield batch.to_pandas().rename(columns=renames)
+    else:
+        header = pd.read_csv(path, nrows=0, compression="infer")
+        columns = _resolve_columns(header.columns)
+        renames = {name: canonical for canonical, name in columns.items()}
+        reader = pd.read_csv(
+            path,
+            usecols=list(columns.values()),
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_rows,
+            compression="infer",
+        )
+        for chunk in reader:
+            yield chunk.rename(columns=renames)
+
+
+def _usage_days(values: "pd.Series") -> "pd.Series":
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        return values.dt.normalize()
+    # ISO 8601 strings (2024-01-31T00:00:00Z); the day is the first 10 chars
+    return pd.to_datetime(values.astype(str).str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+
+
+def aggregate_chunk(
+    frame: "pd.DataFrame",
+    team_ids: Dict[str, int],
+    index: ArnIndex,
+    cells: Cells
+) -> Tuple[int, float]:
+    # Resolves each line item to a team (Team tag first, then the resource's
+    # ARN), sums per (day, team, service) with a groupby and folds the result
+    # into cells. Per-row Python work is limited to the distinct resource ids.
+    # Returns (line items left unattributed, their amount).
+    amount = pd.to_numeric(frame["amount"], errors="coerce").fillna(0.0)
+    day = _usage_days(frame["usage_start"])
+
+    service = pd.Series(None, index=frame.index, dtype=object)
+    for column in ("product_name", "product_code"):
+        if column in frame:
+            values = frame[column]
+            service = service.fillna(values.mask(values == ""))
+    service = service.fillna("Unknown")
+
+    team = pd.Series(float("nan"), index=frame.index)
+    if "team_tag" in frame:
+        team = frame["team_tag"].map(team_ids)
+    if "resource_id" in frame and team.isna().any():
+        resource_ids = frame["resource_id"].where(team.isna())
+        resolved = {rid: index.resolve(rid) for rid in resource_ids.dropna().unique() if rid}
+        team = team.fillna(resource_ids.map(resolved))
+
+    attributed = team.notna() & day.notna()
+    unattributed = int((~attributed).sum())
+    unattributed_amount = float(amount[~attributed].sum())
+
+    grouped = (
+        pd.DataFrame({
+            "day": day[attributed],
+            "team_id": team[attributed].astype("int64"),
+            "service": service[attributed],
+            "amount": amount[attributed],
+        })
+        .groupby(["day", "team_id", "service"], sort=False)["amount"]
+        .sum()
+    )
+    for (day_value, team_id, service_name), total in grouped.items():
+        key = (day_value.to_pydatetime(), int(team_id), service_name)
+        cells[key] = cells.get(key, 0.0) + float(total)
+    return unattributed, unattributed_amount
+
+
+# Per-process state for pool workers, set once by _init_worker so the team
+# map and ARN index are not re-pickled for every file.
+_worker_team_ids: Dict[str, int] = {}
+_worker_index: Optional[ArnIndex] = None
+
+
+def _init_worker(team_ids: Dict[str, int], index: ArnIndex):
+    global _worker_team_ids, _worker_index
+    _worker_team_ids = team_ids
+    _worker_index = index
+
+
+def aggregate_file(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Tuple[Cells, Dict]:
+    # Runs in a pool worker. Memory is one chunk plus the file's distinct
+    # (day, team, service) cells.
+    cells: Cells = {}
+    stats = {"path": path, "line_items": 0, "unattributed": 0, "unattributed_amount": 0.0}
+    for frame in iter_cur_chunks(path, chunk_rows):
+        unattributed, unattributed_amount = aggregate_chunk(frame, _worker_team_ids, _worker_index, cells)
+        stats["line_items"] += len(frame)
+        stats["unattributed"] += unattributed
+        stats["unattributed_amount"] += unattributed_amount
+    return cells, stats
+
+
+def import_cur_files(
+    db: Session,
+    paths: List[str],
+    workers: Optional[int] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    dry_run: bool = False
+) -> schemas.IngestResult:
+    # Files are aggregated in parallel and merged into one CostAggregator,
+    # so the parts of a multi-file report sum into the same cells before a
+    # single idempotent upsert. Re-importing a restated month overwrites its
+    # cells with the new totals.
+    _require_pandas()
+    team_ids = crud.get_team_ids_by_name(db)
+    index = ArnIndex.load(db)
+    workers = min(workers or os.cpu_count() or 1, len(paths)) or 1
+
+    aggregator = CostAggregator()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(team_ids, index)) as pool:
+        futures = {pool.submit(aggregate_file, path, chunk_rows): path for path in paths}
+        for future in as_completed(futures):
+            cells, stats = future.result()
+            for (day, team_id, service), amount in cells.items():
+                aggregator.add(day, team_id, service, amount)
+            logger.info(
+                f"Aggregated {stats['line_items']} line items from {stats['path']} into {len(cells)} cells "
+                f"({stats['unattributed']} unattributed, ${stats['unattributed_amount']:.2f})"
+            )
+
+    if dry_run:
+        logger.info(f"Dry run: {len(aggregator)} cost cells not written")
+        return schemas.IngestResult()
+    return crud.upsert_cost_records(db, aggregator.records())
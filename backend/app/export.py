@@ -0,0 +1,59 @@
+from datetime import date
+from typing import Iterator, Optional
+from . import crud
+from .database import SessionLocal
+import csv
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ["date", "team_id", "service", "amount"]
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+# Rows are buffered into chunks of roughly this many bytes before being
+# handed to the response, instead of one write per row.
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_cost_export(
+    fmt: str,
+    team_id: Optional[int] = None,
+    service: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Iterator[str]:
+    # The generator owns its session: request-scoped dependencies are
+    # already closed by the time a StreamingResponse body is iterated.
+    db = SessionLocal()
+    rows = 0
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+
+        for day, row_team_id, row_service, amount in crud.iter_cost_rows(
+            db, team_id=team_id, service=service, start_date=start_date, end_date=end_date
+        ):
+            day = day.strftime("%Y-%m-%d")
+            if writer:
+                writer.writerow((day, row_team_id, row_service, amount))
+            else:
+                buffer.write(json.dumps(
+                    {"date": day, "team_id": row_team_id, "service": row_service, "amount": amount}
+                ))
+                buffer.write("\n")
+            rows += 1
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+        logger.info(f"Exported {rows} cost records as {fmt}")
+    finally:
+        db.close()
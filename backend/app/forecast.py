@@ -0,0 +1,220 @@
+from array import array
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from . import crud, models, schemas
+from .database import SessionLocal
+import numpy as np
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Days of history each series is fitted on
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "90"))
+# Days projected past the last day of data; must reach the end of the month
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "35"))
+# A day's weight in the fit halves every this many days back
+FORECAST_HALF_LIFE_DAYS = float(os.getenv("FORECAST_HALF_LIFE_DAYS", "28"))
+
+# Per-day damping of the extrapolated trend, so a slope fitted on a few
+# weeks does not run away over the horizon
+TREND_DAMPING = 0.98
+# Width of the prediction interval in residual standard deviations (~95%)
+INTERVAL_Z = 1.96
+INSERT_BATCH_SIZE = 50000
+
+
+def load_history(db: Session, as_of: date, days: int = FORECAST_HISTORY_DAYS):
+    # Dense (series x day) dollar matrix over up to `days` days ending at
+    # as_of, with the team and service id of each row, the first day, and
+    # which cells have a row at all. The window starts no earlier than the
+    # data does, so a short history is not read as weeks of zero spend.
+    rollup = models.CostDailyRollup
+    first_day = db.scalar(
+        select(func.min(rollup.date)).where(rollup.date >= as_of - timedelta(days=days - 1))
+    ) or as_of
+    days = (as_of - first_day).days + 1
+    team_ids, service_ids, day_idx, amounts = array("q"), array("q"), array("q"), array("q")
+    for day, team_id, service_id, amount in db.execute(
+        select(rollup.date, rollup.team_id, rollup.service_id, rollup.amount_micros)
+        .where(rollup.date >= first_day, rollup.date <= as_of)
+        .execution_options(yield_per=50000)
+    ):
+        team_ids.append(team_id)
+        service_ids.append(service_id)
+        day_idx.append((day - first_day).days)
+        amounts.append(amount or 0)
+
+    teams = np.frombuffer(team_ids, dtype=np.int64)
+    services = np.frombuffer(service_ids, dtype=np.int64)
+    keys, series = np.unique(np.stack([teams, services], axis=1), axis=0, return_inverse=True)
+    cells = series.reshape(-1) * days + np.frombuffer(day_idx, dtype=np.int64)
+    history = np.bincount(
+        cells,
+        weights=np.frombuffer(amounts, dtype=np.int64) / models.MICROS_PER_DOLLAR,
+        minlength=len(keys) * days
+    ).reshape(len(keys), days)
+    present = np.bincount(cells, minlength=len(keys) * days).reshape(len(keys), days) > 0
+    return keys[:, 0], keys[:, 1], first_day, history, present
+
+
+def _design(first_day: date, offsets: np.ndarray, n: int) -> np.ndarray:
+    # Intercept, linear trend and a dummy per weekday but one. Short
+    # histories drop the weekday terms, then the trend.
+    columns = [np.ones(len(offsets))]
+    if n >= 3:
+        columns.append(offsets / max(n - 1, 1))
+    if n >= 14:
+        weekdays = (first_day.weekday() + offsets.astype(np.int64)) % 7
+        columns.extend((weekdays == d).astype(float) for d in range(1, 7))
+    return np.stack(columns, axis=1)
+
+
+def fit_forecasts(
+    history: np.ndarray,
+    first_day: date,
+    horizon: int = FORECAST_HORIZON_DAYS,
+    half_life: float = FORECAST_HALF_LIFE_DAYS
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Weekday-seasonal linear trend fitted by exponentially weighted least
+    # squares. Every series shares the same design matrix, so one solve of
+    # the normal equations fits all of them at once. Returns (forecast,
+    # lower, upper), each series x horizon, in dollars and never negative.
+    series, n = history.shape
+    if series == 0 or n == 0:
+        empty = np.zeros((series, horizon))
+        return empty, empty, empty
+    past = np.arange(n, dtype=float)
+    X = _design(first_day, past, n)
+    w = 0.5 ** ((n - 1 - past) / half_life)
+    Xw = X * w[:, None]
+    beta = np.linalg.lstsq(Xw.T @ X, Xw.T @ history.T, rcond=None)[0]
+
+    residuals = history.T - X @ beta
+    sigma = np.sqrt((w[:, None] * residuals ** 2).sum(axis=0) / w.sum())
+
+    # Future days take the trend at the last observed day plus a damped
+    # continuation of its slope
+    steps = np.arange(1, horizon + 1)
+    damped = n - 1 + np.cumsum(TREND_DAMPING ** steps)
+    future = _design(first_day, np.arange(n, n + horizon, dtype=float), n)
+    if X.shape[1] > 1:
+        future[:, 1] = damped / max(n - 1, 1)
+    forecast = (future @ beta).T
+    lower = np.clip(forecast - INTERVAL_Z * sigma[:, None], 0, None)
+    upper = np.clip(forecast + INTERVAL_Z * sigma[:, None], 0, None)
+    return np.clip(forecast, 0, None), lower, upper
+
+
+def _micros(values: np.ndarray) -> np.ndarray:
+    return np.rint(values * models.MICROS_PER_DOLLAR).astype(np.int64)
+
+
+def refresh_forecasts(db: Session, as_of: Optional[date] = None) -> int:
+    # Refits every series on data up to as_of (default: the last day with
+    # data) and replaces cost_forecasts in one transaction.
+    rollup = models.CostDailyRollup
+    if as_of is None:
+        as_of = db.scalar(select(func.max(rollup.date)).where(rollup.date <= date.today()))
+    forecasts = models.CostForecast
+    db.execute(delete(forecasts))
+    if as_of is None:
+        db.commit()
+        return 0
+
+    started = time.perf_counter()
+    team_ids, service_ids, first_day, history, _ = load_history(db, as_of)
+    forecast, lower, upper = fit_forecasts(history, first_day)
+    fitted = time.perf_counter()
+
+    amount, low, high = _micros(forecast), _micros(lower), _micros(upper)
+    # Series projected at nothing for the whole horizon are not stored
+    keep = np.flatnonzero(high.max(axis=1) > 0)
+    days = [as_of + timedelta(days=h) for h in range(1, forecast.shape[1] + 1)]
+    rows = []
+    written = 0
+    for idx in keep.tolist():
+        team_id, service_id = int(team_ids[idx]), int(service_ids[idx])
+        rows.extend(
+            {
+                "date": day, "team_id": team_id, "service_id": service_id, "amount_micros": a,
+                "lower_micros": lo, "upper_micros": hi, "as_of": as_of,
+            }
+            for day, a, lo, hi in zip(days, amount[idx].tolist(), low[idx].tolist(), high[idx].tolist())
+        )
+        if len(rows) >= INSERT_BATCH_SIZE:
+            db.execute(insert(forecasts), rows)
+            written += len(rows)
+            rows = []
+    if rows:
+        db.execute(insert(forecasts), rows)
+        written += len(rows)
+    db.commit()
+    logger.info(
+        f"Forecast {len(keep)} series x {len(days)} days as of {as_of}: "
+        f"fit in {fitted - started:.2f}s, {time.perf_counter() - started:.2f}s total"
+    )
+    return written
+
+
+def run_forecasts() -> int:
+    # Scheduled entry point, run after each ingest
+    db = SessionLocal()
+    try:
+        return refresh_forecasts(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def team_forecast(db: Session, team_id: int, today: Optional[date] = None) -> schemas.CostForecast:
+    # Month-end projection for the current month: actual spend up to the
+    # forecast's as_of day plus the forecast for the rest of the month. The
+    # range sums the daily bounds, so it errs on the wide side.
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=monthrange(today.year, today.month)[1])
+    rows = crud.get_team_forecasts(db, team_id)
+    as_of = rows[0][0] if rows else None
+    actual_end = min(as_of or today, month_end)
+    actual = crud.get_team_cost_summary(db, team_id, month_start, actual_end)
+
+    projected = {item.service: item.amount for item in actual.by_service}
+    lower = upper = total = actual.total
+    daily = {}
+    for _, day, service, amount, low, high in rows:
+        amount, low, high = (models.from_micros(value) for value in (amount, low, high))
+        entry = daily.setdefault(day, [0.0, 0.0, 0.0])
+        entry[0] += amount
+        entry[1] += low
+        entry[2] += high
+        if month_start <= day <= month_end:
+            projected[service] = projected.get(service, 0.0) + amount
+            total += amount
+            lower += low
+            upper += high
+
+    return schemas.CostForecast(
+        team_id=team_id,
+        as_of=as_of,
+        month_start=month_start,
+        month_end=month_end,
+        month_to_date=actual.total,
+        projected_total=total,
+        projected_lower=lower,
+        projected_upper=upper,
+        by_service=[
+            schemas.ServiceCost(service=service, amount=amount)
+            for service, amount in sorted(projected.items(), key=lambda item: -item[1])
+        ],
+        daily=[
+            schemas.ForecastDay(date=day, amount=amount, lower=low, upper=high)
+            for day, (amount, low, high) in sorted(daily.items())
+        ],
+    )
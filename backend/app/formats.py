@@ -0,0 +1,128 @@
+from datetime import date
+from typing import Callable, Dict, Optional, Sequence
+from fastapi import HTTPException, status
+from .compression import quality_values
+import numpy as np
+
+# Binary encodings are optional: msgpack for MessagePack and pyarrow for
+# Arrow IPC. Without them those media types are simply not offered.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+# Other media types clients send for the same formats
+ALIASES = {
+    "application/x-msgpack": "application/msgpack",
+    "application/vnd.msgpack": "application/msgpack",
+}
+
+Encoders = Dict[str, Callable[[object], bytes]]
+
+
+def available(fmt: str) -> bool:
+    if fmt == "msgpack":
+        return msgpack is not None
+    if fmt == "arrow":
+        return pa is not None
+    return fmt in MEDIA_TYPES
+
+
+def negotiate(accept: Optional[str], formats: Sequence[str]) -> str:
+    # Picks the format the Accept header rates highest among `formats` that
+    # are installed, matching the most specific media range; ties go to the
+    # earlier format, so "*/*" and a missing header get the first (JSON).
+    offered = [fmt for fmt in formats if available(fmt)]
+    if not accept:
+        return offered[0]
+    ranges = [(ALIASES.get(media_range, media_range), quality) for media_range, quality in quality_values(accept)]
+    best, best_quality = None, 0.0
+    for fmt in offered:
+        media_type = MEDIA_TYPES[fmt]
+        quality, specificity = 0.0, -1
+        for media_range, range_quality in ranges:
+            if media_range == media_type:
+                match = 2
+            elif media_range == media_type.split("/")[0] + "/*":
+                match = 1
+            elif media_range == "*/*":
+                match = 0
+            else:
+                continue
+            if match > specificity:
+                quality, specificity = range_quality, match
+        if quality > best_quality:
+            best, best_quality = fmt, quality
+    if best is None:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail=f"Available media types: {', '.join(MEDIA_TYPES[fmt] for fmt in offered)}"
+        )
+    return best
+
+
+def _msgpack_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def packb(value) -> bytes:
+    # Dates go out as ISO strings, as in the JSON responses
+    return msgpack.packb(value, default=_msgpack_default)
+
+
+def arrow_stream(table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def model_json(model) -> bytes:
+    return model.model_dump_json().encode()
+
+
+def model_msgpack(model) -> bytes:
+    return packb(model.model_dump())
+
+
+def cost_page_arrow(page) -> bytes:
+    # One record batch with a column per CostRecord field; the next cursor
+    # travels in the schema metadata
+    items = page.items
+    table = pa.table({
+        "id": pa.array([item.id for item in items], pa.int64()),
+        "date": pa.array([item.date for item in items], pa.timestamp("us")),
+        "team_id": pa.array([item.team_id for item in items], pa.int64()),
+        "service": pa.array([item.service for item in items], pa.string()).dictionary_encode(),
+        "amount": pa.array([item.amount for item in items], pa.float64()),
+    })
+    if page.next_cursor:
+        table = table.replace_schema_metadata({"next_cursor": page.next_cursor})
+    return arrow_stream(table)
+
+
+MODEL_ENCODERS: Encoders = {
+    "json": model_json,
+    "msgpack": model_msgpack,
+}
+COST_PAGE_ENCODERS: Encoders = {
+    "json": model_json,
+    "msgpack": model_msgpack,
+    "arrow": cost_page_arrow,
+}
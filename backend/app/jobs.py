@@ -0,0 +1,83 @@
+from typing import Callable, NamedTuple, Optional, Union
+from . import crud, metrics
+from .database import SessionLocal
+import os
+import socket
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in job_locks and job_runs
+WORKER_ID = os.getenv("JOB_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+# A crashed worker's lease lapses after this long; a running job keeps
+# renewing its own
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+ERROR_MAX_LENGTH = 2000
+
+
+class JobOutcome(NamedTuple):
+    # Returned instead of a row count by a job that completed but should not
+    # be recorded as a plain success, e.g. "partial" with what was missed
+    rows: Optional[int]
+    status: str
+    error: Optional[str] = None
+
+
+def run_exclusive(
+    job: str,
+    func: Callable[[], Union[Optional[int], JobOutcome]],
+    min_interval_seconds: float
+) -> bool:
+    # Runs func only if this worker wins the job's lease in job_locks, and
+    # records the run in job_runs. func returns the number of rows it wrote,
+    # None, or a JobOutcome. Returns whether this worker ran the job; losers
+    # return after one UPDATE.
+    db = SessionLocal()
+    try:
+        if not crud.acquire_job_lease(db, job, WORKER_ID, JOB_LEASE_SECONDS, min_interval_seconds):
+            logger.info(f"Skipping job {job}: another worker holds it or ran it recently")
+            metrics.JOB_RUNS.inc(job, "skipped")
+            return False
+
+        run = crud.start_job_run(db, job, WORKER_ID)
+        logger.info(f"Running job {job} (run {run.id})")
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_renew_lease, args=(job, stop), name=f"job-lease-{job}", daemon=True)
+        heartbeat.start()
+        status, rows, error = "failure", None, None
+        try:
+            with metrics.JOB_RUN_SECONDS.time(job):
+                outcome = func()
+            if isinstance(outcome, JobOutcome):
+                rows, status, error = outcome
+            else:
+                rows, status = outcome, "success"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:ERROR_MAX_LENGTH]
+            logger.error(f"Job {job} failed: {error}", exc_info=True)
+        finally:
+            stop.set()
+            heartbeat.join()
+            db.rollback()
+            crud.finish_job_run(db, run.id, status, rows, error)
+            crud.release_job_lease(db, job, WORKER_ID)
+            metrics.JOB_RUNS.inc(job, status)
+        logger.info(f"Job {job} finished: {status}, {rows if rows is not None else 'n/a'} rows")
+        return True
+    finally:
+        db.close()
+
+
+def _renew_lease(job: str, stop: threading.Event):
+    db = SessionLocal()
+    try:
+        while not stop.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                if not crud.renew_job_lease(db, job, WORKER_ID, JOB_LEASE_SECONDS):
+                    logger.error(f"Lost the lease on job {job}; another worker may start it")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Could not renew the lease on job {job}: {e}")
+    finally:
+        db.close()
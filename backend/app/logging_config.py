@@ -0,0 +1,195 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Sequence
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+import uuid
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for structured output, "text" for human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE")
+# Fraction of records below WARNING that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Per call site cap on records below ERROR; 0 disables rate limiting
+LOG_RATE_LIMIT_PER_SECOND = float(os.getenv("LOG_RATE_LIMIT_PER_SECOND", "50"))
+LOG_RATE_LIMIT_BURST = float(os.getenv("LOG_RATE_LIMIT_BURST", "100"))
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_STANDARD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "request_id"}
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_listener: Optional[QueueListener] = None
+access_logger = logging.getLogger("app.access")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            payload["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class ContextFilter(logging.Filter):
+    # Runs on the calling thread, where the request's context is visible
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # Records from the `exempt` loggers (the access log) are always kept
+    def __init__(self, rate: float, exempt: Sequence[str] = ()):
+        super().__init__()
+        self.rate = rate
+        self.exempt = frozenset(exempt)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (
+            record.levelno >= logging.WARNING or self.rate >= 1.0
+            or record.name in self.exempt or random.random() < self.rate
+        )
+
+
+class RateLimitFilter(logging.Filter):
+    # Token bucket per call site, so one chatty line cannot flood the queue.
+    # Updates are unsynchronized; an occasional extra record is acceptable.
+    # The `exempt` loggers are never limited: every access record comes from
+    # the same call site, one per request.
+    def __init__(self, per_second: float, burst: float, exempt: Sequence[str] = ()):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        self.exempt = frozenset(exempt)
+        self._buckets = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or self.per_second <= 0 or record.name in self.exempt:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.per_second)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+class _StructuredQueueHandler(QueueHandler):
+    # The stock prepare() flattens the record into a formatted string. Keep
+    # the structured fields and only resolve what cannot cross threads.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+def setup_logging():
+    # Application code only pays for a queue put; formatting and I/O happen
+    # on the listener thread.
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "json":
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
+
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE, exempt=[access_logger.name]))
+    queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT_PER_SECOND, LOG_RATE_LIMIT_BURST, exempt=[access_logger.name]))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestContextMiddleware:
+    # Pure ASGI so it adds no task or buffering to streamed responses.
+    # Assigns a request id (honouring a sane incoming X-Request-ID), exposes
+    # it to log records and emits one timed access record per request.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            access_logger.info(
+                "%s %s %d",
+                scope["method"], scope["path"], status_code,
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 3),
+                }
+            )
+            request_id_var.reset(token)
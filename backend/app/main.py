@@ -1,37 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import models, schemas, crud, auth
-from .database import engine, get_db
-from typing import List
+from . import models, schemas, crud, async_crud, auth, budgets, columnar, export, forecast, formats, metrics
+from .cache import Scope, cached_json, data_version
+from .compression import CompressionMiddleware
+from .cube import COST_CUBE_ENABLED, cost_cube
+from .pagination import (
+    DEFAULT_COST_PAGE_SIZE, DEFAULT_PAGE_SIZE, MAX_COST_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor
+)
+from .database import engine, get_async_db, get_db
+from .logging_config import RequestContextMiddleware, setup_logging
+from typing import List, Literal, Optional
 from pydantic import BaseModel
-from datetime import timedelta
+from datetime import date, timedelta
+import anyio
 import logging
+import os
 
 models.Base.metadata.create_all(bind=engine)
 
-# Configure logging with more detailed format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Add a file handler to save logs
-file_handler = logging.FileHandler('app.log')
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
-
-# Also log to console
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-logger.addHandler(console_handler)
-
 app = FastAPI()
 
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(CompressionMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -41,6 +39,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def configure_threadpool():
+    # Sync endpoints share AnyIO's default limiter (40 threads); size it to
+    # the connection pool rather than letting requests queue behind it.
+    threadpool_size = os.getenv("THREADPOOL_SIZE")
+    if threadpool_size:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(threadpool_size)
+
+@app.on_event("startup")
+def warm_cost_cube():
+    # Loaded off the request path; summaries fall back to SQL until warm
+    if COST_CUBE_ENABLED:
+        cost_cube.refresh_in_background()
+
+# Run scheduled jobs inside every API worker. Off by default: run
+# scripts/run_worker.py instead. Either way each firing runs once, on
+# whichever process takes the job's lease.
+SCHEDULER_IN_API = os.getenv("SCHEDULER_IN_API", "false").lower() in ("1", "true", "yes")
+_scheduler = None
+
+BATCH_MAX_TEAMS = int(os.getenv("BATCH_MAX_TEAMS", "1000"))
+
+@app.on_event("startup")
+def start_jobs():
+    global _scheduler
+    if SCHEDULER_IN_API:
+        from .scheduler import start_scheduler
+        _scheduler = start_scheduler()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+
+@app.exception_handler(InvalidCursor)
+def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": str(exc)})
+
 class LoginRequest(BaseModel):
     email: str
     password: str
@@ -61,8 +97,8 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
         user = auth.get_current_active_user(user)
 
         # Create token
-        access_token = auth.create_access_token(
-            data={"sub": str(user.id)},
+        access_token = auth.create_user_access_token(
+            user,
             expires_delta=timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
         )
 
@@ -94,8 +130,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Check if this is the first user
-    all_users = crud.get_users(db, skip=0, limit=1)
-    if not all_users:
+    if not crud.has_users(db):
         user.role = models.UserRole.ADMIN
 
     return crud.create_user(db=db, user=user)
@@ -104,116 +139,314 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
 
-@app.get("/users", response_model=List[schemas.User])
+@app.get("/users", response_model=schemas.Page[schemas.User])
 def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     auth.admin_required(current_user)
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
-
-@app.get("/teams", response_model=List[schemas.Team])
-def read_teams(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    users, next_cursor = crud.get_users(db, limit=limit, cursor=cursor)
+    return {"items": users, "next_cursor": next_cursor}
+
+@app.get("/teams", response_model=schemas.Page[schemas.Team])
+async def read_teams(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    teams = crud.get_teams(db, skip=skip, limit=limit)
-    return teams
+    async def produce():
+        teams, next_cursor = await async_crud.get_teams(db, limit=limit, cursor=cursor)
+        return schemas.Page[schemas.Team].model_validate(
+            {"items": teams, "next_cursor": next_cursor}, from_attributes=True
+        )
+    return await cached_json(request, produce)
 
 @app.post("/teams", response_model=schemas.Team)
 def create_team(
     team: schemas.TeamCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     auth.admin_required(current_user)
-    return crud.create_team(db=db, team=team)
+    db_team = crud.create_team(db=db, team=team)
+    data_version.invalidate()
+    return db_team
 
-@app.get("/resources", response_model=List[schemas.AWSResource])
+@app.get("/resources", response_model=schemas.Page[schemas.AWSResource])
 def read_resources(
-    skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     auth.team_lead_required(current_user)
-    resources = crud.get_resources(db, skip=skip, limit=limit)
-    return resources
+    resources, next_cursor = crud.get_aws_resources(db, limit=limit, cursor=cursor)
+    return {"items": resources, "next_cursor": next_cursor}
 
 @app.put("/resources/{resource_id}/team/{team_id}")
 def update_resource_team(
     resource_id: int,
     team_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     auth.team_lead_required(current_user)
-    return crud.update_resource_team(db=db, resource_id=resource_id, team_id=team_id)
+    return crud.update_aws_resource_team(db=db, resource_id=resource_id, team_id=team_id)
 
 @app.put("/users/{user_id}/team/{team_id}")
 def update_user_team(
     user_id: int,
     team_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
     auth.admin_required(current_user)
-    return crud.update_user_team(db=db, user_id=user_id, team_id=team_id)
+    db_user = crud.update_user_team(db=db, user_id=user_id, team_id=team_id)
+    if db_user:
+        auth.token_versions.update(db_user)
+    return db_user
+
+@app.get("/teams/{team_id}/costs/summary", response_model=schemas.CostSummary)
+async def read_team_cost_summary(
+    request: Request,
+    team_id: int,
+    start_date: date,
+    end_date: date,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    auth.team_access_required(current_user, team_id)
+
+    async def produce():
+        summary = cost_cube.summary(team_id, start_date, end_date, version=data_version.peek())
+        if summary is None:
+            summary = await async_crud.get_team_cost_summary(db, team_id=team_id, start_date=start_date, end_date=end_date)
+        return summary
+    return await cached_json(
+        request, produce, Scope(team_id, start_date, end_date), encoders=formats.MODEL_ENCODERS
+    )
+
+@app.get("/teams/{team_id}/forecast", response_model=schemas.CostForecast)
+def read_team_forecast(
+    team_id: int,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    # Precomputed by the forecasting stage after each ingest
+    auth.team_access_required(current_user, team_id)
+    return forecast.team_forecast(db, team_id)
+
+@app.get("/teams/{team_id}/anomalies", response_model=schemas.Page[schemas.CostAnomaly])
+def read_team_anomalies(
+    team_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    # Newest first
+    auth.team_access_required(current_user, team_id)
+    anomalies, next_cursor = crud.get_team_anomalies(
+        db, team_id, start_date=start_date, end_date=end_date, limit=limit, cursor=cursor
+    )
+    return {"items": anomalies, "next_cursor": next_cursor}
+
+@app.get("/teams/{team_id}/budgets", response_model=List[schemas.Budget])
+def read_team_budgets(
+    team_id: int,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    auth.team_access_required(current_user, team_id)
+    return crud.get_team_budgets(db, team_id)
+
+@app.post("/teams/{team_id}/budgets", response_model=schemas.Budget)
+def create_team_budget(
+    team_id: int,
+    budget: schemas.BudgetCreate,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    auth.team_lead_required(current_user)
+    auth.team_access_required(current_user, team_id)
+    if not crud.get_team(db, team_id):
+        raise HTTPException(status_code=404, detail="Team not found")
+    db_budget = crud.create_budget(db, team_id, budget)
+    # Spend already recorded this month may have reached its thresholds
+    budgets.evaluate_budgets(db, budgets.month_cells(db, budgets.month_start(), team_id))
+    db.commit()
+    return db_budget
+
+@app.delete("/budgets/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_budget(
+    budget_id: int,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    auth.team_lead_required(current_user)
+    db_budget = crud.get_budget(db, budget_id)
+    if not db_budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    auth.team_access_required(current_user, db_budget.team_id)
+    crud.delete_budget(db, budget_id)
 
-@app.get("/teams/{team_id}/costs", response_model=List[schemas.CostRecord])
-def read_team_costs(
+@app.get("/budgets/status", response_model=schemas.Page[schemas.BudgetStatus])
+def read_budget_status(
+    month: Optional[date] = None,
+    team_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    # Admins see every team's budgets; everyone else only their own team's
+    if current_user.role != models.UserRole.ADMIN:
+        team_id = current_user.team_id
+        if team_id is None:
+            return {"items": [], "next_cursor": None}
+    month = budgets.month_start(month)
+    rows, next_cursor = crud.get_budget_statuses(db, month, team_id=team_id, limit=limit, cursor=cursor)
+    return {"items": [budgets.budget_status(row, month) for row in rows], "next_cursor": next_cursor}
+
+@app.get("/teams/{team_id}/budgets/alerts", response_model=schemas.Page[schemas.BudgetAlert])
+def read_budget_alerts(
     team_id: int,
-    start_date: str,
-    end_date: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: Session = Depends(get_db)
+):
+    # Newest first
+    auth.team_access_required(current_user, team_id)
+    alerts, next_cursor = crud.get_budget_alerts(db, team_id, limit=limit, cursor=cursor)
+    return {"items": alerts, "next_cursor": next_cursor}
+
+@app.get("/admin/cube", response_model=schemas.CubeStats)
+def read_cube_stats(current_user: auth.TokenPrincipal = Depends(auth.get_current_principal)):
+    auth.admin_required(current_user)
+    return cost_cube.stats()
+
+@app.get("/admin/jobs/runs", response_model=schemas.Page[schemas.JobRun])
+def read_job_runs(
+    job: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
     db: Session = Depends(get_db)
 ):
-    logger.info("="*80)
-    logger.info("NEW COST REQUEST RECEIVED")
-    logger.info("="*80)
-    logger.info(f"Request Details:")
-    logger.info(f"  Team ID: {team_id}")
-    logger.info(f"  Start Date: {start_date}")
-    logger.info(f"  End Date: {end_date}")
-    logger.info(f"  User: {current_user.email} (Role: {current_user.role})")
-    logger.info(f"  User's Team ID: {current_user.team_id}")
-    logger.info("="*80)
+    # Newest first
+    auth.admin_required(current_user)
+    runs, next_cursor = crud.get_job_runs(db, job=job, limit=limit, cursor=cursor)
+    return {"items": runs, "next_cursor": next_cursor}
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(auth.metrics_access_required)])
+def read_metrics():
+    # Prometheus text exposition, for admins or a scraper holding METRICS_TOKEN
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/costs/export")
+def export_costs(
+    format: Literal["csv", "ndjson"] = "csv",
+    team_id: Optional[int] = None,
+    service: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal)
+):
+    # Non-admins can only export their own team; without a team there is
+    # nothing they may export (team_id=None would mean every team)
+    if current_user.role != models.UserRole.ADMIN:
+        if current_user.team_id is None or (team_id is not None and team_id != current_user.team_id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this team's costs"
+            )
+        team_id = current_user.team_id
+
+    filename = f"costs-{team_id or 'all'}-{start_date or 'start'}-{end_date or 'end'}.{format}"
+    return StreamingResponse(
+        export.stream_cost_export(
+            format,
+            team_id=team_id,
+            service=service,
+            start_date=start_date,
+            end_date=end_date
+        ),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/costs/batch")
+async def read_batch_costs(
+    request: Request,
+    start_date: date,
+    end_date: date,
+    team_ids: List[int] = Query(..., min_length=1),
+    granularity: Literal["day", "week", "month"] = "day",
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Many teams' costs as one columnar JSON document: a shared date axis,
+    # a service dictionary and an amount array per team and service. Built
+    # from NumPy arrays and encoded with orjson, without per-row models.
+    # MessagePack and Arrow IPC are available through Accept.
+    team_ids = list(dict.fromkeys(team_ids))
+    if len(team_ids) > BATCH_MAX_TEAMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TEAMS} teams per request")
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+    for team_id in team_ids:
+        auth.team_access_required(current_user, team_id)
 
+    async def produce():
+        daily = cost_cube.daily(team_ids, start_date, end_date, version=data_version.peek())
+        if daily is None:
+            daily = await columnar.load_daily(db, team_ids, start_date, end_date)
+        return columnar.build(team_ids, start_date, end_date, granularity, *daily)
+    return await cached_json(
+        request, produce, Scope(frozenset(team_ids), start_date, end_date), encoders=columnar.ENCODERS
+    )
+
+@app.get("/teams/{team_id}/costs", response_model=schemas.Page[schemas.CostRecord])
+async def read_team_costs(
+    request: Request,
+    team_id: int,
+    start_date: date,
+    end_date: date,
+    limit: int = Query(DEFAULT_COST_PAGE_SIZE, ge=1, le=MAX_COST_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: auth.TokenPrincipal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
     # Check if user has access to the team
-    if current_user.role != models.UserRole.ADMIN and current_user.team_id != team_id:
-        logger.warning(f"ACCESS DENIED: User {current_user.email} attempted to access team {team_id} costs without permission")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to access this team's costs"
-        )
+    auth.team_access_required(current_user, team_id)
 
-    try:
-        logger.info("Fetching costs from database...")
-        costs = crud.get_team_costs(
+    async def produce():
+        costs, next_cursor = await async_crud.get_team_costs(
             db=db,
             team_id=team_id,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            limit=limit,
+            cursor=cursor
+        )
+        logger.debug("Team %s costs %s..%s: %d records", team_id, start_date, end_date, len(costs))
+        return schemas.Page[schemas.CostRecord].model_validate(
+            {"items": costs, "next_cursor": next_cursor}, from_attributes=True
+        )
+
+    try:
+        return await cached_json(
+            request, produce, Scope(team_id, start_date, end_date), encoders=formats.COST_PAGE_ENCODERS
         )
-        logger.info(f"Database query completed. Found {len(costs)} cost records")
-
-        if len(costs) > 0:
-            logger.info("Sample cost records:")
-            for i, cost in enumerate(costs[:3]):  # Show first 3 records
-                logger.info(f"Record {i+1}:")
-                logger.info(f"  Date: {cost.date}")
-                logger.info(f"  Service: {cost.service}")
-                logger.info(f"  Amount: ${cost.amount:.2f}")
-        else:
-            logger.warning("No cost records found for the specified period")
-
-        logger.info("="*80)
-        return costs
+    except (InvalidCursor, HTTPException):
+        raise
     except Exception as e:
         logger.error(f"ERROR fetching costs: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -0,0 +1,278 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    # Every thread writes to its own shard, so updates take no lock and never
+    # contend; a scrape sums the shards. Shards of finished threads are folded
+    # into a retired shard so short-lived threads do not accumulate.
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merge(self, into: dict, shard: dict):
+        for key, value in list(shard.items()):
+            into[key] = into.get(key, 0) + value
+
+    def _collect(self) -> dict:
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            totals: dict = {}
+            self._merge(totals, self._retired)
+            for _, shard in live:
+                self._merge(totals, shard)
+        return totals
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self._collect().items())
+        ]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    # Either moved with inc()/dec() from any thread, or computed at scrape
+    # time by a callback returning {label tuple: value}.
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Dict[tuple, float]]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def _collect(self) -> dict:
+        if self.function is not None:
+            return self.function()
+        return super()._collect()
+
+
+class Histogram(_Metric):
+    # A shard entry is [count per bucket..., +Inf count, sum]; buckets are
+    # made cumulative only when rendered.
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def time(self, *labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def _merge(self, into: dict, shard: dict):
+        for key, entry in list(shard.items()):
+            total = into.get(key)
+            if total is None:
+                into[key] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    total[i] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, entry in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = Counter(
+    "costlens_http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "costlens_http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge("costlens_http_requests_in_flight", "HTTP requests currently being handled")
+
+SQL_QUERIES = Counter("costlens_sql_queries_total", "SQL statements executed", ("statement",))
+SQL_QUERY_SECONDS = Histogram(
+    "costlens_sql_query_duration_seconds", "SQL statement latency", ("statement",), buckets=SQL_BUCKETS
+)
+SQL_ERRORS = Counter("costlens_sql_errors_total", "SQL statements that raised", ("statement",))
+
+INGEST_RUNS = Counter("costlens_ingest_runs_total", "update_daily_costs runs", ("status",))
+INGEST_RUN_SECONDS = Histogram(
+    "costlens_ingest_run_duration_seconds", "update_daily_costs run duration", buckets=JOB_BUCKETS
+)
+INGEST_RECORDS = Counter(
+    "costlens_ingest_records_total", "Cost records written by ingestion", ("outcome",)
+)
+INGEST_ACCOUNT_FETCHES = Counter(
+    "costlens_ingest_account_fetches_total", "Per-account Cost Explorer fetches", ("account", "status")
+)
+
+JOB_RUNS = Counter("costlens_job_runs_total", "Scheduled job runs by outcome", ("job", "status"))
+JOB_RUN_SECONDS = Histogram(
+    "costlens_job_run_duration_seconds", "Scheduled job run duration", ("job",), buckets=JOB_BUCKETS
+)
+
+CE_REQUESTS = Counter("costlens_cost_explorer_requests_total", "Cost Explorer API calls", ("operation", "status"))
+CE_REQUEST_SECONDS = Histogram(
+    "costlens_cost_explorer_request_duration_seconds", "Cost Explorer API call latency", ("operation",)
+)
+CE_THROTTLES = Counter(
+    "costlens_cost_explorer_throttles_total", "Cost Explorer calls rejected by throttling", ("operation",)
+)
+CE_CACHE_LOOKUPS = Counter(
+    "costlens_cost_explorer_cache_lookups_total", "Stored Cost Explorer pages looked up", ("operation", "result")
+)
+
+THROTTLING_ERROR_CODES = frozenset({
+    "ThrottlingException", "Throttling", "LimitExceededException", "RequestLimitExceeded", "TooManyRequestsException",
+})
+
+
+def is_throttling_error(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return False
+    return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+def statement_kind(statement: str) -> str:
+    kind = statement.lstrip()[:6].upper()
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+class MetricsMiddleware:
+    # Pure ASGI. Routes are labelled by their path template (read from the
+    # scope FastAPI's router fills in), never by the raw path, so label
+    # cardinality stays bounded.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], template)
+            HTTP_REQUESTS.inc(scope["method"], template, status_code)
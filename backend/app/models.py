@@ -1,9 +1,24 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Enum
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Float, Integer, String, Date, DateTime, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from typing import List, Optional
 import enum
 from .database import Base
 
+# Cost amounts are stored as whole micro-dollars: sums are exact and the
+# column is a plain 8-byte integer.
+MICROS_PER_DOLLAR = 1_000_000
+
+def to_micros(amount: float) -> int:
+    return int(round(amount * MICROS_PER_DOLLAR))
+
+def from_micros(micros: int) -> float:
+    return micros / MICROS_PER_DOLLAR
+
+def parse_thresholds(thresholds: str) -> List[int]:
+    # Budget.thresholds, e.g. "50,80,100"
+    return sorted(int(value) for value in thresholds.split(",") if value.strip())
+
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
     TEAM_LEAD = "team_lead"
@@ -18,6 +33,9 @@ class User(Base):
     role = Column(Enum(UserRole))
     team_id = Column(Integer, ForeignKey("teams.id"))
     is_active = Column(Boolean, default=True)
+    # Bumped whenever role, team or active status changes; tokens carrying an
+    # older version are rejected.
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -34,6 +52,8 @@ class Team(Base):
     users = relationship("User", back_populates="team")
     resources = relationship("AWSResource", back_populates="team")
     costs = relationship("CostRecord", back_populates="team")
+    daily_costs = relationship("CostDailyRollup", back_populates="team")
+    archived_costs = relationship("CostRecordArchive", back_populates="team")
 
 class AWSResource(Base):
     __tablename__ = "aws_resources"
@@ -48,14 +68,242 @@ class AWSResource(Base):
 
     team = relationship("Team", back_populates="resources")
 
+class Service(Base):
+    __tablename__ = "services"
+
+    # Dictionary of AWS service names; cost rows refer to them by id
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class CostRecord(Base):
     __tablename__ = "cost_records"
+    __table_args__ = (
+        # Natural key, and the index behind every team + date range read
+        Index("uq_cost_records_team_date_service", "team_id", "date", "service_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(DateTime(timezone=True), index=True)
+    date = Column(Date, nullable=False, index=True)
     team_id = Column(Integer, ForeignKey("teams.id"))
-    service = Column(String, index=True)
-    amount = Column(Float)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    team = relationship("Team", back_populates="costs")
+    service_entry = relationship("Service")
+
+    @property
+    def service(self) -> str:
+        return self.service_entry.name
+
+    @property
+    def amount(self) -> float:
+        return from_micros(self.amount_micros)
+
+class CostDailyRollup(Base):
+    __tablename__ = "cost_daily_rollup"
+    __table_args__ = (
+        UniqueConstraint("team_id", "date", "service_id", name="uq_cost_daily_rollup_team_date_service"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    team = relationship("Team", back_populates="daily_costs")
+
+class CostMonthlyRollup(Base):
+    __tablename__ = "cost_monthly_rollup"
+    __table_args__ = (
+        UniqueConstraint("team_id", "month", "service_id", name="uq_cost_monthly_rollup_team_month_service"),
+    )
+
+    # Running monthly totals of raw cost records, moved by the same deltas as
+    # the daily rollup; month is the first day of the month. Budgets read
+    # month-to-date spend from here.
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CostRecordArchive(Base):
+    __tablename__ = "cost_records_archive"
+    __table_args__ = (
+        UniqueConstraint("team_id", "period_start", "service_id", name="uq_cost_records_archive_team_period_service"),
+    )
+
+    # cost_records older than the retention window, summed per week or
+    # month. Each row covers [period_start, period_end) and is read back as
+    # a single record dated at period_start.
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    team = relationship("Team", back_populates="archived_costs")
+    service_entry = relationship("Service")
+
+class CostForecast(Base):
+    __tablename__ = "cost_forecasts"
+    __table_args__ = (
+        UniqueConstraint("team_id", "date", "service_id", name="uq_cost_forecasts_team_date_service"),
+    )
+
+    # Projected daily spend per (team, service) for the days after as_of,
+    # the last day of data the forecast was fitted on. Replaced wholesale by
+    # each forecasting run.
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False)
+    lower_micros = Column(BigInteger, nullable=False)
+    upper_micros = Column(BigInteger, nullable=False)
+    as_of = Column(Date, nullable=False)
+
+class CostSeriesStats(Base):
+    __tablename__ = "cost_series_stats"
+    __table_args__ = (
+        UniqueConstraint("team_id", "service_id", name="uq_cost_series_stats_team_service"),
+    )
+
+    # Exponentially weighted mean and variance of a (team, service) series'
+    # daily dollars, folded forward one day at a time through last_day
+    id = Column(Integer, primary_key=True, index=True)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    last_day = Column(Date, nullable=False)
+    observations = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=False)
+    variance = Column(Float, nullable=False)
+
+class CostAnomaly(Base):
+    __tablename__ = "cost_anomalies"
+    __table_args__ = (
+        UniqueConstraint("team_id", "date", "service_id", name="uq_cost_anomalies_team_date_service"),
+    )
+
+    # A day whose spend rose above its series' expected range
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    amount_micros = Column(BigInteger, nullable=False)
+    expected_micros = Column(BigInteger, nullable=False)
+    lower_micros = Column(BigInteger, nullable=False)
+    upper_micros = Column(BigInteger, nullable=False)
+    # Standard deviations above the expected amount
+    score = Column(Float, nullable=False)
+    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Budget(Base):
+    __tablename__ = "budgets"
+    __table_args__ = (
+        Index("ix_budgets_team_id", "team_id"),
+    )
+
+    # Monthly spend limit for a team, or for one service of a team
+    id = Column(Integer, primary_key=True, index=True)
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=True)
+    amount_micros = Column(BigInteger, nullable=False)
+    # Comma-separated percentages of the amount that raise an alert
+    thresholds = Column(String, nullable=False, default="50,80,100")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    service_entry = relationship("Service")
+
+    @property
+    def service(self) -> Optional[str]:
+        return self.service_entry.name if self.service_entry else None
+
+    @property
+    def amount(self) -> float:
+        return from_micros(self.amount_micros)
 
-    team = relationship("Team", back_populates="costs")
\ No newline at end of file
+    @property
+    def threshold_list(self) -> List[int]:
+        return parse_thresholds(self.thresholds)
+
+class BudgetAlert(Base):
+    __tablename__ = "budget_alerts"
+    __table_args__ = (
+        UniqueConstraint("budget_id", "month", "threshold", name="uq_budget_alerts_budget_month_threshold"),
+    )
+
+    # First time a budget's month-to-date spend reached one of its thresholds
+    id = Column(Integer, primary_key=True, index=True)
+    budget_id = Column(Integer, ForeignKey("budgets.id"), nullable=False)
+    month = Column(Date, nullable=False)
+    threshold = Column(Integer, nullable=False)
+    spent_micros = Column(BigInteger, nullable=False)
+    crossed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @property
+    def spent(self) -> float:
+        return from_micros(self.spent_micros)
+
+class DataChange(Base):
+    __tablename__ = "data_changes"
+
+    # The highest id is the current data version; every write that changes
+    # what the cost or team endpoints return appends a row. Cost writes say
+    # which team and days they touched so caches can drop only what they
+    # affect; NULLs mean "all teams" / "all days".
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)
+    team_id = Column(Integer, nullable=True)
+    first_day = Column(Date, nullable=True)
+    last_day = Column(Date, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IngestWatermark(Base):
+    __tablename__ = "ingest_watermarks"
+
+    # First day not yet fetched from Cost Explorer for an account; only
+    # moves forward when the account's fetch succeeds.
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String, unique=True, nullable=False)
+    watermark = Column(Date, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class JobLock(Base):
+    __tablename__ = "job_locks"
+
+    # One row per scheduled job. A worker owns the job while lease_until is
+    # in the future; last_started_at stops a worker whose trigger fires a
+    # little later from running the same slot again.
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, unique=True, nullable=False)
+    holder = Column(String, nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    last_started_at = Column(DateTime(timezone=True), nullable=True)
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        Index("ix_job_runs_job_id", "job", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, nullable=False)
+    worker = Column(String, nullable=False)
+    # running, success, partial (completed with gaps, see error) or failure
+    status = Column(String, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    rows = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
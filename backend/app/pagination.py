@@ -0,0 +1,97 @@
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_COST_PAGE_SIZE = 1000
+MAX_COST_PAGE_SIZE = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence) -> str:
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor("Invalid cursor")
+    try:
+        return [_parse_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def _parse_value(column, value):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def _page_stmt(stmt, key_columns: Sequence, limit: int, cursor: Optional[str], descending: bool = False):
+    # Keyset pagination: seek past the last key of the previous page instead
+    # of using OFFSET, so every page costs one index range scan. key_columns
+    # must be unique together and indexed. One extra row is fetched to tell
+    # whether another page exists.
+    if cursor:
+        key = tuple_(*key_columns)
+        values = tuple(decode_cursor(cursor, key_columns))
+        stmt = stmt.where(key < values if descending else key > values)
+    order = [column.desc() for column in key_columns] if descending else key_columns
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+def _items(result, stmt) -> List:
+    # ORM entity selects yield instances; column selects yield rows
+    return result.scalars().all() if len(stmt.column_descriptions) == 1 else result.all()
+
+
+def page_result(items: List, key_columns: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in key_columns])
+    return items, next_cursor
+
+
+def paginate(
+    db: Session,
+    stmt,
+    key_columns: Sequence,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    descending: bool = False
+) -> Tuple[List, Optional[str]]:
+    items = _items(db.execute(_page_stmt(stmt, key_columns, limit, cursor, descending)), stmt)
+    return page_result(items, key_columns, limit)
+
+
+async def paginate_async(
+    db: AsyncSession,
+    stmt,
+    key_columns: Sequence,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    descending: bool = False
+) -> Tuple[List, Optional[str]]:
+    items = _items(await db.execute(_page_stmt(stmt, key_columns, limit, cursor, descending)), stmt)
+    return page_result(items, key_columns, limit)
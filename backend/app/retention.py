@@ -0,0 +1,136 @@
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import crud, models
+from .cache import data_version
+from .cube import COST_CUBE_ENABLED, cost_cube
+from .database import SessionLocal
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Raw daily rows younger than this many days are kept as-is
+RETENTION_RAW_DAYS = int(os.getenv("COST_RETENTION_RAW_DAYS", "395"))
+# "week" or "month"
+RETENTION_GRANULARITY = os.getenv("COST_RETENTION_GRANULARITY", "month")
+# Upper bound on raw rows moved per transaction
+RETENTION_BATCH_SIZE = int(os.getenv("COST_RETENTION_BATCH_SIZE", "20000"))
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown retention granularity: {granularity}")
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def compact_cost_records(
+    db: Session,
+    cutoff: Optional[date] = None,
+    granularity: str = RETENTION_GRANULARITY,
+    batch_size: int = RETENTION_BATCH_SIZE
+) -> int:
+    # Moves raw cost_records dated before the cutoff into per-period
+    # aggregates in cost_records_archive, oldest period first, and drops the
+    # matching cost_daily_rollup rows. The cutoff is aligned to a period
+    # boundary so no period is split between tiers. Each batch (a set of
+    # teams within one period) archives and deletes in one transaction, so
+    # an interrupted run never double counts and can simply be rerun.
+    # Returns the number of raw rows archived.
+    cutoff = period_start(cutoff or date.today() - timedelta(days=RETENTION_RAW_DAYS), granularity)
+    cost = models.CostRecord
+    archivable = (cost.date < cutoff, cost.team_id.isnot(None))
+
+    archived = 0
+    while True:
+        oldest = db.scalar(select(func.min(cost.date)).where(*archivable))
+        if oldest is None:
+            break
+        start = period_start(oldest, granularity)
+        end = next_period(start, granularity)
+        in_period = (cost.date >= start, cost.date < end)
+        team_counts = db.execute(
+            select(cost.team_id, func.count(cost.id)).where(*archivable, *in_period).group_by(cost.team_id)
+        ).all()
+        for team_ids in _team_batches(team_counts, batch_size):
+            archived += _archive_batch(db, granularity, start, end, team_ids)
+        logger.info(f"Archived cost records for {granularity} starting {start}")
+
+    if archived:
+        logger.info(f"Compacted {archived} cost records older than {cutoff} into {granularity}ly aggregates")
+    return archived
+
+
+def _team_batches(team_counts: List[Tuple[int, int]], batch_size: int):
+    batch, rows = [], 0
+    for team_id, count in team_counts:
+        if batch and rows + count > batch_size:
+            yield batch
+            batch, rows = [], 0
+        batch.append(team_id)
+        rows += count
+    if batch:
+        yield batch
+
+
+def _archive_batch(db: Session, granularity: str, start: date, end: date, team_ids: List[int]) -> int:
+    cost = models.CostRecord
+    rollup = models.CostDailyRollup
+    archive = models.CostRecordArchive
+    in_batch = (cost.team_id.in_(team_ids), cost.date >= start, cost.date < end)
+
+    totals = db.execute(
+        select(cost.team_id, cost.service_id, func.sum(cost.amount_micros), func.count(cost.id))
+        .where(*in_batch)
+        .group_by(cost.team_id, cost.service_id)
+    ).all()
+    try:
+        if totals:
+            # Rows for a period that was already archived (late data) add to it
+            stmt = crud._upsert(db, archive)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[archive.team_id, archive.period_start, archive.service_id],
+                set_={
+                    "amount_micros": archive.amount_micros + stmt.excluded.amount_micros,
+                    "record_count": archive.record_count + stmt.excluded.record_count,
+                },
+            )
+            db.execute(stmt, [
+                {
+                    "granularity": granularity, "period_start": start, "period_end": end,
+                    "team_id": team_id, "service_id": service_id, "amount_micros": micros or 0, "record_count": count,
+                }
+                for team_id, service_id, micros, count in totals
+            ])
+        deleted = db.execute(delete(cost).where(*in_batch)).rowcount
+        db.execute(delete(rollup).where(rollup.team_id.in_(team_ids), rollup.date >= start, rollup.date < end))
+        for team_id in team_ids:
+            crud.record_data_change(db, "retention", team_id, start, end - timedelta(days=1))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return deleted
+
+
+def run_retention() -> int:
+    # Scheduled entry point
+    db = SessionLocal()
+    try:
+        archived = compact_cost_records(db)
+        if archived:
+            data_version.invalidate()
+            if COST_CUBE_ENABLED:
+                cost_cube.refresh_if_loaded(db)
+        return archived
+    finally:
+        db.close()
@@ -1,37 +1,236 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from functools import partial
 from sqlalchemy.orm import Session
-from . import crud, aws
+from typing import Dict, Optional, Sequence, Tuple, Union
+from . import crud, aws, schemas, anomalies, attribution, budgets, forecast, jobs, metrics, retention
+from .cache import data_version
+from .ce_cache import ResponseStore, response_store
+from .cube import COST_CUBE_ENABLED, cost_cube
 from .database import SessionLocal
+import os
+import logging
 
-def update_daily_costs():
+logger = logging.getLogger(__name__)
+
+# Accounts fetched at once; Cost Explorer calls are still paced by the
+# shared rate limiter in aws
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+# Cost Explorer keeps revising recent days, so every run re-fetches this many
+INGEST_RESTATEMENT_DAYS = int(os.getenv("INGEST_RESTATEMENT_DAYS", "7"))
+# How far back an account that fell behind is caught up in one run
+INGEST_MAX_CATCHUP_DAYS = int(os.getenv("INGEST_MAX_CATCHUP_DAYS", "90"))
+# A job that started less than this long ago is not started again, so workers
+# whose clocks fire a little late skip a firing another worker already ran
+JOB_MIN_INTERVAL_SECONDS = float(os.getenv("JOB_MIN_INTERVAL_SECONDS", "3600"))
+
+def ingest_window(watermarks: Dict[str, date], accounts: Sequence[str], today: date) -> Tuple[date, date]:
+    # [start, end): the restatement window, widened back to the watermark
+    # of any account that missed earlier runs. Every account is fetched over
+    # the same window because cells are summed across accounts. A window
+    # longer than INGEST_MAX_CATCHUP_DAYS is cut short at the far end: the
+    # oldest days come first, watermarks only advance to `end`, and later
+    # runs carry on from there.
+    start = today - timedelta(days=INGEST_RESTATEMENT_DAYS)
+    for account in accounts:
+        watermark = watermarks.get(account)
+        if watermark is not None and watermark < start:
+            start = watermark
+    return start, min(today, start + timedelta(days=max(INGEST_MAX_CATCHUP_DAYS, INGEST_RESTATEMENT_DAYS)))
+
+def update_daily_costs(cost_explorers: Optional[Sequence[aws.AWSCostExplorer]] = None):
+    # Only cells whose amount changed are written, and only the teams and
+    # days they belong to are invalidated downstream.
     db = SessionLocal()
+    status = "failure"
     try:
-        cost_explorer = aws.AWSCostExplorer()
-        yesterday = datetime.now() - timedelta(days=1)
-        costs = cost_explorer.get_daily_costs(yesterday, yesterday)
-
-        for cost in costs:
-            team = crud.get_team_by_name(db, cost['team'])
-            if team:
-                cost_record = crud.CostRecordCreate(
-                    date=cost['date'],
-                    team_id=team.id,
-                    service=cost['service'],
-                    amount=cost['amount']
-                )
-                crud.create_cost_record(db, cost_record)
+        with metrics.INGEST_RUN_SECONDS.time():
+            if cost_explorers is None:
+                cost_explorers = [aws.AWSCostExplorer(account=account) for account in aws.load_accounts()]
+            accounts = [cost_explorer.account.name for cost_explorer in cost_explorers]
+            today = date.today()
+            start, end = ingest_window(crud.get_ingest_watermarks(db), accounts, today)
+            logger.info(f"Ingesting costs for {start}..{end} (exclusive) from {len(accounts)} account(s)")
+            if end < today:
+                logger.info(f"Catching up: {(today - end).days} day(s) left for later runs")
+            result = ingest_costs(
+                db, cost_explorers, datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+            )
+            crud.set_ingest_watermarks(db, [account for account in accounts if account not in result.failed_accounts], end)
+            db.commit()
+            metrics.INGEST_RECORDS.inc("inserted", amount=result.inserted)
+            metrics.INGEST_RECORDS.inc("updated", amount=result.updated)
+            metrics.INGEST_RECORDS.inc("unchanged", amount=result.unchanged)
+            if result.inserted or result.updated:
+                data_version.invalidate()
+                if COST_CUBE_ENABLED:
+                    cost_cube.refresh_if_loaded(db)
+        status = "partial" if result.failed_accounts else "success"
+        return result
+    except Exception:
+        db.rollback()
+        raise
     finally:
+        metrics.INGEST_RUNS.inc(status)
         db.close()
 
-def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        update_daily_costs,
-        CronTrigger(hour=0, minute=0),  # Run at midnight
-        id='update_daily_costs',
-        name='Update daily AWS costs',
-        replace_existing=True
+def ingest_costs(
+    db: Session,
+    cost_explorers: Sequence[aws.AWSCostExplorer],
+    start_date: datetime,
+    end_date: datetime
+) -> schemas.IngestResult:
+    # Accounts are fetched concurrently, each into its own aggregator, and
+    # merged in configuration order so float sums are reproducible. Tag-based
+    # and resource-attributed costs are merged per cell, then raw rows and
+    # the daily rollup for the whole run are committed together.
+    # A failing account is logged and skipped. Cells are sums across
+    # accounts, so the run's amounts then lack that account's share: only
+    # cells not stored yet are inserted, and existing ones keep their
+    # (complete) amounts. The failed account's watermark stays put, so a
+    # later run re-fetches those days from every account and corrects them.
+    # Likewise, with resource attribution on, days before Cost Explorer's
+    # resource-level history only get tag-based amounts: existing cells
+    # there may hold attributed spend and are not updated.
+    team_ids = crud.get_team_ids_by_name(db)
+    arn_index = attribution.ArnIndex.load(db) if attribution.RESOURCE_ATTRIBUTION_ENABLED else None
+    aggregator = attribution.CostAggregator()
+    failed = []
+    workers = max(1, min(INGEST_MAX_WORKERS, len(cost_explorers)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        futures = [
+            pool.submit(fetch_account_costs, cost_explorer, start_date, end_date, team_ids, arn_index)
+            for cost_explorer in cost_explorers
+        ]
+        for cost_explorer, future in zip(cost_explorers, futures):
+            account = cost_explorer.account.name
+            try:
+                aggregator.merge(future.result())
+            except Exception as e:
+                logger.error(f"Cost ingestion failed for account {account}: {e}")
+                metrics.INGEST_ACCOUNT_FETCHES.inc(account, "failure")
+                failed.append(account)
+                continue
+            metrics.INGEST_ACCOUNT_FETCHES.inc(account, "success")
+    if cost_explorers and len(failed) == len(cost_explorers):
+        raise RuntimeError(f"Cost ingestion failed for every account: {', '.join(failed)}")
+
+    resource_start = aws.resource_history_start() if arn_index is not None else None
+    result = crud.upsert_cost_records(
+        db, aggregator.records(), insert_only=bool(failed), insert_only_before=resource_start
     )
-    scheduler.start() 
\ No newline at end of file
+    result.failed_accounts = failed
+    if result.held:
+        reason = f"accounts {', '.join(failed)} failed" if failed else f"no resource-level costs before {resource_start}"
+        logger.warning(f"Kept {result.held} existing cost cells unchanged: {reason}")
+    return result
+
+def fetch_account_costs(
+    cost_explorer: aws.AWSCostExplorer,
+    start_date: datetime,
+    end_date: datetime,
+    team_ids: Dict[str, int],
+    arn_index: Optional[attribution.ArnIndex]
+) -> attribution.CostAggregator:
+    # Runs on a pool thread: no database access, only the lookups loaded
+    # up front
+    aggregator = attribution.CostAggregator()
+    aggregator.add_tagged_costs(cost_explorer.iter_daily_costs(start_date, end_date), team_ids)
+    if arn_index is not None:
+        attribution.attribute_line_items(
+            cost_explorer.iter_resource_costs(start_date, end_date),
+            arn_index,
+            aggregator
+        )
+    return aggregator
+
+def replay_cost_records(db: Session, store: Optional[ResponseStore] = None) -> schemas.IngestResult:
+    # Rebuilds raw cost rows for every day held in the response store without
+    # calling AWS, through the same parsing and attribution as a live run.
+    # Rows on those days are replaced rather than merged, so a parsing or
+    # mapping fix applies to all of history; days the store does not cover
+    # and archived periods are left alone.
+    store = store or response_store
+    if store is None:
+        raise ValueError("Cost Explorer replay needs CE_CACHE_DIR")
+    now = datetime.now()
+    team_ids = crud.get_team_ids_by_name(db)
+    arn_index = attribution.ArnIndex.load(db) if attribution.RESOURCE_ATTRIBUTION_ENABLED else None
+    aggregator = attribution.CostAggregator()
+    days = set()
+
+    def replayed(account: str, operation: str, template: Dict, parse):
+        for response in store.iter_responses(account, operation, template):
+            days.update(result["TimePeriod"]["Start"] for result in response["ResultsByTime"])
+            yield from parse(response)
+
+    for account in store.accounts():
+        aggregator.add_tagged_costs(
+            replayed(account, "get_cost_and_usage", aws.cost_request(now, now), aws.parse_cost_and_usage),
+            team_ids
+        )
+        if arn_index is not None:
+            attribution.attribute_line_items(
+                replayed(
+                    account, "get_cost_and_usage_with_resources",
+                    aws.resource_cost_request(now, now), aws.parse_resource_costs
+                ),
+                arn_index,
+                aggregator
+            )
+
+    try:
+        deleted = crud.delete_cost_records_on(db, (date.fromisoformat(day) for day in days))
+        result = crud.upsert_cost_records(db, aggregator.records(), commit=False)
+        crud.rebuild_cost_rollup(db)
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Replayed {len(days)} day(s) from the response store, replacing {deleted} cost records")
+    return result
+
+# Stages that derive from cost data, run after every ingest as jobs of their
+# own: (job id, function taking the IngestResult, or None outside an ingest)
+POST_INGEST_JOBS = [
+    ("cost_forecasts", lambda result: forecast.run_forecasts()),
+    ("cost_anomalies", anomalies.run_anomaly_detection),
+    ("budget_alerts", budgets.run_budget_alerts),
+]
+
+def _ingest_job() -> Union[int, jobs.JobOutcome]:
+    result = update_daily_costs()
+    for job, func in POST_INGEST_JOBS:
+        jobs.run_exclusive(job, partial(func, result), 0)
+    rows = result.inserted + result.updated
+    if result.failed_accounts:
+        # Shown on /admin/jobs/runs; those accounts are retried next run
+        return jobs.JobOutcome(rows, "partial", f"Cost ingestion failed for accounts: {', '.join(result.failed_accounts)}")
+    return rows
+
+# (job id, description, function, trigger). Each function returns the number
+# of rows it wrote.
+JOBS = [
+    ("update_daily_costs", "Update daily AWS costs", _ingest_job, CronTrigger(hour=0, minute=0)),  # Run at midnight
+    ("cost_retention", "Downsample and prune old cost records", retention.run_retention, CronTrigger(hour=2, minute=0)),
+]
+
+def start_scheduler(blocking: bool = False):
+    # Every API worker (or dedicated worker process) may run this; the lease
+    # in job_locks lets exactly one of them run each firing.
+    scheduler = BlockingScheduler() if blocking else BackgroundScheduler()
+    for job, name, func, trigger in JOBS:
+        scheduler.add_job(
+            jobs.run_exclusive,
+            trigger,
+            args=[job, func, JOB_MIN_INTERVAL_SECONDS],
+            id=job,
+            name=name,
+            replace_existing=True
+        )
+    logger.info(f"Starting scheduler as worker {jobs.WORKER_ID}")
+    # A blocking scheduler only returns once it is shut down
+    scheduler.start()
+    return scheduler
@@ -1,8 +1,15 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, conint, field_validator
+from typing import Generic, Optional, List, TypeVar
+from datetime import date, datetime
 from .models import UserRole
 
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -77,12 +84,178 @@ class CostRecordCreate(CostRecordBase):
     pass
 
 
+class IngestResult(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # Existing cells whose new amount was not written because the run's sum
+    # was incomplete: a failed account, or no resource-level costs that far
+    # back (see upsert_cost_records' insert_only)
+    held: int = 0
+    # (date, team_id, service, old_amount, new_amount) for every inserted or
+    # updated cell; old_amount is None for inserts.
+    changes: list = Field(default_factory=list, exclude=True, repr=False)
+    # Accounts whose Cost Explorer fetch failed; their share is missing
+    failed_accounts: List[str] = Field(default_factory=list)
+
+
+class AWSAccount(BaseModel):
+    name: str
+    # Role assumed through STS; None uses the environment credentials
+    role_arn: Optional[str] = None
+    external_id: Optional[str] = None
+    region: Optional[str] = None
+
+
+class AttributionResult(BaseModel):
+    line_items: int = 0
+    attributed: int = 0
+    unattributed: int = 0
+    attributed_amount: float = 0.0
+    unattributed_amount: float = 0.0
+
+
 class CostRecord(BaseModel):
     id: int
-    date: str
+    date: datetime
     team_id: int
     service: str
     amount: float
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class ServiceCost(BaseModel):
+    service: str
+    amount: float
+
+
+class DailyCost(BaseModel):
+    date: date
+    amount: float
+
+
+class CostSummary(BaseModel):
+    team_id: int
+    start_date: date
+    end_date: date
+    total: float
+    by_service: List[ServiceCost]
+    daily: List[DailyCost]
+
+
+class ForecastDay(BaseModel):
+    date: date
+    amount: float
+    lower: float
+    upper: float
+
+
+class CostForecast(BaseModel):
+    team_id: int
+    # Last day of data the forecast was fitted on; None before the first run
+    as_of: Optional[date] = None
+    month_start: date
+    month_end: date
+    month_to_date: float
+    projected_total: float
+    projected_lower: float
+    projected_upper: float
+    by_service: List[ServiceCost]
+    daily: List[ForecastDay]
+
+
+class CostAnomaly(BaseModel):
+    date: date
+    service: str
+    amount: float
+    # Running mean of the series before this day, and the range around it
+    # that counts as normal
+    expected: float
+    lower: float
+    upper: float
+    # Standard deviations above the expected amount
+    score: float
+    detected_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class BudgetCreate(BaseModel):
+    # Monthly limit in dollars; without a service it covers the whole team
+    amount: float = Field(gt=0)
+    service: Optional[str] = None
+    # Percentages of the amount that raise an alert; stored sorted and
+    # without repeats
+    thresholds: List[conint(ge=1)] = Field(default_factory=lambda: [50, 80, 100], min_length=1)
+
+    @field_validator("thresholds")
+    @classmethod
+    def sort_thresholds(cls, thresholds: List[int]) -> List[int]:
+        return sorted(set(thresholds))
+
+
+class Budget(BaseModel):
+    id: int
+    team_id: int
+    service: Optional[str] = None
+    amount: float
+    thresholds: List[int] = Field(validation_alias="threshold_list")
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class BudgetStatus(BaseModel):
+    id: int
+    team_id: int
+    team: str
+    service: Optional[str] = None
+    month: date
+    amount: float
+    spent: float
+    remaining: float
+    percent_used: float
+    thresholds: List[int]
+    # Thresholds the month-to-date spend has reached
+    crossed: List[int]
+
+
+class BudgetAlert(BaseModel):
+    id: int
+    budget_id: int
+    month: date
+    threshold: int
+    spent: float
+    crossed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobRun(BaseModel):
+    id: int
+    job: str
+    worker: str
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class CubeStats(BaseModel):
+    warm: bool
+    series: int
+    teams: int
+    days: int
+    nbytes: int
+    origin: Optional[date] = None
+    loaded_at: Optional[float] = None
+    version: Optional[int] = None
@@ -0,0 +1,57 @@
+import argparse
+import json
+import sys
+
+# (path within a scenario result, True if a higher value is better)
+METRICS = [
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("throughput_rps",), True),
+    (("peak_rss_mb",), False),
+]
+
+
+def _lookup(result: dict, path: tuple):
+    for key in path:
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> int:
+    # Prints one line per metric and returns how many regressed by more
+    # than `threshold` (a fraction, e.g. 0.1 for 10%).
+    regressions = 0
+    for scenario in sorted(set(baseline["results"]) | set(candidate["results"])):
+        before = baseline["results"].get(scenario)
+        after = candidate["results"].get(scenario)
+        if before is None or after is None:
+            print(f"{scenario}: only in {'candidate' if before is None else 'baseline'}")
+            continue
+        for path, higher_is_better in METRICS:
+            old, new = _lookup(before, path), _lookup(after, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{scenario:22} {'.'.join(path):16} {old:>12.3f} -> {new:>12.3f} ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports produced by run.py")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    sys.exit(1 if compare(baseline, candidate, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+from botocore.exceptions import ClientError
+import random
+import time
+import zlib
+
+# Cost Explorer returns at most this many groups per page in practice
+DEFAULT_PAGE_SIZE = 1000
+
+
+# Local stand-in for boto3.client('ce'). Responses have the same shape as
+# the real API (ResultsByTime, Groups, Metrics, NextPageToken) and amounts
+# are deterministic per (day, group), so repeated runs ingest identical data.
+# Optional latency and throttling make paging and retry paths measurable.
+class FakeCostExplorerClient:
+    def __init__(
+        self,
+        teams: Sequence[str],
+        services: Sequence[str],
+        resources_per_service: int = 0,
+        untagged_share: float = 0.05,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.teams = list(teams)
+        self.services = list(services)
+        self.resources_per_service = resources_per_service
+        self.untagged_share = untagged_share
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def get_cost_and_usage(self, **request) -> Dict[str, Any]:
+        groups = [(f"Team${team}", service) for team in self.teams for service in self.services]
+        groups += [("Team$", service) for service in self.services]
+        return self._respond("get_cost_and_usage", request, groups)
+
+    def get_cost_and_usage_with_resources(self, **request) -> Dict[str, Any]:
+        groups = [
+            (f"i-{zlib.crc32(f'{service}/{i}'.encode()):08x}{i:08x}", service)
+            for service in self.services
+            for i in range(self.resources_per_service)
+        ]
+        return self._respond("get_cost_and_usage_with_resources", request, groups)
+
+    def _respond(self, operation: str, request: Dict[str, Any], groups: List[tuple]) -> Dict[str, Any]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation
+            )
+
+        start = datetime.strptime(request["TimePeriod"]["Start"], "%Y-%m-%d")
+        end = datetime.strptime(request["TimePeriod"]["End"], "%Y-%m-%d")
+        days = max((end - start).days, 0)
+        total = days * len(groups)
+        offset = int(request.get("NextPageToken") or 0)
+        stop = min(offset + self.page_size, total)
+
+        results: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+        for position in range(offset, stop):
+            day, group = divmod(position, len(groups))
+            if current is None or current["_day"] != day:
+                day_start = start + timedelta(days=day)
+                current = {
+                    "_day": day,
+                    "TimePeriod": {
+                        "Start": day_start.strftime("%Y-%m-%d"),
+                        "End": (day_start + timedelta(days=1)).strftime("%Y-%m-%d"),
+                    },
+                    "Total": {},
+                    "Groups": [],
+                    "Estimated": day_start >= datetime.now() - timedelta(days=2),
+                }
+                results.append(current)
+            keys = groups[group]
+            current["Groups"].append({
+                "Keys": list(keys),
+                "Metrics": {"UnblendedCost": {"Amount": self._amount(current["TimePeriod"]["Start"], keys), "Unit": "USD"}},
+            })
+        for result in results:
+            del result["_day"]
+
+        response: Dict[str, Any] = {
+            "GroupDefinitions": request.get("GroupBy", []),
+            "ResultsByTime": results,
+            "DimensionValueAttributes": [],
+        }
+        if stop < total:
+            response["NextPageToken"] = str(stop)
+        return response
+
+    def _amount(self, day: str, keys: tuple) -> str:
+        # Stable pseudo-random spend: a per-group base with daily jitter
+        group_hash = zlib.crc32("|".join(keys).encode()) ^ self.seed
+        day_hash = zlib.crc32(f"{day}|{group_hash}".encode())
+        base = 5 + (group_hash % 50000) / 100
+        if keys[0] == "Team$":
+            base *= self.untagged_share
+        return f"{base * (0.9 + (day_hash % 2000) / 10000):.10f}"
@@ -0,0 +1,259 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Request logging would dominate the numbers being measured
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+import argparse
+import itertools
+import json
+import platform
+import random
+import resource
+import subprocess
+import threading
+import time
+import numpy as np
+
+from sqlalchemy import func, select
+from app import aws, crud, models, scheduler
+from app.database import SessionLocal, engine
+from fake_ce import FakeCostExplorerClient
+
+SCENARIOS = ["login", "list_users", "list_teams", "list_resources", "team_costs", "update_daily_costs"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    samples = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "mean": round(float(samples.mean()), 3) if len(samples) else 0.0,
+            "max": round(float(samples.max()), 3) if len(samples) else 0.0,
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_load(call: Callable[[int], bool], requests: int, concurrency: int, warmup: int) -> Dict:
+    # `call(i)` performs one request and returns whether it succeeded.
+    # Workers pull request numbers from a shared counter until `requests`
+    # have been issued.
+    for i in range(warmup):
+        call(i)
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal errors
+        local_latencies, local_errors = [], 0
+        while True:
+            i = next(counter)
+            if i >= requests:
+                break
+            started = time.perf_counter()
+            ok = call(i)
+            local_latencies.append(time.perf_counter() - started)
+            local_errors += 0 if ok else 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def dataset_info() -> Dict:
+    db = SessionLocal()
+    try:
+        cost = models.CostRecord
+        first_day, last_day, rows = db.execute(select(func.min(cost.date), func.max(cost.date), func.count(cost.id))).one()
+        return {
+            "teams": db.scalar(select(func.count(models.Team.id))),
+            "services": db.scalar(select(func.count(func.distinct(cost.service_id)))),
+            "cost_records": rows,
+            "first_day": first_day.isoformat() if first_day else None,
+            "last_day": last_day.isoformat() if last_day else None,
+        }
+    finally:
+        db.close()
+
+
+def http_scenarios(client, args, info: Dict) -> Dict[str, Callable[[int], bool]]:
+    credentials = {"email": args.email, "password": args.password}
+    token = client.post("/login", json=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    db = SessionLocal()
+    try:
+        team_ids = list(crud.get_team_ids_by_name(db).values())
+    finally:
+        db.close()
+
+    first_day = date.fromisoformat(info["first_day"])
+    last_day = date.fromisoformat(info["last_day"])
+    span = max((last_day - first_day).days - args.window_days, 0)
+    rng = random.Random(args.seed)
+    # Pre-drawn so every run issues the same sequence of cost queries
+    windows = []
+    for _ in range(args.requests + args.warmup):
+        start = first_day + timedelta(days=rng.randint(0, span))
+        windows.append((rng.choice(team_ids), start, start + timedelta(days=args.window_days - 1)))
+
+    def ok(response) -> bool:
+        return response.status_code < 400
+
+    def team_costs(i: int) -> bool:
+        team_id, start, end = windows[i % len(windows)]
+        return ok(client.get(
+            f"/teams/{team_id}/costs",
+            params={"start_date": start.isoformat(), "end_date": end.isoformat(), "limit": args.page_size},
+            headers=headers,
+        ))
+
+    return {
+        "login": lambda i: ok(client.post("/login", json=credentials)),
+        "list_users": lambda i: ok(client.get("/users", params={"limit": 100}, headers=headers)),
+        "list_teams": lambda i: ok(client.get("/teams", params={"limit": 100}, headers=headers)),
+        "list_resources": lambda i: ok(client.get("/resources", params={"limit": 100}, headers=headers)),
+        "team_costs": team_costs,
+    }
+
+
+def bench_update_daily_costs(args) -> Dict:
+    # Drives the real ingest path against the fake Cost Explorer. The first
+    # run inserts the restatement window's cells; later runs exercise the
+    # unchanged path.
+    db = SessionLocal()
+    try:
+        teams = list(crud.get_team_ids_by_name(db))
+        services = list(db.scalars(select(models.Service.name)))
+    finally:
+        db.close()
+    client = FakeCostExplorerClient(
+        teams, services, page_size=args.ce_page_size, latency=args.ce_latency, seed=args.seed
+    )
+    latencies, errors, outcomes = [], 0, []
+    started = time.perf_counter()
+    for _ in range(args.ingest_runs):
+        run_started = time.perf_counter()
+        try:
+            result = scheduler.update_daily_costs([aws.AWSCostExplorer(client, store=None)])
+            outcomes.append({"inserted": result.inserted, "updated": result.updated, "unchanged": result.unchanged})
+        except Exception as e:
+            print(f"update_daily_costs failed: {e}", file=sys.stderr)
+            errors += 1
+        latencies.append(time.perf_counter() - run_started)
+    summary = summarize(latencies, errors, time.perf_counter() - started)
+    summary["runs"] = outcomes
+    summary["cost_explorer_calls"] = client.calls
+    return summary
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmarks for the CostLens API")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per HTTP scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--base-url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument("--email", default="admin@example.com")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--ingest-runs", type=int, default=3)
+    parser.add_argument("--ce-page-size", type=int, default=1000)
+    parser.add_argument("--ce-latency", type=float, default=0.0, help="simulated seconds per Cost Explorer call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    selected = [name for name in args.scenarios.split(",") if name]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    info = dataset_info()
+    results = {}
+    http_selected = [name for name in selected if name != "update_daily_costs"]
+    if http_selected:
+        if args.base_url:
+            import httpx
+            client_context = httpx.Client(base_url=args.base_url, timeout=60)
+        else:
+            from fastapi.testclient import TestClient
+            from app.main import app
+            # Entering the client runs startup hooks and keeps one event loop
+            # for all requests, as a real server would.
+            client_context = TestClient(app)
+        with client_context as client:
+            scenarios = http_scenarios(client, args, info)
+            for name in http_selected:
+                print(f"Running {name}...", file=sys.stderr)
+                results[name] = run_load(scenarios[name], args.requests, args.concurrency, args.warmup)
+
+    if "update_daily_costs" in selected:
+        print("Running update_daily_costs...", file=sys.stderr)
+        results["update_daily_costs"] = bench_update_daily_costs(args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "target": args.base_url or "in-process",
+            "dataset": info,
+            "parameters": {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "warmup": args.warmup,
+                "window_days": args.window_days,
+                "page_size": args.page_size,
+                "ingest_runs": args.ingest_runs,
+                "seed": args.seed,
+            },
+        },
+        "results": results,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
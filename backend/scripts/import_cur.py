@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.cur import DEFAULT_CHUNK_ROWS, import_cur_files
+from app.logging_config import setup_logging
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import AWS Cost and Usage Report files (CSV, CSV.gz or Parquet) into cost_records"
+    )
+    parser.add_argument("paths", nargs="+", help="CUR files; pass every part of a report in one run")
+    parser.add_argument("--workers", type=int, default=None, help="parallel file workers (default: CPU count)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--dry-run", action="store_true", help="aggregate and report without writing")
+    args = parser.parse_args()
+
+    setup_logging()
+    db = SessionLocal()
+    try:
+        result = import_cur_files(
+            db, args.paths, workers=args.workers, chunk_rows=args.chunk_rows, dry_run=args.dry_run
+        )
+        print(f"CUR import complete: {result.inserted} inserted, {result.updated} updated, {result.unchanged} unchanged")
+    except Exception as e:
+        print(f"Error importing CUR files: {e}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
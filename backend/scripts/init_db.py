@@ -3,77 +3,86 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import SessionLocal
-from app.models import User, Team, AWSResource, CostRecord
-from datetime import datetime, timedelta
-import random
+from app import crud
+from app.models import User, Team, AWSResource, CostRecord, to_micros
+from datetime import date, timedelta
+from sqlalchemy import insert
+import argparse
+import numpy as np
 
-def init_db():
+TEAM_NAMES = ["Platform", "Data", "Infrastructure"]
+SERVICES = ["EC2", "S3", "RDS", "Lambda", "DynamoDB"]
+INSERT_BATCH_SIZE = 50000
+
+def team_names(count: int):
+    # The first teams keep their historical names so seeded logins still work
+    return TEAM_NAMES[:count] + [f"team-{i:04d}" for i in range(len(TEAM_NAMES) + 1, count + 1)]
+
+def service_names(count: int):
+    return SERVICES[:count] + [f"Service-{i:03d}" for i in range(len(SERVICES) + 1, count + 1)]
+
+def _bulk_insert(db, model, rows):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(insert(model), rows[start:start + INSERT_BATCH_SIZE])
+
+def init_db(teams: int = 3, services: int = 5, days: int = 30, resources: int = 20, seed: int = None):
+    rng = np.random.default_rng(seed)
     db = SessionLocal()
     try:
         # Create teams
-        teams = [
-            Team(name="Platform"),
-            Team(name="Data"),
-            Team(name="Infrastructure"),
-        ]
-        for team in teams:
-            db.add(team)
+        _bulk_insert(db, Team, [{"name": name} for name in team_names(teams)])
+        team_ids = [team.id for team in db.query(Team.id).order_by(Team.id)]
         db.commit()
 
         # Create users
         users = [
-            User(
-                email="admin@example.com",
-                password="admin123",
-                role="admin",
-                team_id=teams[0].id
-            ),
-            User(
-                email="lead@example.com",
-                password="lead123",
-                role="team_lead",
-                team_id=teams[1].id
-            ),
-            User(
-                email="viewer@example.com",
-                password="viewer123",
-                role="viewer",
-                team_id=teams[2].id
-            ),
+            {"email": "admin@example.com", "password": "admin123", "role": "admin"},
+            {"email": "lead@example.com", "password": "lead123", "role": "team_lead"},
+            {"email": "viewer@example.com", "password": "viewer123", "role": "viewer"},
         ]
-        for user in users:
-            db.add(user)
+        for i, user in enumerate(users):
+            user["team_id"] = team_ids[i % len(team_ids)]
+        _bulk_insert(db, User, users)
         db.commit()
 
         # Create AWS resources
-        services = ["EC2", "S3", "RDS", "Lambda", "DynamoDB"]
-        resources = []
-        for i in range(20):
-            resource = AWSResource(
-                name=f"resource-{i}",
-                arn=f"arn:aws:{random.choice(services)}:us-west-2:123456789012:resource-{i}",
-                service=random.choice(services),
-                team_id=random.choice(teams).id
-            )
-            resources.append(resource)
-            db.add(resource)
+        service_list = service_names(services)
+        _bulk_insert(db, AWSResource, [
+            {
+                "name": f"resource-{i}",
+                "arn": f"arn:aws:{service_list[i % len(service_list)].lower()}:us-west-2:123456789012:resource-{i}",
+                "service": service_list[i % len(service_list)],
+                "team_id": team_ids[int(rng.integers(len(team_ids)))],
+            }
+            for i in range(resources)
+        ])
         db.commit()
 
-        # Create cost records for the last 30 days
-        for i in range(30):
-            date = datetime.now() - timedelta(days=i)
-            for team in teams:
-                for service in services:
-                    cost = CostRecord(
-                        date=date,
-                        team_id=team.id,
-                        service=service,
-                        amount=random.uniform(10, 1000)
-                    )
-                    db.add(cost)
+        # Create cost records for the last `days` days. Each (team, service)
+        # series gets its own base spend plus a weekday pattern and noise,
+        # and rows are written in bulk batches rather than one object each.
+        today = date.today()
+        service_ids = crud.get_service_ids(db, service_list)
+        base = rng.lognormal(mean=4.0, sigma=1.2, size=(len(team_ids), len(service_list)))
+        pairs = [(team_id, service_ids[service]) for team_id in team_ids for service in service_list]
+        batch = []
+        for i in range(days):
+            day = today - timedelta(days=i)
+            weekday_factor = 0.8 if day.weekday() >= 5 else 1.0
+            amounts = (base * weekday_factor * rng.normal(1.0, 0.1, size=base.shape)).clip(min=0).ravel()
+            batch.extend(
+                {"date": day, "team_id": team_id, "service_id": service_id, "amount_micros": to_micros(amount)}
+                for (team_id, service_id), amount in zip(pairs, amounts)
+            )
+            if len(batch) >= INSERT_BATCH_SIZE:
+                _bulk_insert(db, CostRecord, batch)
+                db.commit()
+                batch = []
+        _bulk_insert(db, CostRecord, batch)
         db.commit()
+        crud.rebuild_cost_rollup(db)
 
-        print("Database initialized with sample data!")
+        print(f"Database initialized with sample data! ({len(team_ids)} teams x {len(service_list)} services x {days} days)")
     except Exception as e:
         print(f"Error initializing database: {e}")
         db.rollback()
@@ -81,4 +90,11 @@ def init_db():
         db.close()
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed the database with sample data")
+    parser.add_argument("--teams", type=int, default=3)
+    parser.add_argument("--services", type=int, default=5)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--resources", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    init_db(teams=args.teams, services=args.services, days=args.days, resources=args.resources, seed=args.seed)
@@ -0,0 +1,30 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.ce_cache import CE_CACHE_DIR
+from app.logging_config import setup_logging
+from app.scheduler import replay_cost_records
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild cost_records from stored Cost Explorer responses without calling AWS"
+    )
+    parser.parse_args()
+
+    setup_logging()
+    db = SessionLocal()
+    try:
+        result = replay_cost_records(db)
+        print(f"Replay from {CE_CACHE_DIR} complete: {result.inserted + result.updated} cost records written")
+    except Exception as e:
+        print(f"Error replaying Cost Explorer responses: {e}")
+        db.rollback()
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
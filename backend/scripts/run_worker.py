@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import jobs
+from app.logging_config import setup_logging
+from app.scheduler import JOBS, POST_INGEST_JOBS, start_scheduler
+from functools import partial
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run scheduled jobs (cost ingestion, retention) outside the API workers"
+    )
+    runnable = {job: func for job, _, func, _ in JOBS}
+    runnable.update((job, partial(func, None)) for job, func in POST_INGEST_JOBS)
+    parser.add_argument(
+        "--run-now", choices=list(runnable),
+        help="run one job immediately, unless another worker holds it, and exit"
+    )
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.run_now:
+        # No minimum interval: an explicit run only waits for a running one
+        ran = jobs.run_exclusive(args.run_now, runnable[args.run_now], 0)
+        print(f"Job {args.run_now} {'ran' if ran else 'skipped: another worker is running it'}")
+        return
+    try:
+        start_scheduler(blocking=True)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+
+# The app reads DATABASE_URL at import time, so point it at a throwaway
+# SQLite file before anything from app is imported
+_db_dir = tempfile.mkdtemp(prefix="costlens-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'costlens.db')}"
+os.environ.setdefault("CE_CACHE_DIR", "")
+os.environ.setdefault("COST_CUBE_ENABLED", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import SessionLocal
+from app import aws, schemas
+from scripts.init_db import init_db
+
+init_db(seed=1)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Not used as a context manager, so startup hooks (cube warm-up, the
+    # scheduler) do not run
+    return TestClient(app)
+
+
+def login(client, email: str, password: str) -> dict:
+    response = client.post("/login", json={"email": email, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return login(client, "admin@example.com", "admin123")
+
+
+@pytest.fixture(scope="session")
+def viewer_headers(client):
+    return login(client, "viewer@example.com", "viewer123")
+
+
+class FakeCostExplorerClient:
+    # Answers get_cost_and_usage with `amount` per day for every (team,
+    # service) pair in `groups`, and records each request's TimePeriod
+    def __init__(self, groups, amount: float = 10.0, fail: bool = False, resources=(), resource_amount: float = 0.0):
+        self.groups = list(groups)
+        self.amount = amount
+        self.fail = fail
+        # (resource_id, service) pairs answered by the resource-level call
+        self.resources = list(resources)
+        self.resource_amount = resource_amount
+        self.periods = []
+        self.resource_periods = []
+
+    def get_cost_and_usage(self, **request):
+        self.periods.append((request["TimePeriod"]["Start"], request["TimePeriod"]["End"]))
+        if self.fail:
+            raise RuntimeError("Cost Explorer is unavailable")
+        return self._respond(request)
+
+    def get_cost_and_usage_with_resources(self, **request):
+        self.resource_periods.append((request["TimePeriod"]["Start"], request["TimePeriod"]["End"]))
+        start = date.fromisoformat(request["TimePeriod"]["Start"])
+        if start < date.today() - timedelta(days=aws.RESOURCE_HISTORY_DAYS):
+            raise RuntimeError("Resource-level data is only available for the last 14 days")
+        return self._respond(request, self.resources, self.resource_amount)
+
+    def _respond(self, request, keys=None, amount=None):
+        if keys is None:
+            keys = [(f"{aws.TEAM_TAG_KEY}${team}", service) for team, service in self.groups]
+            amount = self.amount
+        start = date.fromisoformat(request["TimePeriod"]["Start"])
+        end = date.fromisoformat(request["TimePeriod"]["End"])
+        results = []
+        for offset in range((end - start).days):
+            day = (start + timedelta(days=offset)).isoformat()
+            results.append({
+                "TimePeriod": {"Start": day},
+                "Groups": [
+                    {"Keys": list(key), "Metrics": {aws.COST_METRIC: {"Amount": str(amount)}}}
+                    for key in keys
+                ],
+            })
+        return {"ResultsByTime": results}
+
+
+def cost_explorer(name: str, client: FakeCostExplorerClient) -> aws.AWSCostExplorer:
+    return aws.AWSCostExplorer(client=client, account=schemas.AWSAccount(name=name), store=None)
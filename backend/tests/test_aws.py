@@ -0,0 +1,141 @@
+from datetime import date, datetime, timedelta
+import time
+import boto3
+import pytest
+from botocore.stub import Stubber
+from app import attribution, aws, scheduler, schemas
+from app.ce_cache import CacheMiss, ResponseStore
+from conftest import FakeCostExplorerClient, cost_explorer
+
+
+def _at(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def _stubbed(name: str, rate_limiter=None):
+    # A real Cost Explorer client whose responses are queued on its Stubber
+    client = boto3.client(
+        "ce", region_name="us-east-1", config=aws.CE_CLIENT_CONFIG,
+        aws_access_key_id="testing", aws_secret_access_key="testing"
+    )
+    explorer = aws.AWSCostExplorer(
+        client=client, account=schemas.AWSAccount(name=name),
+        rate_limiter=rate_limiter or aws.TokenBucket(0, 1), store=None
+    )
+    return explorer, Stubber(client)
+
+
+def _page(day: date, groups, next_token=None) -> dict:
+    response = {"ResultsByTime": [{
+        "TimePeriod": {"Start": day.isoformat(), "End": (day + timedelta(days=1)).isoformat()},
+        "Groups": [
+            {
+                "Keys": [f"{aws.TEAM_TAG_KEY}${team}", service],
+                "Metrics": {aws.COST_METRIC: {"Amount": str(amount), "Unit": "USD"}},
+            }
+            for team, service, amount in groups
+        ],
+    }]}
+    if next_token:
+        response["NextPageToken"] = next_token
+    return response
+
+
+def test_resource_costs_are_clamped_to_the_resource_history(db):
+    today = date.today()
+    client = FakeCostExplorerClient([("Platform", "Aws-004")])
+    scheduler.fetch_account_costs(
+        cost_explorer("resources", client), _at(today - timedelta(days=60)), _at(today),
+        {"Platform": 1}, attribution.ArnIndex.load(db)
+    )
+    assert client.periods == [((today - timedelta(days=60)).isoformat(), today.isoformat())]
+    earliest = today - timedelta(days=aws.RESOURCE_HISTORY_DAYS)
+    assert client.resource_periods == [(earliest.isoformat(), today.isoformat())]
+
+
+def test_resource_costs_skip_windows_before_the_resource_history():
+    today = date.today()
+    client = FakeCostExplorerClient([])
+    explorer = cost_explorer("resources", client)
+    assert list(explorer.iter_resource_costs(_at(today - timedelta(days=60)), _at(today - timedelta(days=30)))) == []
+    assert client.resource_periods == []
+
+
+def test_only_completed_stored_queries_are_served(tmp_path):
+    store = ResponseStore(str(tmp_path))
+    start, end = date(2026, 1, 1), date(2026, 1, 4)
+    client = FakeCostExplorerClient([("Platform", "Aws-018")], amount=2.0)
+    explorer = aws.AWSCostExplorer(client=client, account=schemas.AWSAccount(name="stored"), store=store)
+    replay = aws.AWSCostExplorer(account=schemas.AWSAccount(name="stored"), store=store, replay=True)
+
+    # A page left behind by an interrupted fetch, without a manifest
+    query = store.query("stored", "get_cost_and_usage", aws.cost_request(_at(start), _at(end), "DAILY"))
+    query.store(0, {"ResultsByTime": [], "NextPageToken": "stale"})
+    with pytest.raises(CacheMiss):
+        list(replay.iter_cost_pages(_at(start), _at(end)))
+
+    pages = list(explorer.iter_cost_pages(_at(start), _at(end)))
+    assert len(client.periods) == 1
+    assert [len(records) for records in pages] == [3]
+    assert query.completed()
+
+    assert list(explorer.iter_cost_pages(_at(start), _at(end))) == pages
+    assert list(replay.iter_cost_pages(_at(start), _at(end))) == pages
+    assert len(client.periods) == 1
+
+
+def test_throttled_request_is_retried_with_backoff(monkeypatch):
+    day = date(2026, 2, 1)
+    delays = []
+    monkeypatch.setattr(aws, "backoff_delay", lambda attempt: delays.append(attempt) or 0.0)
+    explorer, stubber = _stubbed("throttled")
+    stubber.add_client_error("get_cost_and_usage", service_error_code="ThrottlingException", http_status_code=400)
+    stubber.add_response("get_cost_and_usage", _page(day, [("Platform", "Stub-003", 4.0)]))
+    with stubber:
+        costs = explorer.get_daily_costs(_at(day), _at(day + timedelta(days=1)))
+    stubber.assert_no_pending_responses()
+    assert delays == [0]
+    assert [(cost["service"], cost["amount"]) for cost in costs] == [("Stub-003", 4.0)]
+
+
+def test_accounts_are_merged_in_configuration_order(db, monkeypatch):
+    day = date(2026, 2, 2)
+    # The first account is throttled once, so it finishes after the second
+    monkeypatch.setattr(aws, "backoff_delay", lambda attempt: 0.2)
+    payer, payer_stub = _stubbed("payer")
+    member, member_stub = _stubbed("member")
+    payer_stub.add_client_error("get_cost_and_usage", service_error_code="ThrottlingException", http_status_code=400)
+    payer_stub.add_response("get_cost_and_usage", _page(day, [("Platform", "Stub-003a", 1.5)]))
+    member_stub.add_response("get_cost_and_usage", _page(day, [("Platform", "Stub-003b", 2.5), ("Platform", "Stub-003a", 0.5)]))
+
+    merged = []
+    merge = attribution.CostAggregator.merge
+
+    def recording_merge(self, other):
+        merged.append(list(other._cells))
+        merge(self, other)
+
+    monkeypatch.setattr(attribution.CostAggregator, "merge", recording_merge)
+    with payer_stub, member_stub:
+        result = scheduler.ingest_costs(db, [payer, member], _at(day), _at(day + timedelta(days=1)))
+    db.commit()
+    assert [[service for _, _, service in cells] for cells in merged] == [["Stub-003a"], ["Stub-003b", "Stub-003a"]]
+    assert result.failed_accounts == []
+    amounts = {(service, amount) for _, _, service, _, amount in result.changes}
+    assert amounts == {("Stub-003a", 2.0), ("Stub-003b", 2.5)}
+
+
+def test_requests_are_paced_by_the_token_bucket():
+    day = date(2026, 2, 3)
+    # One token up front, then one every 0.1s: four pages take at least 0.3s
+    explorer, stubber = _stubbed("paced", rate_limiter=aws.TokenBucket(10, 1))
+    for page in range(4):
+        next_token = f"page-{page + 1}" if page < 3 else None
+        stubber.add_response("get_cost_and_usage", _page(day, [("Platform", "Stub-003", 1.0)], next_token))
+    started = time.monotonic()
+    with stubber:
+        pages = list(explorer.iter_cost_pages(_at(day), _at(day + timedelta(days=1))))
+    elapsed = time.monotonic() - started
+    stubber.assert_no_pending_responses()
+    assert len(pages) == 4
+    assert 0.3 <= elapsed < 2.0
@@ -0,0 +1,11 @@
+def test_budget_thresholds_are_validated(client, admin_headers):
+    url = "/teams/1/budgets"
+    for thresholds in ([], [0, 50], [-10], ["high"]):
+        response = client.post(url, json={"amount": 100.0, "thresholds": thresholds}, headers=admin_headers)
+        assert response.status_code == 422, thresholds
+
+    response = client.post(url, json={"amount": 100.0, "thresholds": [100, 50, 80, 50]}, headers=admin_headers)
+    assert response.status_code == 200
+    budget = response.json()
+    assert budget["thresholds"] == [50, 80, 100]
+    assert client.delete(f"/budgets/{budget['id']}", headers=admin_headers).status_code == 204
@@ -0,0 +1,20 @@
+from datetime import date, timedelta
+from app import crud, schemas
+from app.cache import data_version
+
+
+def test_created_cost_record_invalidates_cached_responses(client, admin_headers, db):
+    day = date.today() - timedelta(days=2)
+    url = f"/teams/1/costs/summary?start_date={day}&end_date={day}"
+    before = client.get(url, headers=admin_headers)
+    version = crud.get_data_version(db)
+
+    crud.create_cost_record(db, schemas.CostRecordCreate(date=day, team_id=1, service="Manual-010", amount=42.5))
+    assert crud.get_data_version(db) > version
+    data_version.invalidate()
+
+    # The old validator no longer matches and the cached body is rebuilt
+    revalidated = client.get(url, headers={**admin_headers, "If-None-Match": before.headers["etag"]})
+    assert revalidated.status_code == 200
+    assert revalidated.headers["etag"] != before.headers["etag"]
+    assert round(revalidated.json()["total"] - before.json()["total"], 6) == 42.5
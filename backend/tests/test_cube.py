@@ -0,0 +1,21 @@
+from datetime import date, timedelta
+from app import crud, retention, schemas
+from app.cube import CostCube
+
+
+def test_writers_only_refresh_a_loaded_cube(db, monkeypatch):
+    cube = CostCube()
+    monkeypatch.setattr(retention, "cost_cube", cube)
+    monkeypatch.setattr(retention, "COST_CUBE_ENABLED", True)
+    monkeypatch.setattr(retention, "compact_cost_records", lambda db: 1)
+
+    # A worker that never served from the cube does not build one
+    retention.run_retention()
+    assert not cube.warm
+
+    cube.refresh(db)
+    crud.create_cost_record(db, schemas.CostRecordCreate(
+        date=date.today() - timedelta(days=5), team_id=1, service="Cube-009", amount=2.0
+    ))
+    retention.run_retention()
+    assert cube.version == crud.get_data_version(db)
@@ -0,0 +1,33 @@
+import csv
+import io
+from app import models
+from conftest import login
+
+
+def _rows(response):
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+
+def test_admin_exports_every_team(client, admin_headers):
+    response = client.get("/costs/export", headers=admin_headers)
+    assert response.status_code == 200
+    assert len({row["team_id"] for row in _rows(response)}) > 1
+
+
+def test_viewer_exports_only_own_team(client, viewer_headers):
+    me = client.get("/users/me", headers=viewer_headers).json()
+    response = client.get("/costs/export", headers=viewer_headers)
+    assert response.status_code == 200
+    assert {row["team_id"] for row in _rows(response)} == {str(me["team_id"])}
+
+    other = client.get(f"/costs/export?team_id={me['team_id'] + 1}", headers=viewer_headers)
+    assert other.status_code == 403
+
+
+def test_viewer_without_team_cannot_export(client, db):
+    db.add(models.User(email="teamless@example.com", password="teamless123", role="viewer", team_id=None))
+    db.commit()
+    headers = login(client, "teamless@example.com", "teamless123")
+
+    assert client.get("/costs/export", headers=headers).status_code == 403
+    assert client.get("/costs/export?format=ndjson", headers=headers).status_code == 403
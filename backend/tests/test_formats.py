@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+import gzip
+import json
+import pytest
+from fastapi import HTTPException
+from app import compression, formats
+
+ARROW = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+
+def _costs_url() -> str:
+    end = date.today()
+    return f"/teams/1/costs?start_date={end - timedelta(days=29)}&end_date={end}&limit=200"
+
+
+def test_negotiate_prefers_json_for_wildcards():
+    offered = list(formats.COST_PAGE_ENCODERS)
+    assert formats.negotiate(None, offered) == "json"
+    assert formats.negotiate("*/*", offered) == "json"
+    assert formats.negotiate("text/html,application/xhtml+xml,*/*;q=0.8", offered) == "json"
+    assert formats.negotiate("application/json;q=0.5, application/x-msgpack", offered) == "msgpack"
+
+
+def test_negotiate_falls_back_when_a_package_is_missing(monkeypatch):
+    offered = list(formats.COST_PAGE_ENCODERS)
+    monkeypatch.setattr(formats, "pa", None)
+    monkeypatch.setattr(formats, "msgpack", None)
+    assert formats.negotiate(f"{ARROW}, {MSGPACK};q=0.9, */*;q=0.1", offered) == "json"
+    with pytest.raises(HTTPException) as excinfo:
+        formats.negotiate(ARROW, offered)
+    assert excinfo.value.status_code == 406
+    assert ARROW not in excinfo.value.detail
+
+
+def test_binary_formats_round_trip(client, admin_headers):
+    msgpack = pytest.importorskip("msgpack")
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    as_json = client.get(_costs_url(), headers=admin_headers).json()
+    packed = client.get(_costs_url(), headers={**admin_headers, "Accept": MSGPACK})
+    assert packed.headers["content-type"] == MSGPACK
+    assert msgpack.unpackb(packed.content) == as_json
+
+    arrow = client.get(_costs_url(), headers={**admin_headers, "Accept": ARROW})
+    assert arrow.headers["content-type"] == ARROW
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.column("id").to_pylist() == [item["id"] for item in as_json["items"]]
+    assert table.column("amount").to_pylist() == [item["amount"] for item in as_json["items"]]
+
+
+def test_endpoint_without_pyarrow(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(formats, "pa", None)
+    fallback = client.get(_costs_url(), headers={**admin_headers, "Accept": f"{ARROW}, application/json;q=0.5"})
+    assert fallback.status_code == 200
+    assert fallback.headers["content-type"] == "application/json"
+    assert client.get(_costs_url(), headers={**admin_headers, "Accept": ARROW}).status_code == 406
+
+
+def test_gzip_without_brotli(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.choose_encoding("br, gzip;q=0.5") == "gzip"
+    assert compression.choose_encoding("br") is None
+
+    with client.stream("GET", _costs_url(), headers={**admin_headers, "Accept-Encoding": "br, gzip"}) as response:
+        body = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body))["items"]
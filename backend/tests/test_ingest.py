@@ -0,0 +1,147 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from app import attribution, aws, crud, models, scheduler, schemas
+from conftest import FakeCostExplorerClient, cost_explorer
+
+
+def _amounts(db, service: str):
+    cost = models.CostRecord
+    rows = db.execute(
+        select(cost.date, cost.amount_micros)
+        .join(models.Service, models.Service.id == cost.service_id)
+        .where(models.Service.name == service)
+    )
+    return {day: models.from_micros(micros) for day, micros in rows}
+
+
+def _at(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def test_failed_account_does_not_understate_existing_cells(db):
+    service = "Ingest-017"
+    groups = [("Platform", service)]
+    today = date.today()
+    first = [
+        cost_explorer("payer", FakeCostExplorerClient(groups, amount=10.0)),
+        cost_explorer("member", FakeCostExplorerClient(groups, amount=5.0)),
+    ]
+    scheduler.ingest_costs(db, first, _at(today - timedelta(days=3)), _at(today - timedelta(days=1)))
+    db.commit()
+    assert set(_amounts(db, service).values()) == {15.0}
+
+    # The member account fails over a window that also covers a new day
+    second = [
+        cost_explorer("payer", FakeCostExplorerClient(groups, amount=12.0)),
+        cost_explorer("member", FakeCostExplorerClient(groups, fail=True)),
+    ]
+    result = scheduler.ingest_costs(db, second, _at(today - timedelta(days=3)), _at(today))
+    db.commit()
+    assert result.failed_accounts == ["member"]
+    assert result.held == 2
+    assert result.updated == 0
+    assert _amounts(db, service) == {
+        today - timedelta(days=3): 15.0,
+        today - timedelta(days=2): 15.0,
+        today - timedelta(days=1): 12.0,
+    }
+
+    # Once every account answers again the cells are corrected
+    third = [
+        cost_explorer("payer", FakeCostExplorerClient(groups, amount=12.0)),
+        cost_explorer("member", FakeCostExplorerClient(groups, amount=5.0)),
+    ]
+    result = scheduler.ingest_costs(db, third, _at(today - timedelta(days=3)), _at(today))
+    db.commit()
+    assert result.updated == 3
+    assert set(_amounts(db, service).values()) == {17.0}
+
+
+def test_lagging_account_is_caught_up_in_capped_chunks(db):
+    groups = [("Data", "Ingest-019")]
+    today = date.today()
+    lag = scheduler.INGEST_MAX_CATCHUP_DAYS * 2 + 20
+    crud.set_ingest_watermarks(db, ["current"], today - timedelta(days=1))
+    crud.set_ingest_watermarks(db, ["lagging"], today - timedelta(days=lag))
+    db.commit()
+
+    clients = {"current": FakeCostExplorerClient(groups), "lagging": FakeCostExplorerClient(groups)}
+    chunk = timedelta(days=scheduler.INGEST_MAX_CATCHUP_DAYS)
+    start = today - timedelta(days=lag)
+    for _ in range(3):
+        scheduler.update_daily_costs([cost_explorer(name, client) for name, client in clients.items()])
+        end = min(start + chunk, today)
+        assert clients["lagging"].periods[-1] == (start.isoformat(), end.isoformat())
+        watermarks = crud.get_ingest_watermarks(db)
+        assert watermarks["lagging"] == end
+        # The up-to-date account's watermark never moves back
+        assert watermarks["current"] == max(end, today - timedelta(days=1))
+        start = end
+    assert start == today
+
+    # Every lagging day was fetched once, none skipped
+    assert len(_amounts(db, "Ingest-019")) == lag
+
+    # Caught up: back to the restatement window
+    scheduler.update_daily_costs([cost_explorer(name, client) for name, client in clients.items()])
+    restated = today - timedelta(days=scheduler.INGEST_RESTATEMENT_DAYS)
+    assert clients["lagging"].periods[-1] == (restated.isoformat(), today.isoformat())
+
+
+def test_days_before_resource_history_keep_attributed_spend(db, monkeypatch):
+    service = "Ingest-004"
+    today = date.today()
+    platform = crud.get_team_ids_by_name(db)["Platform"]
+    db.add(models.AWSResource(
+        name="ingest-004", arn="arn:aws:ec2:us-west-2:123456789012:instance/i-0ingest004",
+        service=service, team_id=platform
+    ))
+    # Earlier complete runs stored tag + resource spend for the older days
+    crud.upsert_cost_records(db, [
+        schemas.CostRecordCreate(date=today - timedelta(days=offset), team_id=platform, service=service, amount=15.0)
+        for offset in range(20, 31)
+    ])
+    monkeypatch.setattr(attribution, "RESOURCE_ATTRIBUTION_ENABLED", True)
+
+    client = FakeCostExplorerClient(
+        [("Platform", service)], amount=10.0, resources=[("i-0ingest004", service)], resource_amount=6.0
+    )
+    result = scheduler.ingest_costs(db, [cost_explorer("attributed", client)], _at(today - timedelta(days=30)), _at(today))
+    db.commit()
+
+    cutoff = aws.resource_history_start()
+    amounts = _amounts(db, service)
+    assert result.held == 11
+    # Stored older days keep their attributed amounts; missing ones get the
+    # tag-based amount; days Cost Explorer has resource data for are updated
+    for offset in range(1, 31):
+        day = today - timedelta(days=offset)
+        if offset >= 20:
+            assert amounts[day] == 15.0, day
+        elif day < cutoff:
+            assert amounts[day] == 10.0, day
+        else:
+            assert amounts[day] == 16.0, day
+
+
+def test_created_cost_record_replaces_cell_and_respects_archive(db):
+    service = "Manual-002"
+    day = date.today() - timedelta(days=4)
+    crud.create_cost_record(db, schemas.CostRecordCreate(date=day, team_id=1, service=service, amount=3.0))
+    stored = crud.create_cost_record(db, schemas.CostRecordCreate(date=_at(day), team_id=1, service=service, amount=4.5))
+    assert (stored.date, stored.amount) == (day, 4.5)
+    assert _amounts(db, service) == {day: 4.5}
+
+    archived = models.CostRecordArchive(
+        granularity="month", period_start=date(2001, 1, 1), period_end=date(2001, 2, 1),
+        team_id=1, service_id=stored.service_id, amount_micros=0
+    )
+    db.add(archived)
+    db.commit()
+    try:
+        created = crud.create_cost_record(db, schemas.CostRecordCreate(date=date(2001, 1, 15), team_id=1, service=service, amount=1.0))
+        assert created is None
+        assert date(2001, 1, 15) not in _amounts(db, service)
+    finally:
+        db.delete(archived)
+        db.commit()
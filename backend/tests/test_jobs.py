@@ -0,0 +1,12 @@
+from app import jobs, scheduler, schemas
+
+
+def test_ingest_with_failed_accounts_is_recorded_as_partial(client, admin_headers, monkeypatch):
+    result = schemas.IngestResult(inserted=3, updated=1, failed_accounts=["member"])
+    monkeypatch.setattr(scheduler, "update_daily_costs", lambda: result)
+    monkeypatch.setattr(scheduler, "POST_INGEST_JOBS", [])
+
+    assert jobs.run_exclusive("ingest_020", scheduler._ingest_job, 0)
+    runs = client.get("/admin/jobs/runs?job=ingest_020", headers=admin_headers).json()["items"]
+    assert [(run["status"], run["rows"]) for run in runs] == [("partial", 4)]
+    assert "member" in runs[0]["error"]
@@ -0,0 +1,18 @@
+import logging
+from app.logging_config import RateLimitFilter, SamplingFilter, access_logger
+
+
+def _record(name: str, lineno: int = 1) -> logging.LogRecord:
+    return logging.LogRecord(name, logging.INFO, "app/module.py", lineno, "message", None, None)
+
+
+def test_rate_limit_spares_access_log():
+    limit = RateLimitFilter(per_second=0.001, burst=5, exempt=[access_logger.name])
+    assert sum(limit.filter(_record("app.crud")) for _ in range(100)) == 5
+    assert all(limit.filter(_record(access_logger.name)) for _ in range(100))
+
+
+def test_sampling_spares_access_log():
+    sample = SamplingFilter(rate=0.0, exempt=[access_logger.name])
+    assert not any(sample.filter(_record("app.crud")) for _ in range(100))
+    assert all(sample.filter(_record(access_logger.name)) for _ in range(100))
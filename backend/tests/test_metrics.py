@@ -0,0 +1,11 @@
+from app import auth
+
+
+def test_metrics_require_admin_or_scrape_token(client, admin_headers, viewer_headers, monkeypatch):
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers=viewer_headers).status_code == 403
+    assert client.get("/metrics", headers=admin_headers).status_code == 200
+
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code in (401, 403)
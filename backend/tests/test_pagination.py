@@ -0,0 +1,41 @@
+from datetime import date
+from sqlalchemy import select
+from app import crud, models
+
+
+def test_team_cost_pages_span_both_tiers(client, admin_headers, db):
+    services = crud.get_service_ids(db, ["Archive-015a", "Archive-015b"])
+    archived = [
+        models.CostRecordArchive(
+            granularity="month", period_start=date(2001, month, 1), period_end=date(2001, month + 1, 1),
+            team_id=1, service_id=service_id, amount_micros=1000000 * month
+        )
+        for month in (1, 2) for service_id in services.values()
+    ]
+    db.add_all(archived)
+    db.commit()
+    try:
+        tier = crud.CostTier
+        expected = [
+            (row_id, day.isoformat()) for row_id, day in db.execute(
+                select(tier.id, tier.date).where(tier.team_id == 1, tier.date >= date(2000, 12, 1))
+                .order_by(tier.date, tier.service_id)
+            )
+        ]
+        assert sum(row_id < 0 for row_id, _ in expected) == 4
+
+        url = f"/teams/1/costs?start_date=2000-12-01&end_date={date.today()}&limit=3"
+        seen, cursor = [], None
+        while True:
+            page = client.get(url + (f"&cursor={cursor}" if cursor else ""), headers=admin_headers).json()
+            seen += [(item["id"], item["date"][:10]) for item in page["items"]]
+            synced, _ = crud.get_team_costs(db, 1, date(2000, 12, 1), date.today(), limit=3, cursor=cursor)
+            assert [row.id for row in synced] == [item["id"] for item in page["items"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert seen == expected
+    finally:
+        for row in archived:
+            db.delete(row)
+        db.commit()
@@ -1,7 +1,7 @@
 "use client";
 
 import { useAuth } from "@/contexts/AuthContext";
-import axios from "axios";
+import { fetchAllPages } from "@/lib/pagination";
 import {
     CategoryScale,
     Chart as ChartJS,
@@ -85,18 +85,18 @@ export default function DashboardPage() {
       const headers = { Authorization: `Bearer ${user.access_token}` };
 
       // Fetch teams
-      const teamsResponse = await axios.get<Team[]>(
+      const teams = await fetchAllPages<Team>(
         `${process.env.NEXT_PUBLIC_API_URL}/teams`,
         { headers }
       );
-      setTeams(teamsResponse.data);
+      setTeams(teams);
 
       // Only fetch costs if user has a team
       if (user.team_id) {
         const { start, end } = getDateRange(timeRange);
         console.log('Fetching costs with date range:', { start, end });
 
-        const costsResponse = await axios.get<CostRecord[]>(
+        const costs = await fetchAllPages<CostRecord>(
           `${process.env.NEXT_PUBLIC_API_URL}/teams/${user.team_id}/costs`,
           {
             headers,
@@ -106,8 +106,8 @@ export default function DashboardPage() {
             },
           }
         );
-        console.log('Received costs data:', costsResponse.data);
-        setCosts(costsResponse.data);
+        console.log('Received costs data:', costs);
+        setCosts(costs);
       }
       setError(null);
     } catch (error) {
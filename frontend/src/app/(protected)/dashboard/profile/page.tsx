@@ -2,6 +2,7 @@
 
 import { useAuth } from "@/contexts/AuthContext";
 import axios from "axios";
+import { fetchAllPages } from "@/lib/pagination";
 import { useEffect, useState } from "react";
 
 interface User {
@@ -45,11 +46,11 @@ export default function ProfilePage() {
         setUserData(userResponse.data);
 
         // Fetch teams
-        const teamsResponse = await axios.get<Team[]>(
+        const teams = await fetchAllPages<Team>(
           `${process.env.NEXT_PUBLIC_API_URL}/teams`,
           { headers }
         );
-        setTeams(teamsResponse.data);
+        setTeams(teams);
 
         setError(null);
       } catch (error) {
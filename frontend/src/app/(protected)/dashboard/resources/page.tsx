@@ -2,6 +2,7 @@
 
 import { useAuth } from "@/contexts/AuthContext";
 import axios from "axios";
+import { fetchAllPages } from "@/lib/pagination";
 import { useEffect, useState } from "react";
 
 interface AWSResource {
@@ -28,16 +29,16 @@ export default function ResourcesPage() {
     const fetchData = async () => {
       try {
         // Fetch resources
-        const resourcesResponse = await axios.get(
+        const resources = await fetchAllPages<AWSResource>(
           `${process.env.NEXT_PUBLIC_API_URL}/resources`
         );
-        setResources(resourcesResponse.data as AWSResource[]);
+        setResources(resources);
 
         // Fetch teams
-        const teamsResponse = await axios.get(
+        const teams = await fetchAllPages<Team>(
           `${process.env.NEXT_PUBLIC_API_URL}/teams`
         );
-        setTeams(teamsResponse.data as Team[]);
+        setTeams(teams);
       } catch (error) {
         console.error("Error fetching resources data:", error);
       } finally {
@@ -2,6 +2,7 @@
 
 import { useAuth } from "@/contexts/AuthContext";
 import axios from "axios";
+import { fetchAllPages } from "@/lib/pagination";
 import { useEffect, useState } from "react";
 
 interface Team {
@@ -41,19 +42,19 @@ export default function TeamsPage() {
         const headers = { Authorization: `Bearer ${user.access_token}` };
 
         // Fetch teams
-        const teamsResponse = await axios.get<Team[]>(
+        const teams = await fetchAllPages<Team>(
           `${process.env.NEXT_PUBLIC_API_URL}/teams`,
           { headers }
         );
-        setTeams(teamsResponse.data);
+        setTeams(teams);
 
         // Only fetch users if admin
         if (user.role === "admin") {
-          const usersResponse = await axios.get<User[]>(
+          const users = await fetchAllPages<User>(
             `${process.env.NEXT_PUBLIC_API_URL}/users`,
             { headers }
           );
-          setUsers(usersResponse.data);
+          setUsers(users);
         }
         setError(null);
       } catch (error) {
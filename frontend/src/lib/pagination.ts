@@ -0,0 +1,24 @@
+import axios, { AxiosRequestConfig } from "axios";
+
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+// Follows next_cursor until the server reports no further pages.
+export async function fetchAllPages<T>(
+  url: string,
+  config: AxiosRequestConfig = {}
+): Promise<T[]> {
+  const items: T[] = [];
+  let cursor: string | null = null;
+  do {
+    const response: { data: Page<T> } = await axios.get<Page<T>>(url, {
+      ...config,
+      params: { ...config.params, ...(cursor ? { cursor } : {}) },
+    });
+    items.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return items;
+}